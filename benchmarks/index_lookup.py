@@ -0,0 +1,75 @@
+# Rule index lookup cost vs. rule count.
+# Compares RuleIndex.search against unifying the assertion with every rule (the old full scan).
+# Usage: python benchmarks/index_lookup.py [rule counts...]
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+import sys
+from time import perf_counter
+
+from thoughts.index import RuleIndex
+import thoughts.unification
+
+def make_rules(count: int):
+    rules = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0: rules.append({"#when": "what is the status of order " + str(i), "#then": "ok"})
+        elif kind == 1: rules.append({"#when": "remind me about ?event on day" + str(i), "#then": "ok"})
+        elif kind == 2: rules.append({"#when": {"intent": "intent" + str(i), "slot": "?slot"}, "#then": "ok"})
+        else: rules.append({"#when": [{"cat": "cat" + str(i)}, {"cat": "?next"}], "#then": "ok"})
+    return rules
+
+def make_assertions(count: int, num: int = 200):
+    rnd = random.Random(42)
+    assertions = []
+    for _ in range(num):
+        i = rnd.randrange(count)
+        assertions.append({"#assert": "what is the status of order " + str(i - i % 4)})
+        assertions.append({"intent": "intent" + str(i - i % 4 + 2), "slot": "tomorrow"})
+        assertions.append({"cat": "cat" + str(i - i % 4 + 3), "#seq-start": 0, "#seq-end": 1})
+    return assertions
+
+def time_index(index: RuleIndex, assertions: list):
+    candidates = 0
+    start = perf_counter()
+    for assertion in assertions:
+        candidates += len(index.search(assertion))
+    elapsed = perf_counter() - start
+    return elapsed / len(assertions), candidates / len(assertions)
+
+def time_scan(rules: list, assertions: list):
+    start = perf_counter()
+    for assertion in assertions:
+        term = assertion["#assert"] if "#assert" in assertion else assertion
+        for rule in rules:
+            when = rule["#when"]
+            if type(when) is list: when = when[0]
+            thoughts.unification.unify(term, when)
+    elapsed = perf_counter() - start
+    return elapsed / len(assertions)
+
+def main(counts):
+    print("rules".rjust(8), "build (s)".rjust(10), "lookup (us)".rjust(12), "candidates".rjust(11), "full scan (us)".rjust(15))
+    for count in counts:
+        rules = make_rules(count)
+        assertions = make_assertions(count)
+
+        start = perf_counter()
+        index = RuleIndex()
+        index.add_rules(rules, 0)
+        build = perf_counter() - start
+
+        lookup, candidates = time_index(index, assertions)
+
+        # the full scan is linear in the rule count, so sample fewer assertions for it
+        scan = time_scan(rules, assertions[:max(3, 30000 // count * 3)])
+
+        print(str(count).rjust(8), ("%.3f" % build).rjust(10), ("%.1f" % (lookup * 1e6)).rjust(12),
+              ("%.1f" % candidates).rjust(11), ("%.1f" % (scan * 1e6)).rjust(15))
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    main(counts)
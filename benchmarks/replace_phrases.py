@@ -0,0 +1,80 @@
+# #replace cost with a large phrase dictionary.
+# Compares the phrase trie against trying every token span with every key (the old replacement).
+# Usage: python benchmarks/replace_phrases.py [phrase count] [text length in tokens]
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+from time import perf_counter
+
+from thoughts.commands import replace
+
+def make_phrases(count: int, rnd: random.Random):
+    phrases = {}
+    while len(phrases) < count:
+        words = ["w" + str(rnd.randrange(count)) for _ in range(rnd.randrange(1, 5))]
+        phrases[" ".join(words)] = "p" + str(len(phrases))
+    return phrases
+
+def make_texts(phrases: dict, length: int, rnd: random.Random, num: int = 50):
+    keys = list(phrases.keys())
+    texts = []
+    for _ in range(num):
+        tokens = []
+        while len(tokens) < length:
+            if rnd.random() < 0.3: tokens.extend(rnd.choice(keys).split(" "))
+            else: tokens.append("x" + str(rnd.randrange(1000)))
+        texts.append(" ".join(tokens[:length]))
+    return texts
+
+def old_replace(target: str, withset: dict):
+    # the replacement before the phrase trie - every span, longest first, against every key
+    new_text = ""
+    tokens = str.split(target, " ")
+    start_pos, end_pos = 0, len(tokens)
+    while (start_pos < len(tokens)):
+        candidate = " ".join(tokens[start_pos: end_pos]).strip()
+        matched = False
+        for key in withset.keys():
+            if str.strip(key) == candidate:
+                new_text = new_text + " " + str.strip(withset[key])
+                start_pos, end_pos = end_pos, len(tokens)
+                matched = True
+                break
+        if matched == False:
+            end_pos = end_pos - 1
+            if end_pos == start_pos:
+                new_text = new_text + " " + candidate
+                start_pos, end_pos = start_pos + 1, len(tokens)
+    return new_text.strip()
+
+def main(count: int, length: int):
+    rnd = random.Random(42)
+    phrases = make_phrases(count, rnd)
+    texts = make_texts(phrases, length, rnd)
+
+    start = perf_counter()
+    replace.compile_withset(phrases)
+    build = perf_counter() - start
+
+    start = perf_counter()
+    results = [replace.process({"#replace": text, "with": phrases}, None) for text in texts]
+    trie = (perf_counter() - start) / len(texts)
+
+    # the old replacement is quadratic in the text length and linear in the phrase count, so sample fewer texts
+    sample = texts[:3]
+    start = perf_counter()
+    old_results = [old_replace(text, phrases) for text in sample]
+    old = (perf_counter() - start) / len(sample)
+
+    print("phrases:", count, " tokens per text:", length)
+    print("trie build:           {:.1f} ms".format(build * 1000))
+    print("trie replace:         {:.3f} ms per text".format(trie * 1000))
+    print("old replace:          {:.3f} ms per text".format(old * 1000))
+    print("same results:", old_results == results[:len(sample)])
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    main(count, length)
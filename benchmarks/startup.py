@@ -0,0 +1,78 @@
+# Engine startup cost - importing thoughts.rules_engine plus constructing a RulesEngine.
+# Runs a fresh interpreter with -X importtime, prints the slowest imports and fails (exit code 1)
+# if startup is over budget, or if optional dependencies (used only by some commands) were imported.
+# Usage: python benchmarks/startup.py [--budget-ms 300] [--top 15]
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# imported only when a command (or the llm / memory interfaces) that needs them is used
+OPTIONAL_MODULES = ["feedparser", "openai", "chromadb", "nltk"]
+
+CHILD = """
+from time import perf_counter
+started = perf_counter()
+import thoughts.rules_engine
+imported = perf_counter()
+thoughts.rules_engine.RulesEngine()
+constructed = perf_counter()
+print(round((imported - started) * 1e6), round((constructed - imported) * 1e6))
+"""
+
+def parse_importtime(stderr: str):
+    # lines look like "import time:       self [us] |       cumulative | imported package"
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"): continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit(): continue
+        imports.append((int(parts[0]), int(parts[1]), parts[2].rstrip()))
+    return imports
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=300.0)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    child = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD],
+        capture_output=True, text=True, env=env, cwd=ROOT)
+    if child.returncode != 0:
+        print(child.stderr)
+        return 1
+
+    import_us, construct_us = [int(value) for value in child.stdout.split()[-2:]]
+    imports = parse_importtime(child.stderr)
+
+    print("slowest imports (cumulative ms):")
+    for self_us, cumulative_us, name in sorted(imports, key=lambda item: -item[1])[:args.top]:
+        print("  {:>8.1f}  {}".format(cumulative_us / 1000, name))
+
+    total_ms = (import_us + construct_us) / 1000
+    print()
+    print("import thoughts.rules_engine: {:.1f} ms".format(import_us / 1000))
+    print("RulesEngine():                {:.1f} ms".format(construct_us / 1000))
+    print("total:                        {:.1f} ms (budget {:.1f} ms)".format(total_ms, args.budget_ms))
+
+    failed = False
+
+    imported = set(name.strip() for _, _, name in imports)
+    optional = [name for name in OPTIONAL_MODULES if name in imported]
+    if len(optional) > 0:
+        print("FAIL: optional dependencies imported at startup:", ", ".join(optional))
+        failed = True
+
+    if total_ms > args.budget_ms:
+        print("FAIL: startup over budget")
+        failed = True
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
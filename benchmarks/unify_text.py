@@ -0,0 +1,88 @@
+# Unification.unify_text cost with several wildcards in long sentences.
+# Compares the memoized search against the recursive one it replaced (which retried every chunk size).
+# Usage: python benchmarks/unify_text.py [sentence length in words] [wildcard count]
+
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import random
+from time import perf_counter
+
+from thoughts.unifier import Unification
+
+def old_unify_text(sent1, sent2, start_size = 1):
+    # the unification before the memoized search - slices the lists and retries every chunk size
+    def unify_lists(lst1, lst2, assignments):
+        if not lst1 and not lst2: return assignments
+        if not lst1:
+            if not lst2[0].startswith('?'): return None
+            return unify_one(lst2[0], lst2[1:], lst1, assignments, True)
+        if not lst2:
+            if not lst1[0].startswith('?'): return None
+            return unify_one(lst1[0], lst1[1:], lst2, assignments, False)
+        t1, t2 = lst1[0], lst2[0]
+        is_var1, is_var2 = t1.startswith('?'), t2.startswith('?')
+        if not is_var1 and not is_var2:
+            return unify_lists(lst1[1:], lst2[1:], assignments) if t1 == t2 else None
+        if is_var1 and is_var2:
+            a1, a2 = assignments.get(t1), assignments.get(t2)
+            if a1 is not None and a2 is not None:
+                return unify_lists(lst1[1:], lst2[1:], assignments) if a1 == a2 else None
+            if a1 is not None or a2 is not None:
+                var = t2 if a1 is not None else t1
+                assignments[var] = a1 if a1 is not None else a2
+                res = unify_lists(lst1[1:], lst2[1:], assignments)
+                if res is None: del assignments[var]
+                return res
+            assignments[t1], assignments[t2] = t2, t1
+            return unify_lists(lst1[1:], lst2[1:], assignments)
+        if is_var1: return unify_one(t1, lst2, lst1[1:], assignments, True)
+        return unify_one(t2, lst1, lst2[1:], assignments, False)
+
+    def unify_one(var, wildcard_list, other_list, assignments, flipped):
+        already = assignments.get(var)
+        for size in range(start_size, len(wildcard_list) + 1):
+            chunk = wildcard_list[:size]
+            if already is not None and already != chunk: continue
+            if already is None: assignments[var] = chunk
+            if flipped: result = unify_lists(other_list, wildcard_list[size:], assignments)
+            else: result = unify_lists(wildcard_list[size:], other_list, assignments)
+            if result is not None: return result
+            if already is None: del assignments[var]
+        return None
+
+    return unify_lists(sent1.lower().split(), sent2.lower().split(), {})
+
+def make_case(length: int, wildcards: int, rnd: random.Random, matches: bool):
+    # a sentence of common words, and a pattern of wildcards separated by common words
+    # that only unifies with the sentence when it matches its last word
+    words = [rnd.choice(["the", "the", "the", "of"]) for _ in range(length - 1)] + ["end"]
+    pattern = []
+    for _ in range(wildcards): pattern.extend(["?w" + str(len(pattern)), "the"])
+    pattern[-1] = "end" if matches else "stop"
+    return " ".join(words), " ".join(pattern)
+
+def measure(unify, cases):
+    start = perf_counter()
+    results = [unify(sentence, pattern) for sentence, pattern in cases]
+    return (perf_counter() - start) / len(cases), results
+
+def main(length: int, wildcards: int):
+    rnd = random.Random(42)
+    cases = [make_case(length, wildcards, rnd, num % 2 == 0) for num in range(10)]
+    unifier = Unification(max_steps=None)
+
+    new, results = measure(unifier.unify_text, cases)
+    # the old search is exponential in the wildcard count, so sample fewer cases
+    sample = cases[:2]
+    old, old_results = measure(old_unify_text, sample)
+
+    print("words per sentence:", length, " wildcards:", wildcards)
+    print("memoized unify_text:  {:.3f} ms per sentence".format(new * 1000))
+    print("old unify_text:       {:.3f} ms per sentence".format(old * 1000))
+    print("same results:", old_results == results[:len(sample)])
+
+if __name__ == "__main__":
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    wildcards = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    main(length, wildcards)
@@ -25,5 +25,6 @@ setup(
     ],
     packages=find_packages(),
     include_package_data=True,
-    install_requires=["feedparser"]
+    install_requires=["feedparser"],
+    entry_points={"console_scripts": ["compile-rules=thoughts.snapshot:main", "migrate-sessions=thoughts.sessions:main"]}
 )
\ No newline at end of file
@@ -0,0 +1,37 @@
+import pytest
+
+from thoughts.arcs import Arc, ArcStore
+
+RULE = {"#when": ["A", "B", "C"], "#then": "FOUND"}
+
+def at(text, start):
+    return {"#assert": text, "#seq-start": start, "#seq-end": start + 1}
+
+def test_an_arc_reads_like_its_rule_dict():
+    arc = Arc.start(RULE).extend(0, at("A", 0), {"?x": 1})
+    assert arc["#when"] == [at("A", 0), "B", "C"]
+    assert (arc["#seq-idx"], arc["#seq-start"], arc["#seq-end"]) == (1, 0, 1)
+    assert arc["#then"] == "FOUND" and arc["#is-arc"] == True
+    assert "#then" in arc and "#missing" not in arc and arc.get("#missing", 5) == 5
+    with pytest.raises(KeyError): arc["#missing"]
+    assert {key: arc[key] for key in arc.to_dict()} == arc.to_dict()
+
+def test_extending_an_arc_shares_the_rule():
+    arc = Arc.start(RULE)
+    extended = arc.extend(0, at("A", 0), {})
+    assert extended.rule is RULE and arc["#when"] == ["A", "B", "C"]
+
+def test_the_chart_offers_the_arcs_ending_where_an_assertion_starts():
+    store = ArcStore()
+    first = Arc.start(RULE).extend(0, at("A", 0), {})
+    second = first.extend(1, at("B", 1), {})
+    floating = Arc.start({"#when": ["X", "Y"], "#seq-type": "set", "#then": "Z"})
+    for arc in (first, second, floating): store.add(arc)
+
+    assert list(store.candidates(at("B", 1))) == [first, floating]
+    assert list(store.candidates(at("C", 2))) == [second, floating]
+    assert (store[0], store[-1], len(store)) == (first, floating, 3)
+
+    store.remove(first)
+    assert list(store) == [second, floating] and store.to_list() == [second.to_dict(), floating.to_dict()]
+    with pytest.raises(IndexError): store[2]
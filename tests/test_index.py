@@ -0,0 +1,38 @@
+from thoughts.index import RuleIndex
+
+def rule(pattern, then = "x"):
+    return {"#when": pattern, "#then": then}
+
+def test_search_only_returns_rules_the_assertion_could_unify_with():
+    index = RuleIndex()
+    hello, bye, noun, anything = rule("hello ?x"), rule("bye now"), rule({"pos": "noun"}), rule("?x")
+    index.add_rules([hello, bye, noun, anything, {"#item": "not a rule"}], 0)
+
+    assert index.search("hello world") == [hello, anything]
+    assert index.search({"#assert": "bye now"}) == [bye, anything]
+    assert index.search({"pos": "noun", "word": "dog"}) == [noun, anything]
+    assert index.search("?y") == [hello, bye, noun, anything]
+
+def test_replace_rules_reindexes_only_what_changed():
+    index = RuleIndex()
+    kept, dropped = rule("hello ?x"), rule("bye now")
+    index.add_rules([kept, dropped], 0)
+    other = rule("hello there", "other ruleset")
+    index.add_rules([other], 1)
+    kept_id = index.rulesets[0][0]
+
+    added = rule("good day")
+    index.replace_rules([added, rule("hello ?x")], 0)
+
+    assert index.rulesets[0][1] == kept_id and index.order[kept_id] == (0, 1)
+    assert index.search("bye now") == []
+    assert index.search("good day") == [added]
+    assert [found["#then"] for found in index.search("hello there")] == ["x", "other ruleset"]
+
+def test_remove_rules_drops_a_ruleset():
+    index = RuleIndex()
+    index.add_rules([rule("hello ?x")], 0)
+    index.add_rules([rule("hello you", "kept")], 1)
+    index.remove_rules(0)
+    assert index.search("hello you") == [rule("hello you", "kept")]
+    assert index.all_rules() == [rule("hello you", "kept")]
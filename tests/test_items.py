@@ -0,0 +1,36 @@
+from thoughts.items import ItemTable
+from thoughts.rules_engine import RulesEngine
+
+def test_finds_items_by_name_in_ruleset_order():
+    table = ItemTable()
+    first, second, other = {"#item": "dog", "legs": 4}, {"#item": "dog", "says": "woof"}, {"#item": "cat"}
+    table.add_rules([first, other], 0)
+    table.add_rules([second, {"#when": "x", "#then": "y"}], 1)
+
+    assert table.named("dog") == [first, second]
+    assert table.named("$cat") == [other]
+    assert table.all_items() == [first, other, second]
+
+def test_indexed_properties_narrow_down_candidates():
+    table = ItemTable()
+    run_verb, run_noun, open_entry = {"word": "run", "pos": "verb"}, {"word": "run", "pos": "noun"}, {"word": "?w", "pos": "?p"}
+    table.add_rules([{"#index": ["pos"]}, run_verb, run_noun, open_entry], 0)
+
+    assert table.candidates({"word": "run", "pos": "noun"}) == [run_noun, open_entry]
+    assert table.candidates({"word": "run"}) is None  # word isn't indexed
+
+def test_the_version_changes_with_the_entries():
+    table = ItemTable()
+    table.add_rules([{"#item": "dog"}], 0)
+    version = table.version
+    table.replace_rules([{"#item": "cat"}], 0)
+    assert table.version != version
+    assert table.named("dog") == [] and table.named("cat") == [{"#item": "cat"}]
+
+def test_item_references_resolve_through_the_table():
+    engine = RulesEngine()
+    engine.add_rules([{"#item": "pet", "name": "rex"}])
+    assert engine.context.retrieve("$pet.name says hi") == "rex says hi"
+
+    engine.replace_rules([{"#item": "pet", "name": "tom"}], engine.context.rulesets[-1]["name"])
+    assert engine.context.retrieve("$pet.name") == "tom"
@@ -0,0 +1,35 @@
+from thoughts.log import EngineLog, DEBUG, INFO, WARNING
+from thoughts.rules_engine import RulesEngine
+
+def test_keeps_the_last_records_at_its_level():
+    log = EngineLog(capacity=3, level=INFO)
+    log.debug("skipped %s", "x")
+    for num in range(5): log.info("message %s", num)
+    log.warning("warned")
+    assert list(log) == ["message 3", "message 4", "warned"]
+    assert log.tail(1) == ["warned"] and log[0] == "message 3"
+
+def test_only_formats_enabled_messages():
+    class Unprintable:
+        def __str__(self): raise AssertionError("formatted")
+    log = EngineLog(level=INFO)
+    log.debug("value %s", Unprintable())
+    assert len(log) == 0
+
+def test_streams_records_to_a_file(tmp_path):
+    log = EngineLog(level=DEBUG)
+    log.stream_to(str(tmp_path / "engine.log"))
+    log.debug("one")
+    log.close()
+    log.warning("two")
+    assert (tmp_path / "engine.log").read_text().split("\t")[1:] == ["DEBUG", "one\n"]
+
+def test_the_engine_traces_at_debug():
+    engine = RulesEngine()
+    engine.add_rules([{"#when": "hello ?x", "#then": "hi ?x"}])
+    engine.process("hello world")
+    assert not any(text.startswith("ASSERT:") for text in engine.context.log)
+
+    engine.context.log.level = DEBUG
+    engine.process("hello world")
+    assert any(text.startswith("ASSERT:") for text in engine.context.log)
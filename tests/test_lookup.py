@@ -0,0 +1,32 @@
+from thoughts.rules_engine import RulesEngine
+
+def lookup_colors(engine):
+    return engine.process({"#lookup": {"color": "?c"}})
+
+def test_sees_items_written_directly_into_the_context():
+    engine = RulesEngine()
+    assert lookup_colors(engine) == []
+
+    engine.context.items["$ball"] = {"color": "red"}
+    assert [found["item"] for found in lookup_colors(engine)] == ["$ball"]
+
+    engine.context.items = {"$cup": {"color": "blue"}}
+    assert [found["item"] for found in lookup_colors(engine)] == ["$cup"]
+
+def test_ruleset_matches_follow_the_rules():
+    engine = RulesEngine()
+    engine.add_rules([{"#item": "sky", "color": "grey"}], name="colors")
+    assert [found["#item"] for found in lookup_colors(engine)] == ["sky"]
+
+    engine.replace_rules([{"#item": "grass", "color": "green"}], name="colors")
+    assert [found["#item"] for found in lookup_colors(engine)] == ["grass"]
+
+def test_uses_declared_property_indexes():
+    engine = RulesEngine()
+    engine.add_rules([{"#index": ["pos"]},
+                      {"word": "run", "pos": "verb"},
+                      {"word": "run", "pos": "noun"},
+                      {"word": "?w", "pos": "?p"}])
+
+    found = engine.process({"#lookup": {"word": "?w", "pos": "noun"}})
+    assert [(entry["word"], entry["pos"]) for entry in found] == [("run", "noun"), ("?w", "?p")]
@@ -0,0 +1,38 @@
+import pytest
+
+from thoughts.rules_engine import RulesEngine
+
+RULES = [
+    {"#when": "hello ?x", "#then": "greeted ?x"},
+    {"#when": {"pos": "noun", "word": "?w"}, "#then": "noun ?w"},
+    {"#when": ["A", "B", "C"], "#then": "ABC"},
+    {"#when": ["B", "?x"], "#then": {"#assert": "after B ?x"}},
+    {"#when": ["A", "B", "A"], "#then": "SEQ1"},
+    {"#when": ["SEQ1", "SEQ1"], "#then": "FOUND", "#seq-type": "overlap-connected"},
+    {"#when": ["C", "X"], "#seq-type": "set", "#then": "CX set"},
+    {"#when": "ABC", "#then": ["done", {"pos": "noun", "word": "alphabet"}]},
+]
+
+INPUTS = [["A", "B", "C"], "hello world", {"pos": "noun", "word": "dog"}, ["A", "B", "A", "B", "A"], ["X", "y", "C"], "nothing"]
+
+def conclusions(match_mode, **options):
+    engine = RulesEngine(match_mode=match_mode)
+    engine.add_rules(RULES)
+    return [engine.process(assertions, **options) for assertions in INPUTS]
+
+@pytest.mark.parametrize("options", [{}, {"extract_conclusions": False}, {"include_seq": True}])
+def test_network_mode_concludes_what_scan_mode_does(options):
+    assert conclusions("network", **options) == conclusions("scan", **options)
+
+def test_sequences_complete_in_network_mode():
+    found = conclusions("network")
+    assert found[0] == ["done", "noun alphabet", "after B c"]
+    assert "FOUND" in found[3]
+    assert found[4] == ["CX set"]
+
+def test_the_network_follows_replaced_rules():
+    engine = RulesEngine(match_mode="network")
+    engine.add_rules([{"#when": "hello ?x", "#then": "hi ?x"}], name="r")
+    engine.replace_rules([{"#when": "bye ?x", "#then": "ciao ?x"}], name="r")
+    assert engine.process("hello you") == []
+    assert engine.process("bye you") == ["ciao you"]
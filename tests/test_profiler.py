@@ -0,0 +1,27 @@
+from thoughts.rules_engine import RulesEngine
+
+def test_counts_each_rule_tried():
+    engine = RulesEngine()
+    engine.add_rules([{"#when": "hello ?x", "#then": "hi ?x"}, {"#when": ["A", "B"], "#then": "AB"}], name="r")
+    profiler = engine.enable_profiler()
+    engine.process("hello world")
+    engine.process("hello you")
+    engine.process(["A", "B"])
+
+    report = {stats["rule"]: stats for stats in profiler.report()}
+    assert (report[0]["ruleset"], report[0]["label"]) == ("r", '"hello ?x"')
+    assert (report[0]["evaluations"], report[0]["unifications"], report[0]["firings"]) == (2, 2, 2)
+    assert report[1]["arcs"] >= 1 and report[1]["firings"] == 1
+
+def test_folded_output_and_disabling(tmp_path):
+    engine = RulesEngine()
+    engine.add_rules([{"#when": "hello ?x", "#then": "hi ?x"}], name="r")
+    profiler = engine.enable_profiler()
+    engine.process("hello world")
+    profiler.save(str(tmp_path / "rules.folded"), format="folded")
+    line = (tmp_path / "rules.folded").read_text().splitlines()[0]
+    assert line.startswith('thoughts;r;0: "hello ?x" ')
+
+    engine.disable_profiler()
+    engine.process("hello again")
+    assert profiler.report()[0]["evaluations"] == 1
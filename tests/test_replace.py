@@ -0,0 +1,27 @@
+from thoughts.rules_engine import RulesEngine
+from thoughts.commands import replace
+
+def test_replaces_the_longest_phrase_at_each_position():
+    withset = {"big": "large", "big dog": "hound", "cat": "feline"}
+    assert replace.process({"#replace": "the big dog and big cat", "with": withset}, None) == "the hound and large feline"
+
+def test_rebuilds_a_cached_trie_when_the_keys_change():
+    withset = {"hello": "hi"}
+    assert replace.process({"#replace": "hello world", "with": withset}, None) == "hi world"
+    withset["world"] = "earth"
+    assert replace.process({"#replace": "hello world", "with": withset}, None) == "hi earth"
+
+def test_compiles_a_rules_with_set_once(monkeypatch):
+    builds = []
+    build = replace.PhraseTrie.__init__
+    def counting(trie, withset):
+        builds.append(withset)
+        build(trie, withset)
+    monkeypatch.setattr(replace.PhraseTrie, "__init__", counting)
+
+    engine = RulesEngine()
+    withset = {"big dog": "hound"}
+    engine.add_rules([{"#when": "say ?x", "#then": {"#say": {"#replace": "?x", "with": withset}}}])
+    for _ in range(5): engine.process("say the big dog")
+
+    assert len(builds) == 1 and builds[0] is withset
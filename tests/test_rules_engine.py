@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from thoughts.rules_engine import RulesEngine, AgendaDepthError
+from thoughts.watcher import RulesWatcher
+
+def test_iter_process_yields_what_process_returns():
+    engine = RulesEngine()
+    engine.add_rules([{"#when": "a", "#then": ["b", "c"]}, {"#when": "b", "#then": "x"}])
+    assert list(engine.iter_process("a")) == engine.process("a") == ["x", "c"]
+
+def test_rules_can_be_replaced_while_iter_process_is_suspended():
+    engine = RulesEngine()
+    engine.add_rules([{"#when": "a", "#then": ["b", "c"]}, {"#when": "b", "#then": "x"}], name="r")
+    conclusions = engine.iter_process("a")
+    assert next(conclusions) == "x"
+
+    engine.replace_rules([{"#when": "a", "#then": ["b", "c"]}, {"#when": "c", "#then": "y"}], name="r")
+    assert list(conclusions) == ["y"]
+
+def test_a_runaway_rule_chain_stops_at_max_depth():
+    engine = RulesEngine()
+    engine.add_rules([{"#when": "ping", "#then": "ping"}])
+    engine.max_depth = 50
+    with pytest.raises(AgendaDepthError): engine.process("ping")
+
+def test_long_chains_run_without_recursion():
+    engine = RulesEngine()
+    engine.add_rules([{"#when": "n" + str(num), "#then": "n" + str(num + 1)} for num in range(300)])
+    assert engine.process("n0") == ["n300"]
+
+@pytest.mark.parametrize("mode", ["thread", "process"])
+def test_process_many_matches_process(mode):
+    engine = RulesEngine()
+    engine.add_rules([{"#when": "hello ?x", "#then": "hi ?x"}, {"#when": "bye", "#then": "ciao"}])
+    inputs = ["hello a", "bye", "hello b", "nothing"]
+
+    expected = [engine.process(assertions) for assertions in inputs]
+    assert list(engine.process_many(inputs, workers=2, mode=mode)) == expected
+    assert sorted(engine.process_many(inputs, workers=2, mode=mode, ordered=False)) == list(enumerate(expected))
+
+def test_reloads_a_changed_rules_file(tmp_path):
+    rules_file = tmp_path / "rules.json"
+    rules_file.write_text(json.dumps([{"#when": "hello ?x", "#then": "hi ?x"}]))
+    engine = RulesEngine()
+    engine.load_rules_from_file(str(rules_file))
+    watcher = RulesWatcher(engine)
+    assert watcher.check() == []
+
+    rules_file.write_text(json.dumps([{"#when": "hello ?x", "#then": "hey ?x"}, {"#when": "bye", "#then": "ciao"}]))
+    os.utime(rules_file, ns=(0, 10 ** 9))  # (a different mtime, however fast the write)
+    assert watcher.check() == [str(rules_file)]
+    assert engine.process("hello you") == ["hey you"]
+    assert engine.process("bye") == ["ciao"]
+    assert [ruleset.get("path") for ruleset in engine.context.rulesets].count(str(rules_file)) == 1
+
+def test_plugins_are_imported_when_first_used():
+    script = ("import sys\n"
+              "from thoughts.rules_engine import RulesEngine\n"
+              "engine = RulesEngine()\n"
+              "engine.add_rules([{'#when': 'say ?x', '#then': {'#say': {'#replace': '?x', 'with': {'a': 'b'}}}}])\n"
+              "print('thoughts.commands.replace' in sys.modules)\n"
+              "engine.process('say a')\n"
+              "print('thoughts.commands.replace' in sys.modules)\n")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", script], cwd=root, capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["False", "True"]
@@ -0,0 +1,138 @@
+import gc
+import os
+import time
+import weakref
+
+import pytest
+
+from thoughts.sessions import ItemJournal, FileSessionStore, SqliteSessionStore, MemorySessionStore, WriteBehind, copy_session
+
+def make_journal(tmp_path):
+    return ItemJournal(str(tmp_path / "items"))
+
+def test_replays_records_over_the_snapshot(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.compact({"a": 1})
+    journal.record("set", "b", 2)
+    journal.record("append", "a", 3)
+    journal.record("update", "d", {"x": 1})
+
+    assert make_journal(tmp_path).load() == {"a": [1, 3], "b": 2, "d": {"x": 1}}
+
+def test_drops_a_last_record_cut_short(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.record("set", "a", 1)
+    with open(journal.journal_path, "a") as f: f.write('["set","b"')
+
+    reloaded = make_journal(tmp_path)
+    assert reloaded.load() == {"a": 1}
+    assert reloaded.records == 1
+
+    # the next record starts on a line of its own
+    reloaded.record("set", "c", 3)
+    assert make_journal(tmp_path).load() == {"a": 1, "c": 3}
+
+def test_drops_a_last_record_missing_its_newline(tmp_path):
+    # valid JSON without its newline was still cut short - the next record would be written onto its line
+    journal = make_journal(tmp_path)
+    journal.record("set", "a", 1)
+    with open(journal.journal_path, "a") as f: f.write('["set","b",2]')
+
+    reloaded = make_journal(tmp_path)
+    assert reloaded.load() == {"a": 1}
+    reloaded.record("set", "c", 3)
+    assert make_journal(tmp_path).load() == {"a": 1, "c": 3}
+
+def test_a_corrupt_record_before_the_last_raises(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.record("set", "a", 1)
+    with open(journal.journal_path, "a") as f: f.write('["set",\n')
+    journal.record("set", "c", 3)
+
+    with pytest.raises(ValueError, match="line 2"):
+        make_journal(tmp_path).load()
+
+    # nothing was truncated
+    with open(journal.journal_path) as f: assert f.read().count("\n") == 3
+
+def test_compact_replaces_the_journal_and_item_files(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.record("set", "a", 1)
+    with open(os.path.join(journal.directory, "old.json"), "w") as f: f.write('{"old": 5}')
+
+    items = journal.load()
+    assert items == {"a": 1, "old": 5}
+    journal.compact(items)
+
+    assert sorted(os.listdir(journal.directory)) == ["items.json"]
+    assert make_journal(tmp_path).load() == {"a": 1, "old": 5}
+
+def test_copy_session_replaces_the_target_copy(tmp_path):
+    source = FileSessionStore(str(tmp_path / "sessions"))
+    source.write_manifest("s1", {"content-path": None, "persist-session": True})
+    source.item_journal("s1").record("set", "a", 1)
+    log = source.message_log("s1")
+    for num in range(3): log.append({"content": "m" + str(num)})
+
+    target = SqliteSessionStore(str(tmp_path / "sessions.db"))
+    copy_session(source, target, "s1")
+    copy_session(source, target, "s1")
+
+    assert [message["content"] for message in target.message_log("s1").read()] == ["m0", "m1", "m2"]
+    assert target.item_journal("s1").load() == {"a": 1}
+    target.close()
+
+def test_two_logs_write_to_one_sqlite_session(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.db"))
+    a, b = store.message_log("s1"), store.message_log("s1")
+    a.append({"content": "a0"})
+    assert len(b) == 1
+    b.append({"content": "b0"})
+    a.append({"content": "a1"})
+
+    assert [message["content"] for message in store.message_log("s1").read()] == ["a0", "b0", "a1"]
+    assert len(a) == 3 and len(b) == 3
+    store.close()
+
+@pytest.mark.parametrize("make_store", [lambda tmp_path: FileSessionStore(str(tmp_path / "sessions")),
+                                        lambda tmp_path: SqliteSessionStore(str(tmp_path / "sessions.db")),
+                                        lambda tmp_path: MemorySessionStore()])
+def test_writing_a_manifest_again_is_not_a_change(tmp_path, make_store):
+    store = make_store(tmp_path)
+    for session_id in ["old", "new"]:
+        store.write_manifest(session_id, {"content-path": None, "persist-session": True})
+        store.item_journal(session_id).record("set", "a", session_id)
+        time.sleep(0.02)
+    assert store.recent_sessions() == ["new", "old"]
+
+    # (what opening a saved session does)
+    store.write_manifest("old", {"content-path": "other", "persist-session": True})
+    assert store.recent_sessions() == ["new", "old"]
+
+    store.message_log("old").append({"content": "hi"})
+    assert store.recent_sessions() == ["old", "new"]
+
+def test_write_behind_writes_coalesced_changes_on_flush():
+    store = MemorySessionStore()
+    items = {}
+    writer = WriteBehind(store.item_journal("s1"), store.message_log("s1"), lambda: items, flush_interval=60)
+    for value in range(3):
+        items["a"] = value
+        writer.record("set", "a", value)
+    writer.push({"content": "hi"})
+    assert store.item_journal("s1").load() == {}
+
+    writer.flush()
+    assert store.sessions["s1"]["changes"] == ['["set","a",2]\n']
+    assert store.message_log("s1").read() == [{"content": "hi"}]
+    writer.close()
+
+def test_a_dropped_write_behind_is_collected():
+    store = MemorySessionStore()
+    writer = WriteBehind(store.item_journal("s1"), store.message_log("s1"), dict, flush_interval=0.01)
+    thread, dropped = writer._thread, weakref.ref(writer)
+    del writer
+    gc.collect()
+    assert dropped() is None
+    thread.join(1)
+    assert not thread.is_alive()
@@ -0,0 +1,43 @@
+import json
+
+from thoughts.rules_engine import RulesEngine
+from thoughts.snapshot import RulesSnapshot, compile_rules
+
+RULES = [{"#when": "hello ?x", "#then": "hi ?x"}]
+
+def write_rules(tmp_path, rules = RULES):
+    path = tmp_path / "greetings.json"
+    path.write_text(json.dumps(rules))
+    return str(path)
+
+def test_loads_the_compiled_rules(tmp_path):
+    rules_file = write_rules(tmp_path)
+    compile_rules([rules_file], str(tmp_path / "rules.snapshot"))
+
+    engine = RulesEngine()
+    assert engine.load_compiled_rules(str(tmp_path / "rules.snapshot")) == True
+    assert engine.process("hello world") == ["hi world"]
+
+def test_loads_the_rules_files_when_a_file_changed(tmp_path):
+    rules_file = write_rules(tmp_path)
+    compile_rules([rules_file], str(tmp_path / "rules.snapshot"))
+    write_rules(tmp_path, [{"#when": "hello ?x", "#then": "hey there ?x"}])
+
+    engine = RulesEngine()
+    assert engine.load_compiled_rules(str(tmp_path / "rules.snapshot")) == False
+    assert engine.process("hello world") == ["hey there world"]
+
+def test_a_file_that_isnt_a_snapshot_opens_as_none(tmp_path):
+    rules_file = write_rules(tmp_path)
+    snapshot = tmp_path / "rules.snapshot"
+    compile_rules([rules_file], str(snapshot))
+    data = snapshot.read_bytes()
+
+    for broken in [b"", data[:17], data[:40], b"\xff" * 100]:
+        snapshot.write_bytes(broken)
+        assert RulesSnapshot.open(str(snapshot)) is None
+
+    engine = RulesEngine()
+    snapshot.write_bytes(b"")
+    assert engine.load_compiled_rules(str(snapshot), files=[rules_file]) == False
+    assert engine.process("hello world") == ["hi world"]
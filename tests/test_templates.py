@@ -0,0 +1,25 @@
+from thoughts.rules_engine import RulesEngine
+
+def test_conclusions_dont_share_the_rules_structures():
+    engine = RulesEngine()
+    engine.add_rules([{"#when": "hello ?x", "#then": {"#say": {"greeting": ["hi"]}, "to": "?x"}}], name="greet")
+
+    first = engine.process("hello world")
+    first[0]["#say"]["greeting"].append("changed")
+    assert engine.process("hello world") == [{"#say": {"greeting": ["hi"]}, "to": "world"}]
+
+def test_substitutes_whole_variables():
+    engine = RulesEngine()
+    engine.add_rules([{"#when": "swap ?x ?xy", "#then": "?xy then ?x"}])
+    assert engine.process("swap a b") == ["b then a"]
+
+def test_replacing_rules_drops_their_plans():
+    engine = RulesEngine()
+    rules = [{"#when": "hello ?x", "#then": {"to": "?x"}}]
+    engine.add_rules(rules, name="greet")
+    engine.process("hello world")
+    assert id(rules[0]["#then"]) in engine.context._plans
+
+    engine.replace_rules([{"#when": "bye ?x", "#then": {"from": "?x"}}], name="greet")
+    assert id(rules[0]["#then"]) not in engine.context._plans
+    assert engine.process("bye world") == [{"from": "world"}]
@@ -0,0 +1,28 @@
+import json
+
+from thoughts.rules_engine import RulesEngine
+from thoughts.tokens import TokenStream, Vocabulary
+
+def test_a_token_stream_reads_like_its_facts():
+    vocabulary = Vocabulary()
+    stream = TokenStream(vocabulary)
+    for pos, token in enumerate(["the", "dog", "the"]): stream.append(token, pos, pos + 1)
+
+    assert len(vocabulary) == 2
+    assert stream[1] == {"#assert": "dog", "#seq-start": 1, "#seq-end": 2}
+    assert [fact["#assert"] for fact in stream] == ["the", "dog", "the"]
+    assert stream.to_list() == list(stream)
+
+def test_tokenize_conclusions_are_lists():
+    engine = RulesEngine()
+    assert engine.process({"#tokenize": "the big dog"}) == ["the", "big", "dog"]
+
+    tree = engine.process({"#tokenize": "the dog", "assert": {"word": "#"}}, extract_conclusions=False)
+    facts = tree[0]["#conclusions"]
+    assert type(facts) is list and [fact["word"] for fact in facts] == ["the", "dog"]
+    json.dumps(tree)
+
+def test_rules_fire_on_tokens():
+    engine = RulesEngine()
+    engine.add_rules([{"#when": ["big", "dog"], "#then": "found a big dog"}])
+    assert engine.process({"#tokenize": "the big dog"}) == ["the", "big", "found a big dog"]
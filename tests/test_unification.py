@@ -0,0 +1,46 @@
+import pytest
+
+from thoughts import unification
+from thoughts.unification import UnificationCache
+from thoughts.unifier import Unification
+
+@pytest.mark.parametrize("pattern, term", [
+    ("hello ?x", "hello world"),
+    ("hello ?x", "Hello big world"),
+    ("the ?x:noun sat", "the cat sat"),
+    ("* sat", "the cat sat"),
+    ("hello ?x", "goodbye world"),
+    ({"pos": "?p", "word": "run"}, {"word": "run", "pos": "verb"}),
+    ({"pos": "noun"}, {"word": "run", "pos": "verb"}),
+])
+def test_match_agrees_with_unify(pattern, term):
+    assert unification.match(pattern, term) == unification.unify(term, pattern)
+
+def test_substitutes_whole_variables():
+    plan = unification.compile_substitution("?xy and ?x, ?x:noun")
+    assert unification.substitute(plan, {"?x": "a", "?xy": "b"}) == "b and a, a:noun"
+
+def test_cached_results_are_fresh_copies():
+    cache = UnificationCache(size=2)
+    first = cache.match({"word": "?w"}, {"word": ["run"], "#seq-start": 0})
+    first["?w"].append("changed")
+    again = cache.match({"word": "?w"}, {"word": ["run"], "#seq-start": 5})
+    assert again == {"?w": ["run"]}
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+    cache.match("a", "b")
+    cache.match("c", "d")
+    assert cache.stats()["size"] == 2 and cache.stats()["evictions"] == 1
+
+def test_unify_text():
+    unifier = Unification()
+    assert unifier.unify_text("My name is Bob Smith", "my name is ?name") == {"?name": ["bob", "smith"]}
+    assert unifier.unify_text("my name is", "my name is ?name") is None
+
+def test_unify_text_gives_up_after_max_steps():
+    words = " ".join(["a"] * 30)
+    pattern = " ".join("?v" + str(num) + " a" for num in range(8)) + " c"
+    unlimited = Unification(max_steps=None)
+    assert unlimited.unify_text(words, pattern) is not None and unlimited.steps > 10
+
+    assert Unification(max_steps=10).unify_text(words, pattern) is None
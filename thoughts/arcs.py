@@ -0,0 +1,201 @@
+import itertools
+
+class Arc:
+    """
+    An active (partially matched) sequence rule.
+
+    Arcs share structure with the rule they come from - the rule itself is never copied,
+    only the position in the sequence, the variables bound so far and the assertions that
+    matched each constituent are kept. Arcs are immutable; extending one creates a new arc.
+    The dict form of the arc (the rule with the matched constituents in its #when) is only
+    built when asked for, and an arc can be read like that dict.
+    """
+
+    __slots__ = ("rule", "seq_idx", "seq_start", "seq_end", "unification", "matched", "_when")
+
+    def __init__(self, rule: dict, seq_idx, seq_start, seq_end, unification: dict, matched: tuple):
+        self.rule = rule                # the original rule
+        self.seq_idx = seq_idx          # next constituent to match (None for sets)
+        self.seq_start = seq_start      # position span covered so far
+        self.seq_end = seq_end
+        self.unification = unification # variables bound so far
+        self.matched = matched          # assertion matched for each constituent, else None
+        self._when = None
+
+    @classmethod
+    def start(cls, rule: dict):
+        """Returns the state of a rule that has not matched anything yet."""
+        when = rule["#when"]
+        seq_type = rule["#seq-type"] if "#seq-type" in rule else None
+        seq_idx = rule["#seq-idx"] if "#seq-idx" in rule else (None if seq_type == "set" else 0)
+        seq_start = rule["#seq-start"] if "#seq-start" in rule else None
+        seq_end = rule["#seq-end"] if "#seq-end" in rule else None
+        unification = rule["#unification"] if "#unification" in rule else None
+        return cls(rule, seq_idx, seq_start, seq_end, unification, (None,) * len(when))
+
+    def extend(self, con_idx: int, assertion, unification: dict):
+        """Returns a new arc with the assertion matched to the constituent at con_idx."""
+
+        matched = self.matched[:con_idx] + (assertion,) + self.matched[con_idx + 1:]
+
+        seq_idx = self.seq_idx
+        if self.seq_type != "set": seq_idx = con_idx + 1
+
+        seq_start = self.seq_start
+        if seq_start is None: seq_start = assertion["#seq-start"] if "#seq-start" in assertion else None
+        seq_end = assertion["#seq-end"] if "#seq-end" in assertion else None
+
+        if self.unification is not None: unification = {**self.unification, **unification}
+
+        return Arc(self.rule, seq_idx, seq_start, seq_end, unification, matched)
+
+    @property
+    def seq_type(self):
+        return self.rule["#seq-type"] if "#seq-type" in self.rule else None
+
+    @property
+    def when(self):
+        """The #when constituents, with the matched assertions in place of their patterns."""
+        if self._when is None:
+            when = self.rule["#when"]
+            self._when = [when[idx] if matched is None else matched for idx, matched in enumerate(self.matched)]
+        return self._when
+
+    def is_completed(self):
+        if self.seq_type == "set":
+            for constituent in self.when:
+                if "#seq-start" not in constituent: return False
+            return True
+        return self.seq_idx >= len(self.matched)
+
+    def to_dict(self):
+        """Materializes the arc as a cloned rule dict."""
+        result = dict(self.rule)
+        result["#when"] = list(self.when)
+        if self.seq_idx is not None: result["#seq-idx"] = self.seq_idx
+        result["#seq-start"] = self.seq_start
+        result["#seq-end"] = self.seq_end
+        if self.unification is not None: result["#unification"] = self.unification
+        result["#is-arc"] = True
+        return result
+
+    # read-only dict access, as arcs used to be cloned rule dicts
+    # (the arc's own keys are read from its slots, the others from the rule - nothing is copied)
+
+    _MISSING = object()
+
+    def _value(self, key):
+        if key == "#when": return self.when
+        if key == "#seq-start": return self.seq_start
+        if key == "#seq-end": return self.seq_end
+        if key == "#seq-idx": return self.seq_idx if self.seq_idx is not None else Arc._MISSING
+        if key == "#unification": return self.unification if self.unification is not None else Arc._MISSING
+        if key == "#is-arc": return True
+        return self.rule.get(key, Arc._MISSING)
+
+    def __getitem__(self, key):
+        value = self._value(key)
+        if value is Arc._MISSING: raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._value(key) is not Arc._MISSING
+
+    def get(self, key, default=None):
+        value = self._value(key)
+        return default if value is Arc._MISSING else value
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+class ArcStore:
+    """
+    The active arcs (chart), indexed by the position each arc expects its next constituent at.
+
+    Arcs of the default and overlap-connected sequence types are kept under their #seq-type and
+    #seq-end, so a positional assertion only tries the arcs that end where it starts (or one after,
+    when overlapping). Sets, allow-junk arcs and arcs without positions are tried for every assertion.
+    Iterates in the order the arcs were added; removal is O(1).
+    """
+
+    def __init__(self):
+        self._arcs = {}      # serial -> arc, in the order added
+        self._serials = {}   # id(arc) -> serial
+        self._chart = {}     # (seq type, seq end) -> serial -> arc
+        self._floating = {}  # serial -> arc, tried against every assertion
+        self._next = 0
+
+    @staticmethod
+    def chart_key(arc: Arc):
+        seq_type = arc.seq_type
+        if arc.seq_end is None or seq_type == "set" or seq_type == "allow-junk": return None
+        if seq_type != "overlap-connected": seq_type = None
+        return (seq_type, arc.seq_end)
+
+    def add(self, arc: Arc):
+        serial = self._next
+        self._next += 1
+        self._arcs[serial] = arc
+        self._serials[id(arc)] = serial
+        key = self.chart_key(arc)
+        if key is None: self._floating[serial] = arc
+        else: self._chart.setdefault(key, {})[serial] = arc
+
+    def remove(self, arc: Arc):
+        serial = self._serials.pop(id(arc), None)
+        if serial is None: raise ValueError("arc is not active")
+        del self._arcs[serial]
+        key = self.chart_key(arc)
+        if key is None:
+            del self._floating[serial]
+            return
+        edge = self._chart[key]
+        del edge[serial]
+        if len(edge) == 0: del self._chart[key]
+
+    def clear(self):
+        self.__init__()
+
+    def candidates(self, assertion):
+        """
+        Yields the arcs an assertion could extend, in the order they were added.
+        Arcs added while iterating are picked up as well, as they would be when iterating a list.
+        """
+        start = assertion["#seq-start"] if type(assertion) is dict and "#seq-start" in assertion else None
+        watermark = 0
+        while True:
+            if start is None:
+                serials = [serial for serial in self._arcs if serial >= watermark]
+            else:
+                serials = [serial for serial in self._floating if serial >= watermark]
+                for key in ((None, start), ("overlap-connected", start + 1)):
+                    edge = self._chart.get(key)
+                    if edge is not None: serials.extend(serial for serial in edge if serial >= watermark)
+                serials.sort()
+            if len(serials) == 0: return
+            watermark = self._next
+            for serial in serials:
+                arc = self._arcs.get(serial)
+                if arc is not None: yield arc
+
+    def __iter__(self):
+        return iter(list(self._arcs.values()))
+
+    def __len__(self):
+        return len(self._arcs)
+
+    def __getitem__(self, idx):
+        if type(idx) is not int: return list(self._arcs.values())[idx]
+        # (walks to the arc rather than listing them all)
+        arcs = self._arcs.values()
+        if idx < 0: arcs, idx = reversed(arcs), -idx - 1
+        arc = next(itertools.islice(arcs, idx, None), None)
+        if arc is None: raise IndexError("arc index out of range")
+        return arc
+
+    def to_list(self):
+        """The arcs as rule dicts (see Arc.to_dict), in the order they were added - e.g. to pprint them."""
+        return [arc.to_dict() for arc in self._arcs.values()]
+
+    def __repr__(self):
+        return repr(list(self._arcs.values()))
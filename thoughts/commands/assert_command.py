@@ -1,6 +1,7 @@
 # from pickletools import anyobject
 # from typing import Any
 from thoughts import context as ctx
+from thoughts.arcs import Arc
 import thoughts.unification
 import copy
 
@@ -38,10 +39,11 @@ def process(command, context: ctx.RulesContext):
 
 def attempt_arcs(assertion, context: ctx.RulesContext):
    
-    # run the agenda item against all arcs
+    # run the agenda item against the arcs it could extend
+    # (those ending where it starts, or the arcs the match network activates)
     result = []
     extended_arcs = []
-    for idx, arc in enumerate(context.arcs): 
+    for arc in context.search_arcs(assertion): 
         sub_result = attempt_rule(arc, assertion, context)
         result = context.merge_into_list(result, sub_result)
 
@@ -51,7 +53,7 @@ def attempt_arcs(assertion, context: ctx.RulesContext):
             extended_arcs.append(arc)
 
     for arc in extended_arcs:
-        context.arcs.remove(arc)
+        context.remove_arc(arc)
 
     # # remove arcs marked for removal (completed, non-positionally aware)
     # for arc in context.arcs:
@@ -61,22 +63,13 @@ def attempt_arcs(assertion, context: ctx.RulesContext):
     return result
 
 def attempt_rulesets(assertion, context: ctx.RulesContext):
-    # run the agenda item against all rulesets in the context
-    result = []
-
-    candidates = context.search_index(assertion)
-    if candidates is not None:
-        sub_result = attempt_rules(assertion, candidates, context)
-        result = context.merge_into_list(result, sub_result)
-    
+    # run the agenda item against the rules it could match in the context
+    # (from the match network if enabled, else from the rule index)
+    if context.network is not None:
+        candidates = context.network.match_rules(assertion)
     else:
-    #if len(result) == 0:
-        for ruleset in context.rulesets:
-            rules = ruleset["rules"]
-            sub_result = attempt_rules(assertion, rules, context)
-            result = context.merge_into_list(result, sub_result)
-            
-    return result
+        candidates = context.search_index(assertion)
+    return attempt_rules(assertion, candidates, context)
 
 def attempt_rules(assertion, rules:list, context:ctx.RulesContext):
     # run the agenda item against all items in the ruleset
@@ -138,22 +131,32 @@ def attempt_condition(condition:dict, context: ctx.RulesContext):
     return result
 
 def attempt_rule(rule, assertion, context: ctx.RulesContext):
+    # when profiling, the attempt is timed and counted against the rule
+    if context.profiler is not None: return context.profiler.attempt(_attempt_rule, rule, assertion, context)
+    return _attempt_rule(rule, assertion, context)
+
+def _attempt_rule(rule, assertion, context: ctx.RulesContext):
 
-    if "#when" not in rule: return # if the item is not a rule then skip it
+    if type(rule) is Arc: when = rule.when # active arcs are always sequences
+    elif "#when" not in rule: return # if the item is not a rule then skip it
+    else: when = rule["#when"] # get the "when" portion of the rule
     result = [] 
-    when = rule["#when"] # get the "when" portion of the rule
     # self.log_message("EVAL:\t" + str(assertion) + " AGAINST " + str(rule))
 
     # if the "#when" portion is a list (sequence)
     if (type(when) is list):
 
+        # arcs keep the state of a partially matched rule, sharing the rule itself
+        arc = rule if type(rule) is Arc else Arc.start(rule)
+        rule = arc.rule
+        when = arc.when
+
         # gather sequence information
         assertion_start = assertion["#seq-start"] if "#seq-start" in assertion else None       
         assertion_end = assertion["#seq-end"] if "#seq-end" in assertion else None
-        # if ("#seq-start" in rule): rule_start = rule["#seq-start"]   
-        rule_end = rule["#seq-end"] if "#seq-end" in rule else None 
-        seq_idx = rule["#seq-idx"] if "#seq-idx" in rule else 0
-        seq_type = rule["#seq-type"] if "#seq-type" in rule else None
+        rule_end = arc.seq_end
+        seq_idx = arc.seq_idx
+        seq_type = arc.seq_type
 
         # arcs - test if arc position matches assertion's position
         # (ignore if no positional information)
@@ -168,7 +171,7 @@ def attempt_rule(rule, assertion, context: ctx.RulesContext):
                 if assertion_start != rule_end: return
 
         assertion_term = assertion["#assert"] if "#assert" in assertion else assertion
-        # unification = None
+        unification = None
 
         if seq_type == "set":
 
@@ -202,19 +205,12 @@ def attempt_rule(rule, assertion, context: ctx.RulesContext):
                 if exists == True:
                     return
 
-            # for constituent in when:
-            #     con_start = constituent["#seq-start"] if "#seq-start" in constituent else None
-            #     con_end = constituent["#seq-end"] if "#seq-start" in constituent else None
-            #     if con_start == assertion_start and con_end == assertion_end:
-            #         # found in previous
-            #         return
-
             # find the first constituent not already matched that unifies, regardless of order
             for pat_idx, pattern_term in enumerate(when):
                 if "#seq-start" in pattern_term: continue # consituent already matched
-                if "#unification" in rule:
-                    pattern_term = context.apply_values(pattern_term, rule["#unification"])     
-                unification = thoughts.unification.unify(assertion_term, pattern_term)
+                if arc.unification is not None:
+                    pattern_term = context.apply_values(pattern_term, arc.unification, share=True)     
+                unification = context.match(pattern_term, assertion_term)
                 if unification is not None: 
                     seq_idx = pat_idx
                     break
@@ -234,88 +230,55 @@ def attempt_rule(rule, assertion, context: ctx.RulesContext):
 
             # compare the current consituent
             pattern_term = when[seq_idx]
-            if "#unification" in rule:
-                pattern_term = context.apply_values(pattern_term, rule["#unification"])
-            unification = thoughts.unification.unify(assertion_term, pattern_term)
+            if arc.unification is not None:
+                pattern_term = context.apply_values(pattern_term, arc.unification, share=True)
+            unification = context.match(pattern_term, assertion_term)
         
         # next constituent in sequence unified
         if unification is None: return None
-        # self.log_message("MATCHED:\t" + str(assertion) + " AGAINST " + str(rule))
-        unification["?#when"] = copy.deepcopy(assertion)       
-        cloned_rule = copy.deepcopy(rule) # clone the rule
-
-        # replace consituent with the one that matched
-        # cloned_rule["#when"][seq_idx] = assertion_term
-        cloned_rule["#when"][seq_idx] = assertion
-
-        if seq_type != "set":  
-            # move to the next constituent in the arc
-            seq_idx += 1
-            cloned_rule["#seq-idx"] = seq_idx
-
-        # update the position information for the arc
-        rule_start = cloned_rule["#seq-start"] if "#seq-start" in cloned_rule else None
-        if rule_start is None: 
-            cloned_rule["#seq-start"] = assertion_start
-        else:
-            cloned_rule["#seq-start"] = rule_start
-        cloned_rule["#seq-end"] = assertion_end
+        if context.profiler is not None: context.profiler.count(rule, context.profiler.UNIFICATIONS)
 
-        # merge unifications (variables found)
-        if ("#unification" not in cloned_rule): 
-            cloned_rule["#unification"] = unification
-        else:
-            current_unification = cloned_rule["#unification"]
-            cloned_rule["#unification"] = {**current_unification, **unification}
-
-        # check if arc completed
-        # improve - could probably just keep the first check, they do the same thing
-        arc_completed = True
-        if seq_type == "set": # check if all constituents have been found
-            for constituent in cloned_rule["#when"]:
-                if "#seq-start" not in constituent:
-                    arc_completed = False
-                    break
-        elif seq_idx < len(when): # check if at the end of the sequence
-            arc_completed = False
+        # the assertion is shared, not copied - it is only copied into conclusions
+        unification["?#when"] = assertion
+
+        # extend the arc with the constituent that matched
+        # (moves to the next constituent, updates the position and merges the variables found)
+        extended = arc.extend(seq_idx, assertion, unification)
 
-        if arc_completed: # arc completed           
-            unification = cloned_rule["#unification"]
-            context.log_message("ARC-COMPLETE:\t" + str(cloned_rule))
-            sub_results = process_then(cloned_rule, unification, context)
+        if extended.is_completed(): # arc completed           
+            unification = extended.unification
+            context.log_message("ARC-COMPLETE:\t%s", extended)
+            if context.profiler is not None: context.profiler.count(rule, context.profiler.FIRINGS)
+            sub_results = process_then(rule, unification, context, extended.seq_start, extended.seq_end)
 
             # add structure information into sub_result
             for sub_result in sub_results:
-                sub_result["#seq"] = cloned_rule["#when"]
+                sub_result["#seq"] = extended.when
 
             context.merge_into_list(result, sub_results)
 
         else: # arc did not complete - add to active arcs          
-            context.log_message("ARC-EXTEND:\t" + str(cloned_rule))
-            cloned_rule["#is-arc"] = True
-            context.arcs.append(cloned_rule)
-
-        # # if this is a non-positionally aware assertion
-        # # then signal to remove the arc - a new arc will take its place
-        # if "#seq-start" not in assertion and "#is-arc" in rule:
-        #     rule["#remove-me"] = True
+            context.log_message("ARC-EXTEND:\t%s", extended)
+            if context.profiler is not None: context.profiler.count(rule, context.profiler.ARCS)
+            context.add_arc(extended)
 
     # else "when" part is not a non-sequential structure
     else:
 
-        pattern_term = context.apply_values(when, context)
+        pattern_term = context.apply_values(when, context, share=True)
         assertion_term = assertion["#assert"] if "#assert" in assertion else assertion
 
-        unification = thoughts.unification.unify(assertion_term, pattern_term)
+        unification = context.match(pattern_term, assertion_term)
         if unification is None: return None
+        if context.profiler is not None: context.profiler.count(rule, context.profiler.UNIFICATIONS)
 
         truth = attempt_if(rule, assertion_term, context)
 
         if truth == True:
-            unification["?#when"] = copy.deepcopy(assertion_term)
-            cloned_rule = copy.deepcopy(rule)
-            context.log_message("MATCHED:\t" + str(cloned_rule))
-            sub_results = process_then(cloned_rule, unification, context)
+            unification["?#when"] = assertion_term
+            context.log_message("MATCHED:\t%s", rule)
+            if context.profiler is not None: context.profiler.count(rule, context.profiler.FIRINGS)
+            sub_results = process_then(rule, unification, context)
 
             # add structure information into sub_result
             # for sub_result in sub_results:
@@ -326,22 +289,24 @@ def attempt_rule(rule, assertion, context: ctx.RulesContext):
     return result
 
    # process the 'then' portion of the rule
-def process_then(rule, unification, context: ctx.RulesContext):
+def process_then(rule, unification, context: ctx.RulesContext, seq_start = None, seq_end = None):
     
     result = []
     then = rule["#then"] # get the "then" portion (consequent) for the rule
 
-    # grab the rule's sequence positional information
+    # grab the rule's (or arc's) sequence positional information
     # will apply this to each item in the "then" portion to pass forward
-    seq_start = None 
-    seq_end = None 
-    if ("#seq-start" in rule): seq_start = rule["#seq-start"]
-    if ("#seq-end" in rule): seq_end = rule["#seq-end"]
+    if (seq_start is None and "#seq-start" in rule): seq_start = rule["#seq-start"]
+    if (seq_end is None and "#seq-end" in rule): seq_end = rule["#seq-end"]
+
+    # the conclusions are built fresh from the rule, only bound structures
+    # (dicts or lists from the assertion) need to be copied out of it
+    copy_items = binds_structures(then, unification)
 
     # apply unification variables 
     # (substitute variables from the "when" portion of the rule)
     # then = thoughts.unification.apply_unification(then, unification)
-    then = context.apply_values(then, unification)
+    then = context.apply_values(then, unification, share=True, copy_static=True)
     # then = self.context.apply(then, unification)
 
     # add each item in the "then" portion to the agenda
@@ -356,7 +321,8 @@ def process_then(rule, unification, context: ctx.RulesContext):
         # revise - item = self._resolve_items(item)
         # item = self._resolve_items(item)
         
-        new_item = copy.deepcopy(item)
+        # the parts of the rule were copied out of it (copy_static), bound structures still need copying
+        new_item = copy.deepcopy(item) if copy_items else item
 
         if type(new_item) is not dict and type(new_item) is not list:
             new_item = {"#assert": new_item}
@@ -367,9 +333,23 @@ def process_then(rule, unification, context: ctx.RulesContext):
         if (seq_end is not None) and (type(new_item) is dict): 
             new_item["#seq-end"] = seq_end
 
-        context.log_message("ADD:\t\t" + str(new_item) + " to the agenda")
+        context.log_message("ADD:\t\t%s to the agenda", new_item)
         # self._agenda.insert(i, item)
         # i = i + 1
         result.append(new_item)
     
-    return result
\ No newline at end of file
+    return result
+
+def binds_structures(term, unification: dict):
+    # True if applying the unification to the term puts a bound dict or list into the result
+    if type(term) is str:
+        if term not in unification: return False
+        value = unification[term]
+        return type(value) is dict or type(value) is list
+    if type(term) is dict:
+        for value in term.values():
+            if binds_structures(value, unification): return True
+    elif type(term) is list:
+        for value in term:
+            if binds_structures(value, unification): return True
+    return False
@@ -8,5 +8,5 @@ def process(command, context):
 
     with open(file) as f:
         data = json.load(f)
-        context.items[into] = data
+        context.set_item(into, data)
 
@@ -1,5 +1,4 @@
 from thoughts import context as ctx
-import thoughts.unification
 import copy
 
 def process(command, context: ctx.RulesContext ):
@@ -8,53 +7,24 @@ def process(command, context: ctx.RulesContext ):
 
     target = command["#lookup"]
 
-    # first try the context items
-    for key in context.items.keys():
-        
-        item = context.items[key]
-        unification = thoughts.unification.unify(item, target)
-
-         # if the item matches
-        if (unification is not None):
-
-            # new_item = key
-            # result.append(new_item)
+    # first try the context items, then the entries in the rulesets
+    # (the context indexes and caches the matches)
+    for key, item in context.lookup(target):
 
+        if key is not None:
             new_item = copy.deepcopy(item)
             new_item["item"] = key
+        else:
+            # ruleset entries are not changed, only the copy's own properties need to be new
+            new_item = dict(item) if type(item) is dict else copy.deepcopy(item)
 
-            # add position information (inherited from lookup command)    
-            if (type(new_item) is dict): 
-                if ("#seq-start" in command): new_item["#seq-start"] = command["#seq-start"]
-                if ("#seq-end" in command): new_item["#seq-end"] = command["#seq-end"]
-
-            # add found item to results
-            result.append(new_item)
-
-    if (len(result) == 0):
-
-        # search through all items in the context
-        for ruleset in context.rulesets:
-            
-            rules = ruleset["rules"]
-
-            for item in rules:
-
-                # test if this item matches
-                unification = thoughts.unification.unify(item, target)
-                
-                # if the item matches
-                if (unification is not None):
-
-                    new_item = copy.deepcopy(item)
-
-                    # add position information (inherited from lookup command)    
-                    if (type(new_item) is dict): 
-                        if ("#seq-start" in command): new_item["#seq-start"] = command["#seq-start"]
-                        if ("#seq-end" in command): new_item["#seq-end"] = command["#seq-end"]
+        # add position information (inherited from lookup command)    
+        if (type(new_item) is dict): 
+            if ("#seq-start" in command): new_item["#seq-start"] = command["#seq-start"]
+            if ("#seq-end" in command): new_item["#seq-end"] = command["#seq-end"]
 
-                    # add found item to results
-                    result.append(new_item)
+        # add found item to results
+        result.append(new_item)
 
     # if no result, then echo back the value as-is
     # dec-28 2021 - removing this for now
@@ -6,4 +6,4 @@ def process(command, context):
 
     if "into" in command:
         into = command["into"]
-        context.items[into] = inp
\ No newline at end of file
+        context.set_item(into, inp)
\ No newline at end of file
@@ -8,7 +8,7 @@ def process(command, context: thoughts.context.RulesContext):
 
     if "into" in command:
         into = command["into"]
-        context.items[into] = items.entries
+        context.set_item(into, items.entries)
     else:
         for item in items.entries:
             print("* ", item.title)
\ No newline at end of file
@@ -1,6 +1,73 @@
 from thoughts import context as ctx
 import time
 
+class PhraseTrie:
+    """
+    The keys of a #replace "with" set, compiled into a trie of their (space separated) tokens.
+    Replacing walks the trie once from each position for the longest phrase starting there,
+    so the cost grows with the number of tokens rather than tokens squared times keys.
+    """
+
+    END = None # trie key holding the (first) key that ends at a node
+
+    def __init__(self, withset: dict):
+        self.root = {}
+        for key in withset.keys():
+            match_key = str.strip(key)
+            node = self.root
+            if len(match_key) > 0:
+                for token in match_key.split(" "): node = node.setdefault(token, {})
+            node.setdefault(PhraseTrie.END, key)
+
+    def longest(self, tokens: list, start_pos: int):
+        """Returns the (end position, key) of the longest phrase at start_pos, or None."""
+
+        # phrases are compared stripped, so surrounding empty (or whitespace) tokens are skipped
+        pos = start_pos
+        while pos < len(tokens) and str.strip(tokens[pos]) == "": pos = pos + 1
+        first_pos = pos
+
+        found = None
+        if pos > start_pos and PhraseTrie.END in self.root: found = (pos, self.root[PhraseTrie.END])
+
+        node = self.root
+        while pos < len(tokens):
+            token = str.lstrip(tokens[pos]) if pos == first_pos else tokens[pos]
+            stripped = str.rstrip(token)
+            if stripped != token:
+                # the phrase could end with this token, without its trailing whitespace
+                last = node.get(stripped)
+                if last is not None and PhraseTrie.END in last: found = (pos + 1, last[PhraseTrie.END])
+            node = node.get(token)
+            if node is None: break
+            pos = pos + 1
+            if PhraseTrie.END in node: found = (pos, node[PhraseTrie.END])
+
+        if found is None: return None
+        end_pos, key = found
+        while end_pos < len(tokens) and str.strip(tokens[end_pos]) == "": end_pos = end_pos + 1
+        return end_pos, key
+
+_tries = {}
+_MAX_TRIES = 64
+
+def compile_withset(withset: dict, context: ctx.RulesContext = None):
+    """
+    Returns the trie for a "with" set. A set written in a rule is compiled once, with the rule's plan.
+    Others are cached by their identity (e.g. when it is a stored item) and rebuilt when their keys change.
+    """
+    plan = context.shared_plan(withset) if context is not None else None
+    if plan is not None:
+        if plan.compiled is None: plan.compiled = PhraseTrie(withset)
+        return plan.compiled
+
+    cached = _tries.get(id(withset))
+    if cached is not None and cached[0] is withset and withset.keys() == cached[1]: return cached[2]
+    if len(_tries) >= _MAX_TRIES: _tries.clear()
+    trie = PhraseTrie(withset)
+    _tries[id(withset)] = (withset, frozenset(withset), trie)
+    return trie
+
 def process(command, context: ctx.RulesContext):
     
     target = command["#replace"]
@@ -11,39 +78,26 @@ def process(command, context: ctx.RulesContext):
 
         if type(withset) is not dict: return target
 
-        new_text = ""
+        trie = compile_withset(withset, context)
+
+        # replace the longest phrase at each position, left to right
+        new_text = []
         tokens = str.split(target, " ")
-        start_pos, end_pos = 0, len(tokens)
+        start_pos = 0
 
         while (start_pos < len(tokens)):
 
-            candidate = ""
-            token_range = tokens[start_pos: end_pos]
-            for token in token_range: candidate = candidate + " " + token
-            candidate = candidate.strip()
-            # print("trying", candidate)
-
-            matched = False
-            for key in withset.keys():
-                match_key = str.strip(key)
-                if match_key == candidate:
-                    # print("...matched on", key)
-                    new_val = withset[key]
-                    new_val = str.strip(new_val)
-                    new_text = new_text + " " + new_val
-                    start_pos = end_pos
-                    end_pos = len(tokens)
-                    matched = True
-                    break
-
-            if matched == False:
-                end_pos = end_pos - 1
-                if end_pos == start_pos:
-                    new_text = new_text + " " + candidate
-                    start_pos = start_pos + 1
-                    end_pos = len(tokens)
+            found = trie.longest(tokens, start_pos)
+
+            if found is None:
+                new_text.append(str.strip(tokens[start_pos]))
+                start_pos = start_pos + 1
+            else:
+                end_pos, key = found
+                new_text.append(str.strip(withset[key]))
+                start_pos = end_pos
                     
-        return new_text.strip() 
+        return " ".join(new_text).strip() 
 
 def process2(command, context):
     
@@ -1,5 +1,5 @@
 from thoughts import context as ctx
-import thoughts.unification
+from thoughts.tokens import TokenStream
 
 def process(command, context: ctx.RulesContext):
 
@@ -12,6 +12,13 @@ def process(command, context: ctx.RulesContext):
     elif type(text) is list:
         tokens = text
 
+    # string tokens are kept in a compact token stream, their facts are built as the agenda reaches them
+    if all(type(token) is str for token in tokens):
+        if len(tokens) == 0: return None
+        stream = TokenStream(context.vocabulary, command["assert"] if "assert" in command else None, context.apply_values)
+        for pos, token in enumerate(tokens): stream.append(token, pos, pos + 1)
+        return stream
+
     # for positional information
     pos = 0
 
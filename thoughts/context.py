@@ -1,14 +1,29 @@
 import thoughts.unification as unification
 import uuid
+import copy
+import threading
+import contextlib
 from time import time
 
 import json
 import os
 
-from thoughts import unification, util
-from thoughts.interfaces.llm import LLM
-from thoughts.interfaces.memory import Memory, MemoryModule
-from thoughts.interfaces.messaging import AIMessage, HumanMessage, PromptMessage
+from thoughts import unification, util, templates
+from thoughts.index import RuleIndex, rule_key
+from thoughts.network import MatchNetwork
+from thoughts.arcs import ArcStore
+from thoughts.items import ItemTable
+from thoughts.tokens import Vocabulary, TokenStream
+from thoughts.log import EngineLog, DEBUG
+from thoughts.sessions import SessionStore, FileSessionStore, PagedMessages, WriteBehind, apply_change
+from typing import TYPE_CHECKING
+
+# the llm / memory interfaces pull in openai, chromadb and nltk - they are only
+# imported when a Context needs them, so the rules engine can start without them
+if TYPE_CHECKING:
+    from thoughts.interfaces.llm import LLM
+    from thoughts.interfaces.memory import Memory
+    from thoughts.interfaces.messaging import PromptMessage
 
 class CustomEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -18,10 +33,16 @@ class CustomEncoder(json.JSONEncoder):
 
 class Context:
 
-    def __init__(self, llm: LLM = None, memory: Memory = None, 
-                 content_path: str = None, session_id: str = None, persist_session: bool = True, debug: bool = False):
-        
+    def __init__(self, llm: "LLM" = None, memory: "Memory" = None, 
+                 content_path: str = None, session_id: str = None, persist_session: bool = True, debug: bool = False,
+                 lazy: bool = False, store: SessionStore = None):
+        '''
+        With lazy, a saved session's items are read when first used, and its messages a page at a time.
+        Sessions are saved to the store - by default, as directories under memory/sessions.
+        '''
         self.items = {}
+        from thoughts.interfaces.llm import LLM
+        from thoughts.interfaces.memory import Memory, MemoryModule
         self.llm = llm if llm is not None else LLM()
         self.memory = memory if memory is not None else Memory()
         self.messages = []
@@ -29,14 +50,21 @@ class Context:
         self.memory_module = MemoryModule()
         self.logs = []
         self.debug = debug
+        self.lazy = lazy
 
                 # Get the directory of the current script
         script_dir = os.path.dirname(os.path.abspath(__file__))
         # Construct the path to the root of the project
         self.project_root = os.path.abspath(os.path.join(script_dir, ".."))
 
-        session_path = self.project_root + "/memory/sessions/" + self.session_id
-        if os.path.exists(session_path):
+        self.store = store if store is not None else FileSessionStore(self.project_root + "/memory/sessions")
+        self.journal = self.store.item_journal(self.session_id, CustomEncoder, self._object_hook)
+        self.message_log = self.store.message_log(self.session_id, CustomEncoder, self._object_hook)
+        self._unrecorded = set()  # keys changed without persisting - recorded in full when next persisted
+        self.items_lock = threading.RLock()
+        self.writer = None  # a WriteBehind, when enabled
+        loaded = self.store.exists(self.session_id)
+        if loaded:
             self._load()
 
         # run these after the load to override with the values passed in
@@ -44,10 +72,22 @@ class Context:
         self.persist_session = persist_session
 
         if self.persist_session:
-            self.persist()
+            # (a session just loaded has nothing new to save but its manifest - opening it isn't a change)
+            if loaded: self._write_manifest()
+            else: self.persist()
     
+    @property
+    def items(self):
+        if self._items is None: self._read_items()  # lazy
+        return self._items
+
+    @items.setter
+    def items(self, items):
+        self._items = items
+
     def _object_hook(self, data):
         if '__class__' in data:
+            from thoughts.interfaces.messaging import AIMessage, HumanMessage
             class_name = data.pop('__class__')
             if class_name == 'AIMessage':
                 return AIMessage.from_dict(data)
@@ -56,83 +96,102 @@ class Context:
         return data
 
     def persist(self, persist_changes: bool = True, key: str = ""):
+        '''
+        Saves the session - the manifest and a snapshot of the items, or (with a key) journals the item's value.
+        '''
         if self.persist_session == False or persist_changes == False:
             return
-        
+        if key != "":
+            with self.items_lock: self._record_change("set", key, self.items[key])
+            return
+
+        self._write_manifest()
+
+        # (a lazy session whose items were never read has nothing new to snapshot)
+        # (the writer takes the lock itself - it must not wait on the disk while holding it)
+        if self.writer is not None: self.writer.flush(compact=self._items is not None)
+        else:
+            with self.items_lock:
+                if self._items is not None: self.journal.compact(self._items)
+        self._unrecorded.clear()
+
+    def _write_manifest(self):
         # save the manifest to the root
         # manifest = {"prompt-path": self.content_path, "persist-session": self.persist_session}
         manifest = {"content-path": self.content_path, "persist-session": self.persist_session}
+        self.store.write_manifest(self.session_id, manifest)
+
+    def _record_change(self, op: str, key, value):
+        # a key changed without persisting is recorded with its whole value, not just the change
+        if key in self._unrecorded:
+            op, value = "set", self.items[key]
+            self._unrecorded.discard(key)
+        if self.writer is not None:
+            self.writer.record(op, key, value)
+            return
+        self.journal.record(op, key, value)
+        if self.journal.needs_compaction():
+            self.journal.compact(self.items)
+            self._unrecorded.clear()
+
+    def _change_item(self, op: str, key, value, persist_changes: bool):
+        with self.items_lock:
+            apply_change(self.items, op, key, value)
+            if self.persist_session == False: return
+            if persist_changes == False: self._unrecorded.add(key)
+            else: self._record_change(op, key, value)
+
+    def enable_write_behind(self, flush_interval: float = 1.0, batch_size: int = 100):
+        '''
+        Writes the session's changes from a background thread (see WriteBehind) - call flush to
+        write them now, and close when done with the context.
+        '''
+        if self.writer is not None: return
+        self.writer = WriteBehind(self.journal, self.message_log, lambda: self.items, self.items_lock,
+                                  flush_interval, batch_size)
 
-        directory_path = self.project_root + "/memory/sessions/" + self.session_id
-        os.makedirs(directory_path, exist_ok=True)
-        with open(os.path.join(directory_path, "manifest.json"), "w") as f:
-            json.dump(manifest, f, indent=4)
-
-        # save the items as individual files
-        directory_path = self.project_root + "/memory/sessions/" + self.session_id + "/items"
-        os.makedirs(directory_path, exist_ok=True)
-        if key == "":
-            with open(os.path.join(directory_path, "items.json"), "w") as f:
-                json.dump(self.items, f, indent=4, cls=CustomEncoder)
-        else:
-            with open(os.path.join(directory_path, key + ".json"), "w") as f:
-                item = {key: self.items[key]}
-                json.dump(item, f, indent=4, cls=CustomEncoder)
+    def flush(self):
+        if self.writer is not None: self.writer.flush()
+
+    def close(self):
+        '''
+        Writes the changes still waiting and stops the background writer.
+        '''
+        if self.writer is None: return
+        writer, self.writer = self.writer, None
+        writer.close()
         
     def _read_manifest(self):
-        directory_path = self.project_root + "/memory/sessions/" + self.session_id
-        with open(os.path.join(directory_path, "manifest.json"), "r") as f:
-            manifest = json.load(f)
+        manifest = self.store.read_manifest(self.session_id)
         self.content_path = manifest["content-path"]
         self.persist_session = manifest["persist-session"]
 
     def _load(self):
         self._read_manifest()
-        self._read_items()
+        if self.lazy: self.items = None  # read on first use
+        else: self._read_items()
         self._read_messages()
 
     def _read_items(self):
-        directory_path = self.project_root + "/memory/sessions/" + self.session_id + "/items"
-        if not os.path.exists(directory_path):
-            print(f"No such directory: {directory_path}")
+        self.items = {}
+        if not self.journal.exists():
+            print(f"No saved items for session: {self.session_id}")
             return
-        
-        # Load the combined items.json file if it exists
-        items_file_path = os.path.join(directory_path, "items.json")
-        if os.path.exists(items_file_path):
-            with open(items_file_path, "r") as f:
-                self.items = json.load(f, object_hook=self._object_hook)
-
-        # Load individual key-value pair files
-        for filename in os.listdir(directory_path):
-            if filename.endswith(".json") and filename != "items.json":
-                key = filename[:-5]  # remove the .json extension
-                file_path = os.path.join(directory_path, filename)
-                with open(file_path, "r") as f:
-                    item = json.load(f, object_hook=self._object_hook)
-                    self.items[key] = item[key]
+
+        # the snapshot (items.json), then the changes journaled since
+        self.items = self.journal.load()
 
     def get_item(self, key, default=None):
         return self.items.get(key, default)
 
     def set_item(self, key, value, persist_changes: bool = True):
-        self.items[key] = value
-        self.persist(persist_changes, key)
+        self._change_item("set", key, value, persist_changes)
 
     def append_item(self, key, value, persist_changes: bool = True):
-        if key not in self.items:
-            self.items[key] = []
-        if type(self.items[key]) is not list:
-            self.items[key] = [self.items[key]] # listify it
-        self.items[key].append(value)
-        self.persist(persist_changes, key)
+        self._change_item("append", key, value, persist_changes)
 
     def update_item(self, key, value, persist_changes: bool = True):
-        if key in self.items and isinstance(self.items[key], dict) and isinstance(value, dict):
-            self.items[key].update(value)
-        else:
-            self.items[key] = value
-        self.persist(persist_changes, key)
+        self._change_item("update", key, value, persist_changes)
 
     def clear_messages(self):
         self.messages = []
@@ -154,35 +213,23 @@ class Context:
             return []
         return self.messages[-num:] if num <= len(self.messages) else self.messages
     
-    def get_last_message(self) -> PromptMessage:
+    def get_last_message(self) -> "PromptMessage":
         return self.messages[-1] if self.messages else None
 
-    def log_message(self, message: PromptMessage):
+    def log_message(self, message: "PromptMessage"):
         if self.persist_session == False:
             return
-        directory = self.project_root + "/memory/sessions/" + self.session_id + "/messages"
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-        filepath = directory + "/log-" + message.message_id + ".json"
-        with open(filepath, "w") as f:
-            json.dump(message, f, indent=4, cls=CustomEncoder)
+        if self.writer is not None: self.writer.push(message)
+        else: self.message_log.append(message)
 
     def _read_messages(self):
-        directory = self.project_root + "/memory/sessions/" + self.session_id + "/messages"
-        if not os.path.exists(directory):
-            return []
-
-        files = os.listdir(directory)
-        json_files = [f for f in files if f.endswith(".json")]
-
-        json_files.sort()
-        data = []
-        for file in json_files:
-            with open(os.path.join(directory, file), "r") as f:
-                file_data = json.load(f, object_hook=self._object_hook)
-                data.append(file_data)
+        # messages saved in an older layout (one per file) come first - see migrate-sessions
+        data = self.store.legacy_messages(self.session_id, self._object_hook)
+        if self.lazy and len(data) == 0:
+            self.messages = PagedMessages(self.message_log)
+            return
 
-        self.messages = data
+        self.messages = data + self.message_log.read()
 
     def format_value(self, value):
         if isinstance(value, list):
@@ -251,13 +298,12 @@ class Context:
         results = []
 
         # tokens = text.split(' ')
-        tokens = unification.tokenize(text)
+        plan = unification.compile_substitution(text)
 
-        for token in tokens:
+        for token, parts in zip(plan.tokens, plan.paths):
 
-            if str.startswith(token, "?") or str.startswith(token, "$"):
+            if parts is not None:
 
-                parts = token.split('.')
                 current_item = None
 
                 for part in parts:
@@ -305,26 +351,274 @@ class Context:
         if len(results) == 1: return results[0]
         else: return results
 
+class RulesLock:
+    """
+    Lets any number of runs read the rules at once, while changes to the rules wait for the
+    runs in progress to finish (and hold off new runs), so every run sees one version of the rules.
+    Reading is reentrant within a thread, as is writing.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = None          # thread id of the writer
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def reading(self):
+        depth = getattr(self._local, "depth", 0)
+        counted = depth == 0 and self._writer != threading.get_ident()
+        if counted:
+            with self._condition:
+                while self._writer is not None or self._waiting_writers > 0:
+                    self._condition.wait()
+                self._readers += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if counted:
+                with self._condition:
+                    self._readers -= 1
+                    if self._readers == 0: self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def writing(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            yield
+            return
+        if getattr(self._local, "depth", 0) > 0:
+            raise RuntimeError("The rules can't be changed while they are being processed")
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers > 0:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writer = None
+                self._condition.notify_all()
+
 class RulesContext:
 
     default_ruleset = None
-    rulesets = []
     items = {}
-    arcs = []
-    log = []
+    arcs = None
+    log = None
     display_log = False
     last_ms = 0
-    index = {}
+    network = None
+    rules_lock = None
+    profiler = None
+    unification_cache = None
 
     def __init__(self):
+        self._snapshot = None     # precompiled rules, loaded on first use
+        self._snapshot_lock = threading.Lock()
         self.default_ruleset = None
         self.rulesets = [{"name": "default", "rules": [], "path": None}]
         self.items = {}
-        self.arcs = []
-        self.log = []
+        self.arcs = ArcStore()
+        self.log = EngineLog()  # bounded, see thoughts.log
         self.display_log = False
         self.last_ms = 0
-        self.index = {}
+        self.index = RuleIndex()
+        self.network = None
+        self.profiler = None  # a RuleProfiler while profiling is enabled
+        self.unification_cache = None  # an (opt-in) UnificationCache used by match
+        self.rules_lock = RulesLock()
+        self._ruleset_keys = {}  # id(ruleset) -> its ruleset idx in the index
+        self._next_ruleset_key = 0
+        self._item_table = None  # built the first time an item is looked up
+        self._lookups = {}       # cached #lookup matches among the ruleset entries
+        self._plans = {}         # id(term) -> the TemplatePlan of a rule's term, dropped when rules are replaced
+        self._lookups_stamp = None
+        self._lookups_table = None
+        self.vocabulary = Vocabulary()  # shared by the token streams of #tokenize
+
+    # the rulesets and index come from a snapshot (if one was loaded) the first time they are used
+
+    @property
+    def rulesets(self):
+        if self._snapshot is not None: self._load_snapshot()
+        return self._rulesets
+
+    @rulesets.setter
+    def rulesets(self, rulesets):
+        self._rulesets = rulesets
+
+    @property
+    def index(self):
+        if self._snapshot is not None: self._load_snapshot()
+        return self._index
+
+    @index.setter
+    def index(self, index):
+        self._index = index
+
+    @property
+    def item_table(self):
+        """The #item entries of the rulesets, by name (see thoughts.items)."""
+        item_table = self._item_table
+        if item_table is None:
+            item_table = ItemTable()
+            for ruleset in self.rulesets: item_table.add_rules(ruleset["rules"], self._ruleset_key(ruleset))
+            self._item_table = item_table
+        return item_table
+
+    def load_snapshot(self, snapshot):
+        """Replaces the rules with those of a compiled snapshot (see thoughts.snapshot), loaded when first used."""
+        with self.rules_lock.writing():
+            self._snapshot = snapshot
+
+    def _load_snapshot(self):
+        with self._snapshot_lock:
+            snapshot = self._snapshot
+            if snapshot is None: return
+            data = snapshot.load()
+            self._rulesets = data["rulesets"]
+            self._index = data["index"]
+            self._ruleset_keys = {id(ruleset): key for ruleset, key in zip(self._rulesets, data["ruleset_keys"])}
+            self._next_ruleset_key = data["next_ruleset_key"]
+            self.default_ruleset = self._rulesets[0]
+            self._item_table = None
+            self._plans = {}
+            self._snapshot = None
+        self.rebuild_network()
+
+    def enable_network(self):
+        """Compiles the current rulesets into a match network, kept up to date as rules are added."""
+        self.network = MatchNetwork()
+        self.rebuild_network()
+
+    def disable_network(self):
+        self.network = None
+
+    def reindex(self):
+        """Rebuilds the rule index and match network, needed if the rulesets were changed directly."""
+        with self.rules_lock.writing():
+            self.index.clear()
+            self._ruleset_keys = {}
+            self._next_ruleset_key = 0
+            self._item_table = None
+            self._plans = {}
+            for ruleset in self.rulesets:
+                self.index_rules(ruleset["rules"], self._ruleset_key(ruleset))
+            self.rebuild_network()
+
+    def rebuild_network(self):
+        if self.network is None: return
+        self.network.clear()
+        for ruleset in self.rulesets:
+            self.network.add_rules(ruleset["rules"], self._ruleset_key(ruleset))
+        for arc in self.arcs: self.network.add_arc(arc)
+
+    def _ruleset_key(self, ruleset):
+        # rulesets are ordered in the index by a key given when they are added,
+        # which stays the same as other rulesets are removed or replaced
+        # (the rulesets before it are given theirs first, so keys follow the order of the rulesets)
+        key = self._ruleset_keys.get(id(ruleset))
+        if key is None:
+            for other in self.rulesets + [ruleset]:
+                if id(other) in self._ruleset_keys: continue
+                self._ruleset_keys[id(other)] = self._next_ruleset_key
+                self._next_ruleset_key += 1
+            key = self._ruleset_keys[id(ruleset)]
+        return key
+
+    def find_ruleset(self, name: str):
+        """Returns the position of the (first) ruleset with the name, or None."""
+        for ruleset_idx, ruleset in enumerate(self.rulesets):
+            if ruleset["name"] == name: return ruleset_idx
+        return None
+
+    def replace_ruleset(self, name: str, rules: list, path: str = None):
+        """
+        Replaces the rules of a ruleset (adding it if there is none with the name).
+        Only the rules that changed are reindexed. Runs in progress finish with the old rules first.
+        """
+        with self.rules_lock.writing():
+            ruleset_idx = self.find_ruleset(name)
+            if ruleset_idx is None: return self._add_rules(rules, name, path)
+
+            old = self.rulesets[ruleset_idx]
+            if path is None and "path" in old: path = old["path"]
+            ruleset = {"name": name, "rules": rules, "path": path}
+
+            key = self._ruleset_keys.pop(id(old), None)
+            if key is None: key = self._ruleset_key(old)
+            self._ruleset_keys[id(ruleset)] = key
+            self.index.replace_rules(rules, key)
+            if self._item_table is not None: self._item_table.replace_rules(rules, key)
+            self._plans = {}  # (the old rules' plans would keep them alive)
+
+            rulesets = list(self.rulesets)
+            rulesets[ruleset_idx] = ruleset
+            self.rulesets = rulesets
+            if self.default_ruleset is old: self.default_ruleset = ruleset
+            self.rebuild_network()
+
+    def remove_ruleset(self, name: str):
+        """Removes a ruleset and its rules from the index. Returns False if there is no ruleset with the name."""
+        with self.rules_lock.writing():
+            ruleset_idx = self.find_ruleset(name)
+            if ruleset_idx is None: return False
+
+            old = self.rulesets[ruleset_idx]
+            key = self._ruleset_keys.pop(id(old), None)
+            if key is not None:
+                self.index.remove_rules(key)
+                if self._item_table is not None: self._item_table.remove_rules(key)
+            self._plans = {}
+
+            rulesets = list(self.rulesets)
+            rulesets.pop(ruleset_idx)
+            self.rulesets = rulesets
+            if self.default_ruleset is old: self.default_ruleset = rulesets[0] if len(rulesets) > 0 else None
+            self.rebuild_network()
+            return True
+
+    def add_arc(self, arc):
+        self.arcs.add(arc)
+        if self.network is not None: self.network.add_arc(arc)
+
+    def remove_arc(self, arc):
+        self.arcs.remove(arc)
+        if self.network is not None: self.network.remove_arc(arc)
+
+    def search_arcs(self, assertion):
+        """Returns the active arcs the assertion could extend (in the order they were added)."""
+        if self.network is not None: return self.network.match_arcs(assertion)
+        return self.arcs.candidates(assertion)
+
+    def clear_arcs(self):
+        self.arcs.clear()
+        if self.network is not None: self.network.clear_arcs()
+
+    def fork(self):
+        """
+        Returns a context that shares the rulesets and rule index (read-only) with this one,
+        with its own copy of the items and its own arcs and log.
+        The match network holds arcs, so the fork matches through the rule index instead.
+        """
+        forked = RulesContext()
+        forked.default_ruleset = self.default_ruleset
+        forked.rulesets = self.rulesets
+        forked.index = self.index
+        forked.rules_lock = self.rules_lock
+        forked._ruleset_keys = self._ruleset_keys
+        forked._item_table = self.item_table
+        forked._plans = self._plans
+        forked.items = copy.deepcopy(self.items)
+        forked.display_log = self.display_log
+        forked.log.level = self.log.level
+        return forked
         
     def print_items(self):
         print("==================================")
@@ -341,77 +635,36 @@ class RulesContext:
             # print("")
         print("==================================")
 
-    def update_index(self, term):
-        
-        if "when" not in term: return
-
-        when_part = term["when"]
-        if type(when_part) is str:
-            tokens = unification.tokenize(when_part)
-            for token in tokens:
-                if str.startswith(token, "?") or str.startswith(token, "$"): continue
-                self.append_dict(self.index, token, term)
-        elif type(when_part) is dict:
-            if "#no-match" in when_part:
-                self.append_dict(self.index, "#no-match", term)
+    def update_index(self, rule, order):
+        self.index.add_rule(rule, order)
 
     def search_index(self, term):
-        result = []
-        if type(term) is str:
-            tokens = unification.tokenize(term)
-            for token in tokens:
-                if token not in self.index: continue
-                items = self.index[token]
-                if items is not None:
-                    if type(items) is list:
-                        for item in items:
-                            if item not in result: result.append(item)
-                    elif items not in result: result.append(items)
-        elif type(term) is dict:
-            for key in term.keys():
-                if key == "#no-match": 
-                    items = self.search_index(key)
-                else: 
-                    items = self.search_index(term[key])
-                if items is not None: 
-                    for item in items:
-                        if item not in result: result.append(item)
-
-        if len(result) == 0: return None
-        else: return result
-
-    def index_rules(self, rules:list):
-        for rule in rules: self.update_index(rule)
-
-    def append_dict(self, d:dict, key:str, term):
-        if key in d.keys(): 
-            current_val = d[key]
-            if (current_val is None): d[key] = term
-            else:
-                if type(current_val) is list:
-                    if term not in current_val: # uses is or ==?
-                        current_val.append(term)
-                else:
-                    if type(current_val) is str and type(term) is str and current_val != term:
-                        d[key] = [current_val, term]
-                    elif current_val is not term:
-                        d[key] = [current_val, term]
-        else: d[key] = term
-
-    def log_message(self, message):
+        return self.index.search(term)
+
+    def index_rules(self, rules:list, ruleset_idx: int):
+        self.index.add_rules(rules, ruleset_idx)
+
+    def log_message(self, message, *args, level = DEBUG):
+        """
+        Logs a message - a format string for args, only formatted when the log records the level
+        (see thoughts.log) or display_log is on.
+        """
+        recorded = level >= self.log.level
+        if self.display_log != True and not recorded: return
+        text = message % args if len(args) > 0 else message
         if self.display_log == True:
-            if len(message) > 0:
+            if len(text) > 0:
                 milliseconds = int(time() * 1000)
                 diff = milliseconds - self.last_ms
                 if self.last_ms == 0: diff = 0
                 self.last_ms = milliseconds
-                print(">", "[" + str(diff) + "ms]\t", message)
-        self.log.append(message)
+                print(">", "[" + str(diff) + "ms]\t", text)
+        if recorded: self.log.add(level, text)
 
     def merge_into_list(self, main_list: list, item):
         if item is None: return main_list
         if main_list is None: main_list = []     
-        if type(item) is list:
+        if type(item) is list or type(item) is TokenStream:
             for sub_item in item: main_list.append(sub_item)
         else: main_list.append(item)
         return main_list
@@ -420,36 +673,91 @@ class RulesContext:
 
         if name is None: name = str(uuid.uuid4())
 
-        ruleset = next(filter(lambda rs: rs["name"] == name, self.rulesets), None)
+        with self.rules_lock.writing():
 
-        if ruleset is None:
+            ruleset = next(filter(lambda rs: rs["name"] == name, self.rulesets), None)
 
-            ruleset = {"name": name, "rules": rules, "path": path}
+            if ruleset is None:
+
+                ruleset = {"name": name, "rules": rules, "path": path}
 
-            # sorted_set = []
-            # added = False
-            # for item in self.rulesets:
-            #     if len(rules) < len(item["rules"]):
-            #         added = True
-            #         sorted_set.append(ruleset)
-            #     sorted_set.append(item)
-            # if added == False: sorted_set.append(ruleset)
-            # self.rulesets = sorted_set
+                # sorted_set = []
+                # added = False
+                # for item in self.rulesets:
+                #     if len(rules) < len(item["rules"]):
+                #         added = True
+                #         sorted_set.append(ruleset)
+                #     sorted_set.append(item)
+                # if added == False: sorted_set.append(ruleset)
+                # self.rulesets = sorted_set
 
-            self.rulesets.append(ruleset)
+                self.rulesets.append(ruleset)
 
-            self.index_rules(rules)
+                key = self._ruleset_key(ruleset)
+                self.index_rules(rules, key)
+                if self._item_table is not None: self._item_table.add_rules(rules, key)
+
+                if self.network is not None:
+                    self.network.add_rules(rules, key)
 
     def add_rule(self, rule):
-        default_rule_set = self.rulesets[0]
-        default_rule_set["rules"].append(rule)
-        self.update_index(rule)
+        with self.rules_lock.writing():
+            default_rule_set = self.rulesets[0]
+            default_rule_set["rules"].append(rule)
+            order = (self._ruleset_key(default_rule_set), len(default_rule_set["rules"]) - 1)
+            self.update_index(rule, order)
+            if self._item_table is not None: self._item_table.add_item(rule, order)
+
+            if self.network is not None:
+                self.network.add_rule(rule, order)
 
     def clear_variables(self):
         for key in self.items.keys():
             if str.startswith(key, "$"): continue 
             self.items.pop(key)
 
+    def match(self, pattern, term):
+        """Unifies a term against a pattern (see unification.match), through the unification cache if enabled."""
+        if self.unification_cache is None: return unification.match(pattern, term)
+        return self.unification_cache.match(pattern, term)
+
+    def set_item(self, key, value):
+        self.items[key] = value
+
+    def lookup(self, target):
+        """
+        Returns the (name, item) pairs of the context items that unify with the target or, if there are
+        none, the (None, entry) pairs of the ruleset entries that do - using the item table's indexes
+        when the target has a constant value for an indexed property. The context items are searched
+        every time (they can be changed directly); the ruleset matches are cached until the rules change.
+        """
+        found = []
+        for name in self.items.keys():
+            item = self.items[name]
+            if self.match(target, item) is not None: found.append((name, item))
+        if len(found) > 0: return found
+
+        table = self.item_table
+        stamp = (id(table), table.version)
+        if self._lookups_stamp != stamp or self._lookups_table is not table:
+            self._lookups = {}
+            self._lookups_stamp = stamp
+            self._lookups_table = table
+
+        key = rule_key(target)
+        found = self._lookups.get(key)
+        if found is not None: return found
+
+        found = []
+        entries = table.candidates(target)
+        if entries is None: entries = (entry for ruleset in self.rulesets for entry in ruleset["rules"])
+        for entry in entries:
+            if self.match(target, entry) is not None: found.append((None, entry))
+
+        if len(self._lookups) >= 10000: self._lookups = {}
+        self._lookups[key] = found
+        return found
+
     def store_item(self, assertion, item):
 
         if type(item) is list and len(item) == 1: item = item[0]
@@ -514,20 +822,19 @@ class RulesContext:
                     results.append(search)
                     if (stopAfterFirst): return results
 
-        for ruleset in self.rulesets:
+        # only the items the query's #item could unify with (all of them if it is open)
+        sources = self.item_table.find("#item", query["#item"]) if "#item" in query else None
+        if sources is None: sources = self.item_table.all_items()
 
-            for source in ruleset["rules"]:
-            
-                if "#item" not in source: continue
-                if (source is None): continue
+        for source in sources:
 
-                u = unification.unify(source, query)
-                if (u is None): continue
-                
-                source["#unification"] = u
-                results.append(source)
+            u = unification.match(query, source)
+            if (u is None): continue
+            
+            source["#unification"] = u
+            results.append(source)
 
-                if (stopAfterFirst): return results[0]
+            if (stopAfterFirst): return results[0]
             
         return results
 
@@ -591,13 +898,12 @@ class RulesContext:
         results = []
 
         # tokens = text.split(' ')
-        tokens = unification.tokenize(text)
+        plan = unification.compile_substitution(text)
 
-        for token in tokens:
+        for token, parts in zip(plan.tokens, plan.paths):
 
-            if str.startswith(token, "?") or str.startswith(token, "$"):
+            if parts is not None:
 
-                parts = token.split('.')
                 current_item = None
 
                 for part in parts:
@@ -641,17 +947,9 @@ class RulesContext:
             results.append(self.items[item_name])
             if (stop_after_first): return results[0]
 
-        for ruleset in self.rulesets:
-
-            for item in ruleset["rules"]:
-
-                if (item is None): continue            
-                if "#item" not in item: continue
-
-                if "$" + item["#item"] == item_name \
-                    or item["#item"] == item_name or "?" + item["#item"] == item_name:
-                    results.append(item)
-                    if (stop_after_first): return results[0]
+        for item in self.item_table.named(item_name):
+            results.append(item)
+            if (stop_after_first): return results[0]
         
         if len(results) == 0: return None
         if len(results) == 1: return results[0]
@@ -723,15 +1021,46 @@ class RulesContext:
 
         return result.strip()
 
-    def apply_values(self, term, provider):
+    def apply_values(self, term, provider, share: bool = False, copy_static: bool = False):
+        """
+        Substitutes variable bindings (a dict provider) or item values (this context) into a term,
+        returning a new term. With share, the term is a rule's and is applied through its cached plan -
+        the parts with nothing to substitute are shared with the rule, so must not be changed, unless
+        copy_static copies them (for terms that leave the engine, such as conclusions).
+        """
+        others = None
+        if type(provider) is dict:
+            others = [key for key in provider if not key.startswith("?")]
+        if share and (others is None or len(others) == 0):
+            return self.template_plan(term).apply(provider, self, copy_static)
+        return self._apply_values(term, provider, others)
+
+    def template_plan(self, term):
+        """Returns the plan for a rule's term, compiling it on first use (cached by the term's identity until the rules change)."""
+        plans = self._plans
+        plan = plans.get(id(term))
+        if plan is None or plan.term is not term:
+            if len(plans) >= 50000: plans.clear()
+            plan = templates.TemplatePlan(term)
+            plans[id(term)] = plan
+            for shared in plan.shared_plans(): plans[id(shared.term)] = shared
+        return plan
+
+    def shared_plan(self, term):
+        """Returns the plan of a subtree shared with a rule's commands (see TemplatePlan), or None if the term isn't one."""
+        plan = self._plans.get(id(term))
+        if plan is None or plan.term is not term or plan.kind != templates.TemplatePlan.SHARED: return None
+        return plan
+
+    def _apply_values(self, term, provider, others):
             
         if (type(term) is dict):
             result = {}
             for key in term.keys():
                 if key == "#into" or key == "#append" or key == "#push":
-                    if type(term[key] is str):
+                    if type(term[key]) is str:
                         if type(provider) is dict:
-                            sub_value = unification.retrieve(term[key], provider)
+                            sub_value = unification.substitute(unification.compile_substitution(term[key]), provider, others)
                             if sub_value is not None:
                                 result[key] = sub_value
                     if key not in result:
@@ -740,14 +1069,17 @@ class RulesContext:
                     items_to_combine = term["#combine"]
                     newval = {}
                     for item in items_to_combine:
-                        new_item = self.apply_values(item, provider)
+                        new_item = self._apply_values(item, provider, others)
                         newval = {**new_item, **newval}
                     # assume combine is a standalone operation
                     # could also merge this will other keys
                     # result[key] = newval
                     return newval
+                elif key == "with" and self.shared_plan(term[key]) is not None:
+                    # a rule's own #replace set - nothing to substitute, and its compiled form is kept with it
+                    result[key] = term[key]
                 else:
-                    newval = self.apply_values(term[key], provider)
+                    newval = self._apply_values(term[key], provider, others)
                     result[key] = newval
             return result
 
@@ -755,13 +1087,13 @@ class RulesContext:
             result = []
             for item in term:
                 # moved from rule engine, refactor
-                newitem = self.apply_values(item, provider) 
+                newitem = self._apply_values(item, provider, others) 
                 result.append(newitem)
             return result
 
         elif (type(term) is str):
             if type(provider) is dict:
-                term = unification.retrieve(term, provider)
+                term = unification.substitute(unification.compile_substitution(term), provider, others)
             else:
                 term = self.retrieve(term)
             return term
@@ -0,0 +1,208 @@
+import json
+import thoughts.unification
+from thoughts.network import SEQ_KEYS, ESCAPED_KEYS, constant_key, is_open_pattern, is_open_value
+
+def string_guards(pattern: str):
+    """
+    Returns the literal tokens that any string unifying with the pattern must contain.
+    Patterns with $items are resolved against the context at match time, so they are not guarded.
+    """
+    if "$" in pattern: return []
+    guards = []
+    for token in thoughts.unification.tokenize(str.lower(pattern)):
+        if len(token) == 0 or token == ".": continue
+        if "?" in token or "*" in token: continue
+        guards.append(token)
+    return guards
+
+def dict_guards(pattern: dict):
+    """
+    Returns the (property, key) pairs that any dict unifying with the pattern must match.
+    The key is the normalized constant value of the property, or None when only its presence is known.
+    """
+    if "#combine" in pattern: return [] # rewritten when values are applied
+    guards = []
+    for prop in pattern.keys():
+        if prop in SEQ_KEYS: continue
+        assertion_prop = ESCAPED_KEYS.get(prop, prop)
+        value = pattern[prop]
+        if type(value) is str and not is_open_pattern(value):
+            guards.append((assertion_prop, constant_key(value)))
+        else:
+            guards.append((assertion_prop, None))
+    return guards
+
+def rule_patterns(rule):
+    # the patterns one of which an assertion must unify with to fire (or start) the rule
+    # None if the rule can't be narrowed down by its patterns
+    if "#if" in rule: return None
+    when = rule["#when"]
+    if type(when) is not list: return [when]
+    if len(when) == 0: return None
+    seq_type = rule["#seq-type"] if "#seq-type" in rule else None
+    if seq_type == "set": return when
+    return [when[0]]
+
+def rule_key(rule):
+    # compares rules by content when a ruleset is reloaded
+    return json.dumps(rule, sort_keys=True, default=str)
+
+class RuleIndex:
+    """
+    An inverted index from the constant parts of #when patterns to the rules that use them.
+
+    Rules are referenced by integer ids. String patterns are posted under one of their literal
+    tokens, dict patterns under one of their properties (with its constant value when there is one),
+    picking whichever posting list is shortest at the time. Rules that can't be narrowed down go
+    into a match-all bucket. A search returns every rule an
+    assertion could unify with, in the order the rulesets would be scanned.
+
+    Rules are added and removed per ruleset. Removed ids are not reused, clear and re-add
+    the rules to compact the index.
+    """
+
+    def __init__(self):
+        self.rules = []         # rule id -> rule (None once removed)
+        self.order = []         # rule id -> (ruleset idx, rule idx)
+        self.tokens = {}        # token -> set of rule ids
+        self.props = {}         # property -> key -> set of rule ids (key None for any value)
+        self.match_all = set()  # rule ids attempted for every assertion
+        self.postings = []      # rule id -> (table, key) of each posting list holding it
+        self.rulesets = {}      # ruleset idx -> ids of its rules
+        self._sorted_ids = None
+
+    def clear(self):
+        self.__init__()
+
+    def add_rules(self, rules: list, ruleset_idx: int, start: int = 0):
+        for rule_idx in range(start, len(rules)):
+            self.add_rule(rules[rule_idx], (ruleset_idx, rule_idx))
+
+    def add_rule(self, rule, order):
+
+        if rule is None: return None
+        if "#when" not in rule and "#if" not in rule: return None # items never fire
+
+        rule_id = len(self.rules)
+        self.rules.append(rule)
+        self.order.append(order)
+        self.postings.append(())
+        self.rulesets.setdefault(order[0], []).append(rule_id)
+        self._sorted_ids = None
+
+        patterns = rule_patterns(rule)
+        if patterns is None:
+            self.match_all.add(rule_id)
+            return rule_id
+
+        postings = []
+        for pattern in patterns:
+            guard = None
+            if type(pattern) is str:
+                tokens = string_guards(pattern)
+                if len(tokens) > 0:
+                    token = min(tokens, key=lambda token: len(self.tokens.get(token, ())))
+                    guard = (self.tokens, token)
+            elif type(pattern) is dict:
+                prop_guards = dict_guards(pattern)
+                if len(prop_guards) > 0:
+                    # constant values narrow down more than the presence of a property
+                    prop, key = min(prop_guards, key=lambda guard: (guard[1] is None, self._posting_size(guard)))
+                    guard = (self.props.setdefault(prop, {}), key)
+            if guard is None:
+                self.match_all.add(rule_id)
+                return rule_id
+            postings.append(guard)
+
+        for table, key in postings: table.setdefault(key, set()).add(rule_id)
+        self.postings[rule_id] = postings
+        return rule_id
+
+    def remove_rule(self, rule_id: int):
+        if self.rules[rule_id] is None: return
+        self.rules[rule_id] = None
+        self.match_all.discard(rule_id)
+        for table, key in self.postings[rule_id]:
+            posting = table.get(key)
+            if posting is None: continue
+            posting.discard(rule_id)
+            if len(posting) == 0: del table[key]
+        self.postings[rule_id] = ()
+        self._sorted_ids = None
+
+    def remove_rules(self, ruleset_idx: int):
+        """Removes all the rules of a ruleset."""
+        for rule_id in self.rulesets.pop(ruleset_idx, []): self.remove_rule(rule_id)
+
+    def replace_rules(self, rules: list, ruleset_idx: int):
+        """
+        Replaces the rules of a ruleset, only (re)indexing the rules that changed.
+        Rules equal to one already in the ruleset keep its postings and move to their new position.
+        """
+
+        unchanged = {}
+        for rule_id in self.rulesets.pop(ruleset_idx, []):
+            unchanged.setdefault(rule_key(self.rules[rule_id]), []).append(rule_id)
+
+        rule_ids = []
+        for rule_idx, rule in enumerate(rules):
+            if rule is None: continue
+            if "#when" not in rule and "#if" not in rule: continue
+            same = unchanged.get(rule_key(rule))
+            if same:
+                rule_id = same.pop(0)
+                self.rules[rule_id] = rule
+                self.order[rule_id] = (ruleset_idx, rule_idx)
+                rule_ids.append(rule_id)
+            else:
+                rule_ids.append(self.add_rule(rule, (ruleset_idx, rule_idx)))
+
+        for same in unchanged.values():
+            for rule_id in same: self.remove_rule(rule_id)
+
+        self.rulesets[ruleset_idx] = rule_ids
+        self._sorted_ids = None
+
+    def _posting_size(self, guard):
+        prop, key = guard
+        return len(self.props.get(prop, {}).get(key, ()))
+
+    def search(self, assertion):
+        """Returns the rules an assertion could unify with."""
+
+        term = assertion["#assert"] if type(assertion) is dict and "#assert" in assertion else assertion
+
+        rule_ids = set(self.match_all)
+
+        if type(term) is str:
+            # strings may unify with any pattern through variables or wildcards
+            if is_open_value(term) or term.startswith("{"): return self.all_rules()
+            for token in thoughts.unification.tokenize(str.lower(term)):
+                posting = self.tokens.get(token)
+                if posting is not None: rule_ids.update(posting)
+
+        elif type(term) is dict:
+            for prop in term.keys():
+                keys = self.props.get(prop)
+                if keys is None: continue
+                value = term[prop]
+                if type(value) is str and is_open_value(value):
+                    for posting in keys.values(): rule_ids.update(posting)
+                    continue
+                posting = keys.get(None)
+                if posting is not None: rule_ids.update(posting)
+                if type(value) is str:
+                    posting = keys.get(constant_key(value))
+                    if posting is not None: rule_ids.update(posting)
+
+        else:
+            return self.all_rules()
+
+        order = self.order
+        return [self.rules[rule_id] for rule_id in sorted(rule_ids, key=lambda rule_id: order[rule_id])]
+
+    def all_rules(self):
+        if self._sorted_ids is None:
+            rule_ids = [rule_id for rule_id in range(len(self.rules)) if self.rules[rule_id] is not None]
+            self._sorted_ids = sorted(rule_ids, key=lambda rule_id: self.order[rule_id])
+        return [self.rules[rule_id] for rule_id in self._sorted_ids]
@@ -0,0 +1,120 @@
+from thoughts.network import SEQ_KEYS, constant_key, is_open_value
+
+class ItemTable:
+    """
+    The entries (dicts) of the rulesets, with the #item entries kept by name so looking an item up
+    doesn't scan every rule.
+
+    Entries are stored by their (ruleset idx, rule idx) order and returned in the order the rulesets
+    would be scanned. A lookup by name also finds "x" for "$x" and "?x". Properties can be indexed
+    by their constant values (see index_property, or declare {"#index": ["word", "pos"]} in a ruleset) -
+    values that are open (variables, wildcards) or not strings are returned for every value, as they
+    may still unify with it. The version changes whenever the entries do.
+    """
+
+    def __init__(self):
+        self.names = {}        # #item name -> order -> item
+        self.entries = {}      # order -> entry
+        self.rulesets = {}     # ruleset idx -> orders of its entries
+        self.props = {}        # property -> key -> order -> entry (key None for open values)
+        self.version = 0
+        self._sorted = None
+        self.index_property("#item")
+
+    def clear(self):
+        props = list(self.props.keys())
+        self.__init__()
+        for prop in props: self.index_property(prop)
+
+    def add_rules(self, rules: list, ruleset_idx: int, start: int = 0):
+        for rule_idx in range(start, len(rules)):
+            self.add_item(rules[rule_idx], (ruleset_idx, rule_idx))
+
+    def add_item(self, item, order):
+        if type(item) is not dict: return
+        if "#index" in item and type(item["#index"]) is list:
+            for prop in item["#index"]: self.index_property(prop)
+        self.entries[order] = item
+        self.rulesets.setdefault(order[0], []).append(order)
+        self.version += 1
+        self._sorted = None
+        name = item["#item"] if "#item" in item else None
+        if type(name) is str: self.names.setdefault(name, {})[order] = item
+        for prop, keys in self.props.items():
+            if prop in item: keys.setdefault(self._value_key(item[prop]), {})[order] = item
+
+    def remove_rules(self, ruleset_idx: int):
+        """Removes the entries of a ruleset."""
+        for order in self.rulesets.pop(ruleset_idx, []):
+            item = self.entries.pop(order)
+            if "#item" in item and type(item["#item"]) is str: self._discard(self.names, item["#item"], order)
+            for prop, keys in self.props.items():
+                if prop in item: self._discard(keys, self._value_key(item[prop]), order)
+        self.version += 1
+        self._sorted = None
+
+    def replace_rules(self, rules: list, ruleset_idx: int):
+        self.remove_rules(ruleset_idx)
+        self.add_rules(rules, ruleset_idx)
+
+    def index_property(self, prop: str):
+        """Indexes the entries by the value of a property, so find can look them up by it."""
+        if prop in self.props: return
+        self.version += 1
+        keys = {}
+        for order, item in self.entries.items():
+            if prop in item: keys.setdefault(self._value_key(item[prop]), {})[order] = item
+        self.props[prop] = keys
+
+    def named(self, item_name: str):
+        """Returns the items named item_name (or, for "$x" or "?x", named x) in ruleset order."""
+        found = self.names.get(item_name)
+        if item_name.startswith("$") or item_name.startswith("?"):
+            alias = self.names.get(item_name[1:])
+            if alias: found = alias if not found else {**found, **alias}
+        if not found: return []
+        return [found[order] for order in sorted(found)]
+
+    def find(self, prop: str, value):
+        """
+        Returns the entries whose (indexed) property could unify with a constant value, in ruleset order.
+        Returns None when the property is not indexed or the value is open - check every entry then.
+        """
+        keys = self.props.get(prop)
+        if keys is None or type(value) is not str or is_open_value(value) or "$" in value: return None
+        found = {**keys.get(constant_key(value), {}), **keys.get(None, {})}
+        return [found[order] for order in sorted(found)]
+
+    def candidates(self, pattern):
+        """
+        Returns the entries a pattern could unify with, narrowed down by the indexed property with the
+        fewest matches - or None when none of the pattern's properties is indexed with a constant value.
+        """
+        if type(pattern) is not dict: return None
+        best = None
+        for prop, value in pattern.items():
+            if prop in SEQ_KEYS or prop not in self.props: continue
+            found = self.find(prop, value)
+            if found is not None and (best is None or len(found) < len(best)): best = found
+        return best
+
+    def all_items(self):
+        """Returns the #item entries, in ruleset order."""
+        if self._sorted is None:
+            self._sorted = [self.entries[order] for order in sorted(self.entries) if "#item" in self.entries[order]]
+        return self._sorted
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _value_key(value):
+        if type(value) is not str or is_open_value(value): return None
+        return constant_key(value)
+
+    @staticmethod
+    def _discard(table, key, order):
+        found = table.get(key)
+        if found is None: return
+        found.pop(order, None)
+        if len(found) == 0: del table[key]
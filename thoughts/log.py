@@ -0,0 +1,79 @@
+from collections import deque
+from time import time
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+class EngineLog:
+    """
+    The engine log - a ring buffer keeping the last `capacity` messages at or above its level.
+
+    Messages are given as a format string and its arguments ("ASSERT:\t%s", assertion), and only
+    formatted when their level is enabled. Records can also be streamed to a file (stream_to).
+    Iterating the log gives the messages, oldest first, as the log list used to.
+    """
+
+    def __init__(self, capacity: int = 10000, level: int = INFO):
+        if capacity < 1: raise ValueError("capacity must be at least 1")
+        self.level = level
+        self.records = deque(maxlen=capacity)  # (time, level, message)
+        self._sink = None
+
+    @property
+    def capacity(self):
+        return self.records.maxlen
+
+    def set_capacity(self, capacity: int):
+        if capacity < 1: raise ValueError("capacity must be at least 1")
+        self.records = deque(self.records, maxlen=capacity)
+
+    def is_enabled(self, level: int):
+        return level >= self.level
+
+    def log(self, level: int, message: str, *args):
+        if level < self.level: return None
+        return self.add(level, message % args if len(args) > 0 else message)
+
+    def add(self, level: int, text: str):
+        """Records an already formatted message (whatever the level)."""
+        record = (time(), level, text)
+        self.records.append(record)
+        if self._sink is not None: self._sink.write(self.format_record(record) + "\n")
+        return text
+
+    def debug(self, message: str, *args): return self.log(DEBUG, message, *args)
+    def info(self, message: str, *args): return self.log(INFO, message, *args)
+    def warning(self, message: str, *args): return self.log(WARNING, message, *args)
+    def error(self, message: str, *args): return self.log(ERROR, message, *args)
+
+    @staticmethod
+    def format_record(record):
+        timestamp, level, text = record
+        return "{:.3f}\t{}\t{}".format(timestamp, LEVEL_NAMES.get(level, str(level)), text)
+
+    def stream_to(self, path: str):
+        """Appends each record from now on to a file (one line per record), until close is called."""
+        self.close()
+        self._sink = open(path, "a", buffering=1, encoding="utf-8")
+
+    def close(self):
+        if self._sink is None: return
+        self._sink.close()
+        self._sink = None
+
+    def tail(self, count: int = 20):
+        """Returns the last count messages."""
+        return [text for _, _, text in list(self.records)[-count:]]
+
+    def clear(self):
+        self.records.clear()
+
+    def __iter__(self):
+        return iter([text for _, _, text in self.records])
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, idx):
+        if type(idx) is slice: return [text for _, _, text in list(self.records)[idx]]
+        return self.records[idx][2]
@@ -0,0 +1,265 @@
+import thoughts.unification
+from thoughts.arcs import Arc
+
+# keys injected by the engine at runtime, ignored by unification
+SEQ_KEYS = ("#seq-start", "#seq-end", "#seq", "#seq-idx")
+
+# escaped keys in a pattern that refer to the runtime keys of an assertion
+ESCAPED_KEYS = {"##seq-start": "#seq-start", "##seq-end": "#seq-end", "##seq-idx": "#seq-idx"}
+
+def constant_key(text: str):
+    """Returns the normalized token key of a constant string, as compared by unify."""
+    return tuple(thoughts.unification.tokenize(str.lower(text)))
+
+def is_open_pattern(text: str):
+    # pattern strings that may unify with more than their literal value
+    # (variables, wildcards, and $items resolved from the context at match time)
+    return len(text) == 0 or "?" in text or "*" in text or "$" in text
+
+def is_open_value(text: str):
+    # assertion strings that may unify with more than their literal value
+    return len(text) == 0 or "?" in text or "*" in text
+
+def pattern_tests(pattern):
+    """
+    Breaks a #when pattern into the constant tests an assertion must pass to unify with it.
+    Each test is a (property, key) pair - property is None when the pattern is a plain string,
+    key is None when only the presence of the property is tested.
+    Returns an empty list when nothing can be tested up front.
+    """
+
+    if type(pattern) is str:
+        if is_open_pattern(pattern): return []
+        return [(None, constant_key(pattern))]
+
+    if type(pattern) is dict:
+        if "#combine" in pattern: return [] # rewritten when values are applied
+        tests = []
+        for prop in pattern.keys():
+            if prop in SEQ_KEYS: continue
+            assertion_prop = ESCAPED_KEYS.get(prop, prop)
+            value = pattern[prop]
+            if type(value) is str and not is_open_pattern(value):
+                tests.append((assertion_prop, constant_key(value)))
+            else:
+                tests.append((assertion_prop, None))
+        return tests
+
+    return []
+
+def rule_alternatives(rule):
+    """
+    Returns the patterns of which at least one must unify with an assertion for the rule
+    (or arc) to be worth attempting, or None if the rule should always be attempted.
+    """
+
+    if type(rule) is Arc:
+        when = rule.when
+        seq_type = rule.seq_type
+        seq_idx = rule.seq_idx
+    else:
+        if "#if" in rule: return None
+        when = rule["#when"]
+        if type(when) is not list: return [when]
+        seq_type = rule["#seq-type"] if "#seq-type" in rule else None
+        seq_idx = rule["#seq-idx"] if "#seq-idx" in rule else 0
+
+    if seq_type == "set":
+        # any constituent not already matched can be next
+        return [pattern for pattern in when if "#seq-start" not in pattern]
+
+    if seq_idx >= len(when): return None
+    return [when[seq_idx]]
+
+class AlphaNode:
+    """A single constant test, shared by every rule and arc pattern that uses it."""
+
+    __slots__ = ("test", "successors")
+
+    def __init__(self, test):
+        self.test = test
+        self.successors = set()
+
+class JoinNode:
+    """Counts the alpha activations of one pattern - the pattern passes when all its tests pass."""
+
+    __slots__ = ("owner", "size", "tests")
+
+    def __init__(self, owner, tests):
+        self.owner = owner
+        self.size = len(tests)
+        self.tests = tests
+
+class RuleMemory:
+    """A rule in the network, ordered the same way the rulesets would be scanned."""
+
+    __slots__ = ("rule", "order")
+
+    def __init__(self, rule, order):
+        self.rule = rule
+        self.order = order
+
+class ArcMemory:
+    """A partial match (active arc), ordered by when it was created."""
+
+    __slots__ = ("arc", "order", "joins")
+
+    def __init__(self, arc, order):
+        self.arc = arc
+        self.order = order
+        self.joins = []
+
+class MatchNetwork:
+    """
+    A discrimination network compiled from the #when portion of the rules.
+
+    Constant tests are shared between rules in alpha nodes, rules and partial matches (arcs)
+    hang off join nodes that count how many of their tests an assertion passes, so an assertion
+    only activates the rules and arcs it could possibly unify with. Unification itself still
+    decides the match, which keeps the conclusions identical to scanning every rule.
+    """
+
+    def __init__(self):
+        self.alpha = {}           # property -> key -> AlphaNode
+        self.joins = {}           # join id -> JoinNode
+        self.unconditional = set() # join ids without any tests
+        self.arcs = {}            # id(arc) -> ArcMemory
+        self._next_join = 0
+        self._next_arc = 0
+
+    def clear(self):
+        self.__init__()
+
+    def clear_arcs(self):
+        for arc_memory in list(self.arcs.values()):
+            self._remove_joins(arc_memory.joins)
+        self.arcs = {}
+
+    def add_rules(self, rules: list, ruleset_idx: int, start: int = 0):
+        for rule_idx in range(start, len(rules)):
+            self.add_rule(rules[rule_idx], (ruleset_idx, rule_idx))
+
+    def add_rule(self, rule, order):
+        if rule is None: return
+        if "#when" not in rule and "#if" not in rule: return # items never fire
+        memory = RuleMemory(rule, order)
+        self._add_joins(memory, rule_alternatives(rule))
+
+    def add_arc(self, arc):
+        memory = ArcMemory(arc, self._next_arc)
+        self._next_arc += 1
+        memory.joins = self._add_joins(memory, rule_alternatives(arc))
+        self.arcs[id(arc)] = memory
+
+    def remove_arc(self, arc):
+        memory = self.arcs.pop(id(arc), None)
+        if memory is not None: self._remove_joins(memory.joins)
+
+    def match_rules(self, assertion):
+        """Returns the rules an assertion activates, in ruleset scan order."""
+        memories = [m for m in self._activate(assertion) if type(m) is RuleMemory]
+        memories.sort(key=lambda m: m.order)
+        return [m.rule for m in memories]
+
+    def match_arcs(self, assertion):
+        """
+        Yields the arcs an assertion activates, in creation order.
+        Arcs created while iterating are picked up as well, as they would be when scanning the arc list.
+        """
+        watermark = 0
+        while True:
+            memories = [m for m in self._activate(assertion) if type(m) is ArcMemory and m.order >= watermark]
+            if len(memories) == 0: return
+            memories.sort(key=lambda m: m.order)
+            watermark = self._next_arc
+            for memory in memories: yield memory.arc
+
+    def _activate(self, assertion):
+
+        term = assertion["#assert"] if type(assertion) is dict and "#assert" in assertion else assertion
+
+        counts = {}
+
+        if type(term) is str:
+            # strings may unify with any pattern through variables or wildcards
+            if is_open_value(term) or term.startswith("{"): return self._all()
+            node = self.alpha.get(None, {}).get(constant_key(term))
+            if node is not None:
+                for join_id in node.successors: counts[join_id] = 1
+
+        elif type(term) is dict:
+            for prop in term.keys():
+                keys = self.alpha.get(prop)
+                if keys is None: continue
+                value = term[prop]
+                nodes = [keys[None]] if None in keys else []
+                if type(value) is str:
+                    if is_open_value(value):
+                        nodes = keys.values()
+                    else:
+                        node = keys.get(constant_key(value))
+                        if node is not None: nodes.append(node)
+                for node in nodes:
+                    for join_id in node.successors:
+                        counts[join_id] = counts.get(join_id, 0) + 1
+
+        else:
+            return self._all()
+
+        owners = {}
+        for join_id in self.unconditional:
+            owner = self.joins[join_id].owner
+            owners[id(owner)] = owner
+        for join_id, count in counts.items():
+            join = self.joins[join_id]
+            if count == join.size: owners[id(join.owner)] = join.owner
+
+        return owners.values()
+
+    def _all(self):
+        owners = {}
+        for join in self.joins.values(): owners[id(join.owner)] = join.owner
+        return owners.values()
+
+    def _add_joins(self, owner, alternatives):
+
+        if alternatives is None: alternatives = [None]
+
+        join_ids = []
+        for pattern in alternatives:
+
+            tests = pattern_tests(pattern) if pattern is not None else []
+
+            join_id = self._next_join
+            self._next_join += 1
+            self.joins[join_id] = JoinNode(owner, tests)
+            join_ids.append(join_id)
+
+            if len(tests) == 0:
+                self.unconditional.add(join_id)
+                continue
+
+            for test in tests:
+                prop, key = test
+                keys = self.alpha.setdefault(prop, {})
+                node = keys.get(key)
+                if node is None:
+                    node = AlphaNode(test)
+                    keys[key] = node
+                node.successors.add(join_id)
+
+        return join_ids
+
+    def _remove_joins(self, join_ids):
+        for join_id in join_ids:
+            join = self.joins.pop(join_id, None)
+            if join is None: continue
+            self.unconditional.discard(join_id)
+            for prop, key in join.tests:
+                keys = self.alpha.get(prop)
+                if keys is None or key not in keys: continue
+                node = keys[key]
+                node.successors.discard(join_id)
+                if len(node.successors) == 0:
+                    del keys[key]
+                    if len(keys) == 0: del self.alpha[prop]
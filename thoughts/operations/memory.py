@@ -1,5 +1,4 @@
 from datetime import datetime
-import os
 import re
 from thoughts.context import Context
 from thoughts.interfaces.messaging import PromptMessage, AIMessage, HumanMessage, SystemMessage
@@ -506,40 +505,41 @@ class SessionIterator(Operation):
         self.operations = operations
         self.num_previous = num_previous
 
-    def _get_last_n_folders(self, directory, n):
-        # Get a list of all folders in the directory
-        all_folders = [d for d in os.listdir(directory) if os.path.isdir(os.path.join(directory, d))]
+    def _get_last_n_sessions(self, store, n):
+        # Get a list of all sessions in the store
+        all_sessions = store.session_ids()
 
-        # Filter out folders that don't match the yyyy-mm-dd format
-        valid_folders = []
-        for folder in all_folders:
+        # Filter out sessions that don't match the yyyy-mm-dd format
+        valid_sessions = []
+        for session_id in all_sessions:
             try:
-                datetime.strptime(folder, '%Y-%m-%d')
-                valid_folders.append(folder)
+                datetime.strptime(session_id, '%Y-%m-%d')
+                valid_sessions.append(session_id)
             except ValueError:
                 continue
 
-        # Sort the folders in reverse chronological order
-        valid_folders.sort(reverse=True)
+        # Sort the sessions in reverse chronological order
+        valid_sessions.sort(reverse=True)
 
-        # Return the last N folders
+        # Return the last N sessions
         if n is None:
-            return valid_folders
+            return valid_sessions
 
-        return valid_folders[:n]
+        return valid_sessions[:n]
     
     def execute(self, context: Context, message = None):
         
-        folders = self._get_last_n_folders(context.project_root + "/memory/sessions", self.num_previous)
+        session_ids = self._get_last_n_sessions(context.store, self.num_previous)
         results = []
-        for folder in folders:
-            session_id = folder
+        for session_id in session_ids:
 
             print("Extracting", session_id, "...")
 
             # execution context is a mashup of the persisted session and the session passed in
+            # (opened lazily - the operations usually only read a few of its items)
             execution_context = Context(llm=context.llm, memory=context.memory, 
-                                        content_path=context.content_path, session_id=session_id, persist_session=context.persist_session)
+                                        content_path=context.content_path, session_id=session_id, persist_session=context.persist_session,
+                                        lazy=True, store=context.store)
             
             operation: Operation = None
             for operation in self.operations:
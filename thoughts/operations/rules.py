@@ -114,7 +114,7 @@ class TextMatchCondition(Operation):
         else:
             truth = comparison_text == comparison_value
             from thoughts.unifier import Unification
-            unification = Unification.unify_text(comparison_text, comparison_value)
+            unification = Unification().unify_text(comparison_text, comparison_value)
             if unification is not None:
                 truth = True
             return unification, truth
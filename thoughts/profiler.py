@@ -0,0 +1,91 @@
+import json
+from time import perf_counter
+
+from thoughts.arcs import Arc
+
+class RuleProfiler:
+    """
+    Per-rule counters - how often each rule was tried against an assertion (evaluations), how often
+    its pattern unified, how often it fired, how many arcs it created and the time spent trying it.
+    Arcs count against the rule they come from. The engine only calls the profiler while it is
+    enabled (engine.enable_profiler()), so it costs nothing when off.
+    """
+
+    FIELDS = ("evaluations", "unifications", "firings", "arcs", "seconds")
+    EVALUATIONS, UNIFICATIONS, FIRINGS, ARCS, SECONDS = 1, 2, 3, 4, 5
+
+    def __init__(self, context):
+        self.context = context
+        self.rules = {}  # id(rule) -> [rule, evaluations, unifications, firings, arcs, seconds]
+
+    def reset(self):
+        self.rules = {}
+
+    def _entry(self, rule):
+        if type(rule) is Arc: rule = rule.rule
+        entry = self.rules.get(id(rule))
+        if entry is None or entry[0] is not rule:
+            entry = [rule, 0, 0, 0, 0, 0.0]
+            self.rules[id(rule)] = entry
+        return entry
+
+    def attempt(self, attempt, rule, assertion, context):
+        """Calls attempt(rule, assertion, context), counting the evaluation and its time."""
+        entry = self._entry(rule)
+        entry[RuleProfiler.EVALUATIONS] += 1
+        started = perf_counter()
+        try: return attempt(rule, assertion, context)
+        finally: entry[RuleProfiler.SECONDS] += perf_counter() - started
+
+    def count(self, rule, field: int):
+        self._entry(rule)[field] += 1
+
+    def _locations(self):
+        # id(rule) -> (ruleset name, rule idx)
+        locations = {}
+        for ruleset in self.context.rulesets:
+            for rule_idx, rule in enumerate(ruleset["rules"]):
+                locations[id(rule)] = (ruleset["name"], rule_idx)
+        return locations
+
+    @staticmethod
+    def label(rule):
+        if "#name" in rule: return str(rule["#name"])
+        when = json.dumps(rule["#when"], default=str) if "#when" in rule else json.dumps(rule.get("#if"), default=str)
+        return when if len(when) <= 60 else when[:57] + "..."
+
+    def report(self):
+        """Returns the counters of each rule tried, the slowest first."""
+        locations = self._locations()
+        report = []
+        for entry in self.rules.values():
+            rule = entry[0]
+            ruleset, rule_idx = locations.get(id(rule), (None, None))
+            stats = {"ruleset": ruleset, "rule": rule_idx, "label": self.label(rule)}
+            for field_idx, field in enumerate(RuleProfiler.FIELDS): stats[field] = entry[field_idx + 1]
+            report.append(stats)
+        report.sort(key=lambda stats: -stats["seconds"])
+        return report
+
+    def to_json(self, indent = 2):
+        return json.dumps(self.report(), indent=indent)
+
+    def to_folded(self):
+        """
+        The time per rule in the folded stack format flame graph tools read
+        (one "thoughts;ruleset;rule microseconds" line per rule).
+        """
+        lines = []
+        for stats in self.report():
+            micros = int(round(stats["seconds"] * 1e6))
+            if micros == 0: continue
+            frames = ["thoughts", str(stats["ruleset"]), "{}: {}".format(stats["rule"], stats["label"])]
+            lines.append(";".join(frame.replace(";", ",") for frame in frames) + " " + str(micros))
+        return "\n".join(lines) + ("\n" if len(lines) > 0 else "")
+
+    def save(self, path: str, format: str = "json"):
+        """Writes the report to a file, as JSON or (format="folded") as folded stacks."""
+        if format == "json": text = self.to_json()
+        elif format == "folded": text = self.to_folded()
+        else: raise ValueError("unknown profile format: " + str(format))
+        with open(path, "w") as f: f.write(text)
@@ -1,8 +1,18 @@
+import contextlib
 import json
 import os
+import time
+import uuid
+from types import GeneratorType
 # from build.lib import thoughts
 # from build.lib.thoughts import context
 from thoughts.context import RulesContext
+from thoughts.watcher import RulesWatcher
+from thoughts.snapshot import RulesSnapshot
+from thoughts.tokens import TokenStream
+from thoughts.profiler import RuleProfiler
+from thoughts.log import DEBUG, INFO
+from thoughts.unification import UnificationCache
 # from thoughts.commands import tokenize
 
 # import thoughts.unification
@@ -11,34 +21,103 @@ import copy
 #from thoughts.unification import tokenize
 # from thoughts.commands import assert_command
 
+# entry point group other packages can register command plugins under
+PLUGIN_GROUP = "thoughts.plugins"
+
+class AgendaDepthError(RecursionError):
+    """Raised when conclusions nest deeper than the engine's max_depth (usually rules that re-trigger each other)."""
+    pass
+
 class RulesEngine:
 
     context = RulesContext()
     # log = []
     _agenda = []
-    _plugins = {}
+    _plugins = {}        # moniker -> plugin module
+    _plugin_paths = {}   # moniker -> module path, imported on first use
+    _entry_points_loaded = False
+    _monitor = None
+    _monitor_every = 100
+    stats = None
+    max_depth = 1000     # deepest conclusion tree a run may build (AgendaDepthError beyond it)
     # _arcs = []
 
-    def __init__(self):
+    def __init__(self, match_mode: str = "scan", context: RulesContext = None):
         
-        self.context = RulesContext()
         self._agenda = []
         self._load_plugins()
 
+        if context is not None:
+            # run against an existing context (e.g. a fork sharing its rules)
+            self.context = context
+            self.match_mode = "network" if context.network is not None else "scan"
+            return
+
+        self.context = RulesContext()
+
         # add the default ruleset
         self.context.rulesets.append({"name": "default", "rules": []})
         self.context.default_ruleset = self.context.rulesets[0]
 
+        self.set_match_mode(match_mode)
+
+    def set_match_mode(self, match_mode: str):
+        """
+        Selects how assertions are matched against the rules.
+        "scan" attempts every rule in every ruleset (and every active arc).
+        "network" compiles the rules into a match network and only attempts the rules and arcs it activates.
+        Both modes draw the same conclusions.
+        """
+        if match_mode == "network": self.context.enable_network()
+        elif match_mode == "scan": self.context.disable_network()
+        else: raise ValueError(f"Unknown match mode: {match_mode}")
+        self.match_mode = match_mode
+
     def load_plugin(self, moniker, dotpath):
         plugin_module = __import__(dotpath, fromlist=[''])
         self._plugins[moniker]  = plugin_module
 
+    def register_plugin(self, moniker, dotpath):
+        """Registers a plugin (command) module by moniker, it is imported the first time the command is used."""
+        self._plugin_paths[moniker] = dotpath
+
+    def _get_plugin(self, moniker):
+        plugin = self._plugins.get(moniker)
+        if plugin is not None: return plugin
+
+        dotpath = self._plugin_paths.get(moniker)
+        if dotpath is None:
+            self._register_entry_points()
+            dotpath = self._plugin_paths.get(moniker)
+            if dotpath is None: return None
+
+        self.load_plugin(moniker, dotpath)
+        return self._plugins[moniker]
+
+    def _register_entry_points(self):
+        # plugins installed by other packages, under the "thoughts.plugins" entry point group
+        # (name is the moniker, value the module) - looked up once, when an unknown command is first used
+        if RulesEngine._entry_points_loaded: return
+        RulesEngine._entry_points_loaded = True
+        try:
+            import importlib.metadata
+            entry_points = importlib.metadata.entry_points()
+            if hasattr(entry_points, "select"): group = entry_points.select(group=PLUGIN_GROUP)
+            else: group = entry_points.get(PLUGIN_GROUP, [])
+        except Exception:
+            return
+        for entry_point in group:
+            self._plugin_paths.setdefault(entry_point.name, entry_point.value.split(":")[0])
+
     def clear_rules(self):
         """Clears all rules from the engine."""
 
-        self.context.rulesets = []
-        self.context.rulesets.append({"name": "default", "rules": []})
-        
+        with self.context.rules_lock.writing():
+            self.context.rulesets = []
+            self.context.rulesets.append({"name": "default", "rules": []})
+            self.context.default_ruleset = self.context.rulesets[0]
+            self.context.reindex()
+
     # add a new rule manually
     def add_rule(self, rule):
         self.context.add_rule(rule)
@@ -58,12 +137,76 @@ class RulesEngine:
             self.context._add_rules(file_rules, name, file)
             print("loaded", len(file_rules), "rules")
 
+    def replace_rules(self, rules: list, name: str, path: str = None):
+        """Replaces the rules of the named ruleset (or adds it), reindexing only the rules that changed."""
+        self.context.replace_ruleset(name, rules, path)
+
+    def remove_rules(self, name: str):
+        """Removes the named ruleset. Returns False if there is none."""
+        return self.context.remove_ruleset(name)
+
+    def reload_rules_from_file(self, file, name = None):
+        """Reloads a rules file into the ruleset loaded from it (or the named ruleset), by diffing the rules."""
+
+        if (file.startswith("\\")):
+            dir = os.path.dirname(__file__)
+            file = dir + file
+
+        with open(file) as f:
+            file_rules = list(json.load(f))
+
+        if name is None:
+            for ruleset in self.context.rulesets:
+                if "path" in ruleset and ruleset["path"] == file: name = ruleset["name"]
+        if name is None: name = str(uuid.uuid4())
+
+        self.context.replace_ruleset(name, file_rules, file)
+        self.context.log_message("RELOAD:\t%s", file, level=INFO)
+
+    def watch_rules(self, interval: float = 1.0):
+        """Starts watching the rules files loaded into the engine, reloading a file when it changes."""
+        watcher = RulesWatcher(self, interval)
+        watcher.start()
+        return watcher
+
+    def load_compiled_rules(self, path: str, files: list = None):
+        """
+        Loads a rule base compiled with compile-rules (see thoughts/snapshot.py).
+        The snapshot is checked against the rules files it was compiled from, and its rules
+        are loaded the first time they are used. When the snapshot is missing, stale or from
+        another version the rules files (files, else those it was compiled from) are loaded instead.
+        """
+
+        snapshot = RulesSnapshot.open(path) if os.path.exists(path) else None
+
+        if snapshot is not None and (snapshot.is_stale() or (files is not None and set(snapshot.sources) != set(os.path.abspath(f) for f in files))):
+            if files is None: files = snapshot.sources
+            snapshot.close()
+            snapshot = None
+
+        if snapshot is None:
+            if files is None: raise FileNotFoundError(f"No rules snapshot (of this version) at {path}")
+            self.context.log_message("SNAPSHOT:\tstale or missing, loading %s rules files", len(files), level=INFO)
+            for file in files:
+                self.load_rules_from_file(file, os.path.splitext(os.path.basename(file))[0])
+            return False
+
+        has_rules = any(len(ruleset["rules"]) > 0 for ruleset in self.context.rulesets)
+        if has_rules:
+            # merge into the rules already loaded, indexing them as they are added
+            for ruleset in snapshot.load()["rulesets"]:
+                if "path" in ruleset and ruleset["path"] is not None:
+                    self.context._add_rules(ruleset["rules"], ruleset["name"], ruleset["path"])
+        else:
+            self.context.load_snapshot(snapshot)
+        return True
+
     def load_rules_from_list(self, rules, name = None):
-        self.context.log_message("LOAD:\t" + str(len(rules)))
+        self.context.log_message("LOAD:\t%s", len(rules), level=INFO)
         self.context._add_rules(rules, name, None)
 
     def clear_arcs(self):
-        self.context.arcs = []
+        self.context.clear_arcs()
 
     def clear_context_variables(self):
         self.context.clear_variables()
@@ -74,10 +217,108 @@ class RulesEngine:
         if extract_conclusions:
             return self.extract_final_conclusions(result, include_seq)
         else:
-            return result
+            return self._streams_to_lists(result)
 
     def process_single(self, assertions):
-        return self._process(assertions, process_single=True)
+        return self._streams_to_lists(self._process(assertions, process_single=True))
+
+    def _streams_to_lists(self, tree):
+        # the tree returned has lists of conclusions, as it had before token streams
+        if tree is None: return None
+        nodes = list(tree) if type(tree) is list else [tree]
+        while len(nodes) > 0:
+            node = nodes.pop()
+            if type(node) is list:
+                nodes.extend(node)
+                continue
+            if type(node) is not dict: continue
+            conclusions = node.get("#conclusions")
+            if type(conclusions) is TokenStream:
+                conclusions = conclusions.to_list()
+                node["#conclusions"] = conclusions
+            if type(conclusions) is list: nodes.extend(conclusions)
+        return tree
+
+    def process_many(self, inputs, workers: int = None, mode: str = "thread", ordered: bool = True, include_seq = False):
+        """
+        Processes independent inputs in parallel, yielding the conclusions of each.
+
+        Each input runs against the rules loaded in this engine (shared read-only) with its own
+        copy of the items and its own arcs, so inputs can't see each other's results.
+        mode "thread" runs the inputs on a thread pool, "process" on a process pool - the rules
+        are sent to each worker process once (or inherited, where processes are forked).
+        Yields the conclusions in the order of the inputs, or (input index, conclusions)
+        pairs as they complete when ordered is False.
+        """
+
+        import concurrent.futures
+
+        if workers is None: workers = os.cpu_count() or 1
+        if workers < 1: raise ValueError("workers must be at least 1")
+
+        if mode == "thread":
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            task = self._process_forked
+        elif mode == "process":
+            executor = self._process_pool(workers)
+            task = _process_in_worker
+        else:
+            raise ValueError(f"Unknown batch mode: {mode}")
+
+        # keep a bounded number of inputs in flight so results stream back
+        # (and the caller can stop early) without queueing every input up front
+        window = workers * 2
+        pending = {}
+        inputs = iter(enumerate(inputs))
+
+        def submit():
+            for idx, assertions in inputs:
+                pending[executor.submit(task, assertions, include_seq)] = idx
+                if len(pending) >= window: return
+
+        try:
+            submit()
+            if ordered:
+                futures = {}
+                next_idx = 0
+                while len(pending) > 0:
+                    done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done: futures[pending.pop(future)] = future
+                    while next_idx in futures:
+                        yield futures.pop(next_idx).result()
+                        next_idx += 1
+                    submit()
+            else:
+                while len(pending) > 0:
+                    done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done: yield pending.pop(future), future.result()
+                    submit()
+        finally:
+            for future in pending: future.cancel()
+            executor.shutdown(wait=True)
+
+    def fork(self):
+        """Returns an engine sharing this engine's rules, with its own items and arcs."""
+        return RulesEngine(context=self.context.fork())
+
+    def _process_forked(self, assertions, include_seq = False):
+        # fork within the run, so the fork sees the same rules throughout
+        with self.context.rules_lock.reading():
+            return self.fork().process(copy.deepcopy(assertions), include_seq=include_seq)
+
+    def _process_pool(self, workers):
+        global _worker_engine
+        import concurrent.futures
+        import multiprocessing
+        mp_context = multiprocessing.get_context()
+        if mp_context.get_start_method() == "fork":
+            # forked workers inherit the engine, rules and index included
+            _worker_engine = self
+            return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                initializer=_init_worker, initargs=(None, None))
+        rulesets = [{"name": ruleset["name"], "rules": ruleset["rules"], "path": ruleset.get("path")} for ruleset in self.context.rulesets]
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+            initializer=_init_worker, initargs=(rulesets, self.context.items))
 
     def _add_sequence_info(self, assertions):
         for pos, assertion in enumerate(assertions):
@@ -87,6 +328,7 @@ class RulesEngine:
 
     def _wrap_literals_in_assert(self, assertions):
         if assertions is None: return None
+        if type(assertions) is TokenStream: return assertions
         for i, assertion in enumerate(assertions):
             if type(assertion) is not dict and type(assertion) is not list:
                 assertions[i] = {"#assert": assertion}
@@ -97,6 +339,39 @@ class RulesEngine:
         # if nothing to process, then done
         if assertions is None: return None
 
+        assertions = self._prepare(assertions)
+
+        # continue processing until no more assertions generated
+        # or if process_single is True and conclusions were drawn
+        for assertion, conclusions, depth in self._run_agenda(assertions):
+            if process_single == True:
+                if conclusions is not None: break
+     
+        # return the assertion trees
+        return assertions
+
+    def iter_process(self, assertions, keep_arcs = False, include_seq = False):
+        """
+        Processes the assertions, yielding the final conclusions as they are derived
+        (the same conclusions, in the same order, as process returns).
+        The assertion tree is not kept and the conclusions are not copied - copy them before changing them.
+        Stop iterating to stop processing. The rules aren't locked between conclusions: they can be
+        replaced (or reloaded) while the generator is suspended, and the assertions processed after
+        that use the new rules.
+        """
+
+        if keep_arcs == False: self.clear_arcs()
+        if assertions is None: return
+
+        assertions = self._prepare(assertions)
+
+        for assertion, conclusions, depth in self._run_agenda(assertions, keep_tree=False, lock_per_step=True):
+            if depth == 1: continue
+            if conclusions is None: yield self._leaf_conclusion(assertion, include_seq, unwrap=False)
+            elif len(conclusions) == 0: yield self._leaf_conclusion(assertion, include_seq, unwrap=True)
+
+    def _prepare(self, assertions):
+
         # convert to a list
         if type(assertions) is not list: assertions = [assertions]
 
@@ -107,27 +382,107 @@ class RulesEngine:
         # add sequence information
         assertions = self._add_sequence_info(assertions)
 
-        # continue processing until no more assertions generated
-        # or if process_single is True and conclusions were drawn
-        while True:
-            assertion = self._find_next(assertions)
-            if assertion is None: break
-            conclusions = self._process_single(assertion)
-            assertion["#conclusions"] = conclusions
-            if process_single == True:
-                if conclusions is not None: break
-     
-        # return the assertion trees
         return assertions
 
-    def _find_next(self, assertions):
-        for assertion in assertions:
-            if "#conclusions" not in assertion: 
-                return assertion
-            else:
-                if assertion["#conclusions"] is not None:
-                    next = self._find_next(assertion["#conclusions"])
-                    if next is not None: return next
+    def _run_agenda(self, assertions, keep_tree = True, lock_per_step = False):
+        """
+        Processes the assertions and their conclusions, yielding (assertion, conclusions, depth) as each is processed.
+        The worklist visits the assertion tree depth-first, each assertion's conclusions are processed
+        before the assertions that follow it. With keep_tree the conclusions are kept on each assertion.
+        The rules can't change during the run - or, with lock_per_step, while an assertion is processed
+        (the lock isn't held while the caller has the yielded value).
+        Raises AgendaDepthError if conclusions nest deeper than max_depth.
+        """
+        stats = self._start_stats()
+        worklist = [(assertion, 1) for assertion in reversed(assertions)]
+        rules_lock = self.context.rules_lock
+        run_lock = contextlib.nullcontext() if lock_per_step else rules_lock.reading()
+        step_lock = rules_lock.reading if lock_per_step else contextlib.nullcontext
+        try:
+            # the rules can't change part way through a run
+            with run_lock:
+                while len(worklist) > 0:
+                    with step_lock():
+                        assertion, depth = worklist.pop()
+                        if depth > self.max_depth:
+                            raise AgendaDepthError("conclusions nested deeper than max_depth ({}) - "
+                                                   "do rules keep re-triggering each other?".format(self.max_depth))
+                        if type(assertion) is GeneratorType:
+                            # the rest of a token stream - its facts are built one at a time
+                            fact = next(assertion, None)
+                            if fact is None: continue
+                            worklist.append((assertion, depth))
+                            assertion = fact
+                        processed = "#conclusions" not in assertion
+                        if processed:
+                            conclusions = self._process_single(assertion)
+                            if keep_tree: assertion["#conclusions"] = conclusions
+                            self._count(stats, len(worklist), depth)
+                        else:
+                            conclusions = assertion["#conclusions"]
+                        if type(conclusions) is TokenStream:
+                            worklist.append((conclusions.nodes(keep=keep_tree), depth + 1))
+                        elif conclusions is not None:
+                            worklist.extend((conclusion, depth + 1) for conclusion in reversed(conclusions))
+                    if processed: yield assertion, conclusions, depth
+        finally:
+            self._count(stats, len(worklist), 0, final=True)
+
+    def set_monitor(self, monitor, every: int = 100):
+        """
+        Calls monitor(stats) after every `every` assertions processed, and when processing completes.
+        The stats dict has: processed (assertions so far), agenda (assertions waiting), max_agenda,
+        depth (of the last assertion in the conclusion tree), elapsed (seconds) and facts_per_sec.
+        Pass None to stop monitoring. The stats of the last run are also kept in engine.stats.
+        """
+        if every < 1: raise ValueError("every must be at least 1")
+        self._monitor = monitor
+        self._monitor_every = every
+
+    def enable_profiler(self):
+        """
+        Starts counting, per rule, the evaluations, unifications, firings, arcs created and time spent
+        (see thoughts.profiler). Returns the profiler - its counters carry on if it was already enabled.
+        Forked contexts (process_many) are not profiled.
+        """
+        if self.context.profiler is None: self.context.profiler = RuleProfiler(self.context)
+        return self.context.profiler
+
+    def disable_profiler(self):
+        """Stops profiling. Returns the profiler with the counters collected, or None."""
+        profiler = self.context.profiler
+        self.context.profiler = None
+        return profiler
+
+    def enable_unification_cache(self, size: int = 10000):
+        """
+        Caches the results of unifying assertions with rule patterns (and #lookup targets with items),
+        keeping the last `size` distinct results. Returns the cache - cache.stats() has its hit rate.
+        """
+        if self.context.unification_cache is None or self.context.unification_cache.size != size:
+            self.context.unification_cache = UnificationCache(size)
+        return self.context.unification_cache
+
+    def disable_unification_cache(self):
+        self.context.unification_cache = None
+
+    def _start_stats(self):
+        self.stats = {"processed": 0, "agenda": 0, "max_agenda": 0, "depth": 0, "elapsed": 0.0, "facts_per_sec": 0.0}
+        self._started = time.perf_counter()
+        return self.stats
+
+    def _count(self, stats, agenda, depth, final = False):
+        if not final:
+            stats["processed"] += 1
+            stats["agenda"] = agenda
+            stats["depth"] = depth
+            if agenda > stats["max_agenda"]: stats["max_agenda"] = agenda
+        report = self._monitor is not None and stats["processed"] % self._monitor_every == 0
+        if final or report:
+            elapsed = time.perf_counter() - self._started
+            stats["elapsed"] = elapsed
+            stats["facts_per_sec"] = stats["processed"] / elapsed if elapsed > 0 else 0.0
+            if self._monitor is not None: self._monitor(stats)
 
     # def process_tree(self, assertions):
     
@@ -230,7 +585,7 @@ class RulesEngine:
     def _process_single(self, assertion):
 
         self.context.log_message("")
-        self.context.log_message("ASSERT:\t" + str(assertion))
+        self.context.log_message("ASSERT:\t%s", assertion)
 
         if (type(assertion) is str):
             if (assertion.startswith("{")):
@@ -261,36 +616,14 @@ class RulesEngine:
                 if "#conclusions" in node and node["#conclusions"] is not None:
                     if len(node["#conclusions"]) == 0 and level > 1:
                     # if len(node["#conclusions"]) == 0:
-
-                        new_node = copy.deepcopy(node)
-                        del new_node["#conclusions"]
-
-                        if include_seq == False and "#seq" in new_node: 
-                            del new_node["#seq"]
-                            del new_node["#seq-start"]
-                            del new_node["#seq-end"]
-                    
-                        if include_seq == False and "#assert" in new_node:
-                            if type(new_node["#assert"]) is not dict and type(new_node["#assert"]) is not list:
-                                new_node = new_node["#assert"]
-                        
-                        leafs.append(new_node)
+                        leafs.append(self._leaf_conclusion(copy.deepcopy(node), include_seq, unwrap=True))
 
                     for n in node["#conclusions"]:
                         _get_leaf_nodes(n, level + 1)
 
                 elif level > 1:
                 # else:    
-                    new_node = copy.deepcopy(node)
-                    if "#conclusions" in new_node and new_node["#conclusions"] is None:
-                        del new_node["#conclusions"]
-                        
-                    if include_seq == False and "#seq" in new_node: 
-                        del new_node["#seq"]
-                        del new_node["#seq-start"]
-                        del new_node["#seq-end"]
-                        
-                    leafs.append(new_node)
+                    leafs.append(self._leaf_conclusion(copy.deepcopy(node), include_seq, unwrap=False))
                 
         level = 1
 
@@ -299,6 +632,21 @@ class RulesEngine:
 
         return leafs
 
+    def _leaf_conclusion(self, node, include_seq = False, unwrap = True):
+        # strips the tree and sequence bookkeeping from a leaf of the assertion tree
+        leaf = {key: value for key, value in node.items() if key != "#conclusions"}
+
+        if include_seq == False and "#seq" in leaf: 
+            del leaf["#seq"]
+            del leaf["#seq-start"]
+            del leaf["#seq-end"]
+    
+        if unwrap and include_seq == False and "#assert" in leaf:
+            if type(leaf["#assert"]) is not dict and type(leaf["#assert"]) is not list:
+                leaf = leaf["#assert"]
+
+        return leaf
+
     # def _process_assertion(self, assertion):
         
     #     result = []
@@ -361,7 +709,7 @@ class RulesEngine:
     def run_console(self):
         """ 
         Runs a console input and output loop, asserting the input.
-        Use '#log' to output the engine log.
+        Use '#log' to output the engine log (the console records the DEBUG messages tracing each run).
         Use '#items' to output the items from the engine context.
         Use '#clear-arcs' to clear the active rules (arcs).
         Use '#exit' to exit the console loop.
@@ -369,6 +717,10 @@ class RulesEngine:
 
         loop = True
 
+        # trace the runs for #log (the step by step messages are at DEBUG)
+        log_level = self.context.log.level
+        self.context.log.level = DEBUG
+
         while loop:
 
             try:
@@ -380,7 +732,7 @@ class RulesEngine:
                     print("")
                     print("log:")
                     print("------------------------")
-                    for item in self.log: print(item)
+                    for item in self.context.log: print(item)
                     continue
 
                 elif (assertion == "#items"):
@@ -401,28 +753,31 @@ class RulesEngine:
             except:
                 print("Error")
 
+        self.context.log.level = log_level
+
     def _load_plugins(self):
-        self.load_plugin("#assert", "thoughts.commands.assert_command")
-        self.load_plugin("#output", "thoughts.commands.output")
-        self.load_plugin("#prompt", "thoughts.commands.prompt") 
-        self.load_plugin("#read-rss", "thoughts.commands.read_rss")    
-        self.load_plugin("#load-json", "thoughts.commands.load_json")  
-        self.load_plugin("#save-json", "thoughts.commands.save_json") 
-        self.load_plugin("#tokenize", "thoughts.commands.tokenize") 
-        self.load_plugin("#lookup", "thoughts.commands.lookup")
-        self.load_plugin("#random", "thoughts.commands.random")
-        self.load_plugin("#store", "thoughts.commands.store")
-        self.load_plugin("#replace", "thoughts.commands.replace")
-        self.load_plugin("#switch", "thoughts.commands.switch")
-        self.load_plugin("#date", "thoughts.commands.date")
-        self.load_plugin("#format", "thoughts.commands.format")
-        self.load_plugin("#first", "thoughts.commands.first")
-        self.load_plugin("#rest", "thoughts.commands.rest")
+        # registered only - each is imported when its command is first used
+        self.register_plugin("#assert", "thoughts.commands.assert_command")
+        self.register_plugin("#output", "thoughts.commands.output")
+        self.register_plugin("#prompt", "thoughts.commands.prompt") 
+        self.register_plugin("#read-rss", "thoughts.commands.read_rss")    
+        self.register_plugin("#load-json", "thoughts.commands.load_json")  
+        self.register_plugin("#save-json", "thoughts.commands.save_json") 
+        self.register_plugin("#tokenize", "thoughts.commands.tokenize") 
+        self.register_plugin("#lookup", "thoughts.commands.lookup")
+        self.register_plugin("#random", "thoughts.commands.random")
+        self.register_plugin("#store", "thoughts.commands.store")
+        self.register_plugin("#replace", "thoughts.commands.replace")
+        self.register_plugin("#switch", "thoughts.commands.switch")
+        self.register_plugin("#date", "thoughts.commands.date")
+        self.register_plugin("#format", "thoughts.commands.format")
+        self.register_plugin("#first", "thoughts.commands.first")
+        self.register_plugin("#rest", "thoughts.commands.rest")
 
     def _call_plugin(self, moniker, assertion):
 
-        if moniker in self._plugins:       
-            plugin = self._plugins[moniker]
+        plugin = self._get_plugin(moniker)
+        if plugin is not None:
             new_items = plugin.process(assertion, self.context)
             return new_items
 
@@ -457,3 +812,20 @@ class RulesEngine:
             if key == "#seq": continue
             if key == "#seq-idx": continue
             if key.startswith("#"): return key
+
+
+# the engine each batch worker process runs its inputs against
+_worker_engine = None
+
+def _init_worker(rulesets, items):
+    global _worker_engine
+    if rulesets is None: return # inherited from the parent
+    engine = RulesEngine()
+    engine.context.rulesets = rulesets
+    engine.context.default_ruleset = rulesets[0]
+    engine.context.items = items
+    engine.context.reindex()
+    _worker_engine = engine
+
+def _process_in_worker(assertions, include_seq = False):
+    return _worker_engine._process_forked(assertions, include_seq)
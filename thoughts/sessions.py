@@ -0,0 +1,826 @@
+from abc import ABC, abstractmethod
+from array import array
+import atexit
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import weakref
+from time import time
+
+SNAPSHOT_FILE = "items.json"
+JOURNAL_FILE = "journal.jsonl"
+MESSAGES_FILE = "messages.jsonl"
+MESSAGES_INDEX_FILE = "messages.idx"
+
+def apply_change(items: dict, op: str, key, value):
+    """Applies a change to an item the way Context does ("set", "append" or "update")."""
+    if op == "set":
+        items[key] = value
+    elif op == "append":
+        if key not in items: items[key] = []
+        if type(items[key]) is not list: items[key] = [items[key]]  # listify it
+        items[key].append(value)
+    elif op == "update":
+        if key in items and isinstance(items[key], dict) and isinstance(value, dict): items[key].update(value)
+        else: items[key] = value
+    else:
+        raise ValueError("unknown item change: " + str(op))
+
+class ItemJournal:
+    """
+    The items of a session, kept as a snapshot (items.json) and an append-only journal of the changes
+    made since (journal.jsonl, one compact [op, key, value] record per line) - so a change costs
+    what the change is, not what the items are. After compact_after records the items are compacted
+    into a new snapshot and the journal starts over.
+
+    Loading reads the snapshot, the one-file-per-item files older sessions wrote, then replays the
+    journal. A last record cut short (no newline - the process stopped mid-write) is dropped; a
+    record that can't be read anywhere else raises ValueError rather than losing the ones after it.
+    """
+
+    def __init__(self, directory: str, encoder = None, object_hook = None, compact_after: int = 1000):
+        if compact_after < 1: raise ValueError("compact_after must be at least 1")
+        self.directory = directory
+        self.encoder = encoder
+        self.object_hook = object_hook
+        self.compact_after = compact_after
+        self.records = 0  # records in the journal since the last snapshot
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, SNAPSHOT_FILE)
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.directory, JOURNAL_FILE)
+
+    def exists(self):
+        return os.path.exists(self.directory)
+
+    def record(self, op: str, key, value):
+        """Appends a change to the journal."""
+        self.write([self.encode(op, key, value)])
+
+    def encode(self, op: str, key, value):
+        return json.dumps([op, key, value], cls=self.encoder, separators=(",", ":")) + "\n"
+
+    def write(self, lines: list):
+        """Appends encoded changes to the journal."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+        self.records += len(lines)
+
+    def needs_compaction(self):
+        return self.records >= self.compact_after
+
+    def load(self):
+        """Returns the items - the snapshot, the single item files and the journal replayed over them."""
+        items = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                items = json.load(f, object_hook=self.object_hook)
+
+        for filename in self._item_files():
+            key = filename[:-5]  # remove the .json extension
+            with open(os.path.join(self.directory, filename), "r") as f:
+                item = json.load(f, object_hook=self.object_hook)
+                items[key] = item[key]
+
+        self.records = 0
+        if not os.path.exists(self.journal_path): return items
+        with open(self.journal_path, "rb+") as f:
+            offset = 0
+            for line_no, line in enumerate(f, 1):
+                if not line.endswith(b"\n"):
+                    # cut short - drop it, so the next record starts on a line of its own
+                    f.truncate(offset)
+                    break
+                try: op, key, value = json.loads(line, object_hook=self.object_hook)
+                except (ValueError, TypeError) as error:
+                    raise ValueError("corrupt record on line {} of {}: {}".format(line_no, self.journal_path, error))
+                apply_change(items, op, key, value)
+                offset += len(line)
+                self.records += 1
+        return items
+
+    def compact(self, items: dict):
+        """Writes the items as the new snapshot (replacing the old one at once) and empties the journal."""
+        self.write_snapshot(self.encode_snapshot(items))
+
+    def encode_snapshot(self, items: dict):
+        return json.dumps(items, indent=4, cls=self.encoder)
+
+    def write_snapshot(self, text: str):
+        os.makedirs(self.directory, exist_ok=True)
+        temp = self.snapshot_path + ".tmp"
+        with open(temp, "w") as f:
+            f.write(text)
+        os.replace(temp, self.snapshot_path)
+
+        # the snapshot has everything the journal and the single item files had
+        for filename in self._item_files(): os.remove(os.path.join(self.directory, filename))
+        if os.path.exists(self.journal_path): os.remove(self.journal_path)
+        self.records = 0
+
+    def _item_files(self):
+        if not os.path.exists(self.directory): return []
+        return [filename for filename in os.listdir(self.directory) if filename.endswith(".json") and filename != SNAPSHOT_FILE]
+
+class MessageLog:
+    """
+    The messages of a session in a single JSON-lines file (messages.jsonl), with an index of the
+    offset each message starts at (messages.idx, 8 bytes per message) - so a page of messages, or the
+    last few (peek_messages), are read without reading the ones before them.
+
+    The index is checked against the end of the log when first used, and rebuilt if a write to it
+    was lost. A last message cut short is dropped.
+    """
+
+    def __init__(self, directory: str, encoder = None, object_hook = None):
+        self.directory = directory
+        self.encoder = encoder
+        self.object_hook = object_hook
+        self._offsets = None  # loaded when first used
+        self._size = 0        # bytes in the log
+
+    @property
+    def log_path(self):
+        return os.path.join(self.directory, MESSAGES_FILE)
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, MESSAGES_INDEX_FILE)
+
+    def exists(self):
+        return os.path.exists(self.log_path)
+
+    def append(self, message):
+        self.write([self.encode(message)])
+
+    def encode(self, message):
+        return (json.dumps(message, cls=self.encoder, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def write(self, lines: list):
+        """Appends encoded messages to the log."""
+        offsets = self._index()
+        added = array("q")
+        size = self._size
+        for line in lines:
+            added.append(size)
+            size += len(line)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.log_path, "ab") as f:
+            f.write(b"".join(lines))
+        with open(self.index_path, "ab") as f:
+            f.write(added.tobytes())
+        # (only readable once written)
+        offsets.extend(added)
+        self._size = size
+
+    def read(self, start: int = 0, stop: int = None):
+        """Returns the messages from start up to stop (Python slice bounds)."""
+        offsets = self._index()
+        start, stop, _ = slice(start, stop).indices(len(offsets))
+        if start >= stop: return []
+        end = offsets[stop] if stop < len(offsets) else self._size
+        with open(self.log_path, "rb") as f:
+            f.seek(offsets[start])
+            data = f.read(end - offsets[start])
+        return [json.loads(line, object_hook=self.object_hook) for line in data.splitlines()]
+
+    def peek_messages(self, num: int = 1):
+        """Returns the last num messages, reading only those."""
+        if num <= 0: return []
+        return self.read(max(0, len(self) - num))
+
+    def __len__(self):
+        return len(self._index())
+
+    def _index(self):
+        if self._offsets is not None: return self._offsets
+        offsets = array("q")
+        size = os.path.getsize(self.log_path) if self.exists() else 0
+        if size > 0 and os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+            offsets.frombytes(data[:len(data) - len(data) % offsets.itemsize])
+
+        # the last indexed message must be the last line of the log
+        if size == 0 and os.path.exists(self.index_path): os.remove(self.index_path)
+        if size > 0 and not self._ends_log(offsets, size):
+            offsets, size = self._rebuild()
+        self._offsets, self._size = offsets, size
+        return offsets
+
+    def _ends_log(self, offsets, size):
+        if len(offsets) == 0 or offsets[-1] >= size: return False
+        with open(self.log_path, "rb") as f:
+            f.seek(offsets[-1])
+            rest = f.read()
+        return rest.endswith(b"\n") and rest.count(b"\n") == 1
+
+    def _rebuild(self):
+        offsets = array("q")
+        size = 0
+        with open(self.log_path, "rb+") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    f.truncate(size)  # cut short
+                    break
+                offsets.append(size)
+                size += len(line)
+        with open(self.index_path, "wb") as f:
+            f.write(offsets.tobytes())
+        return offsets, size
+
+class WriteBehind:
+    """
+    Writes a session's changes from a background thread, so changing an item or pushing a message
+    doesn't wait on the disk. Changes are queued and written every flush_interval seconds, or as soon
+    as batch_size of them are waiting. Changes to a key that is already waiting are coalesced: the key
+    is written once, with its value at the time of writing. flush writes what is waiting now, close
+    stops the thread (after a last flush) - and runs when the program exits, if it wasn't called.
+    Neither the thread nor the exit hook keep the writer alive: a writer dropped without close is
+    collected with its context, losing the changes still waiting.
+
+    Writes go to the item journal and message log as before - appended records, with snapshots
+    written to a temp file and renamed - so a crash loses at most the changes still waiting.
+    The lock is held while the items change and while the waiting changes are encoded.
+    An error on the thread is raised by the next flush or close.
+    """
+
+    SET = object()  # a key changed more than once - write its whole value
+
+    def __init__(self, journal: ItemJournal, message_log: MessageLog, get_items, lock = None,
+                 flush_interval: float = 1.0, batch_size: int = 100):
+        if flush_interval <= 0: raise ValueError("flush_interval must be positive")
+        if batch_size < 1: raise ValueError("batch_size must be at least 1")
+        self.journal = journal
+        self.message_log = message_log
+        self.get_items = get_items  # returns the items (for whole values and snapshots)
+        self.lock = lock if lock is not None else threading.RLock()
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.error = None
+        self._changes = {}   # key -> (op, value), or SET
+        self._messages = []
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=_run_writer, args=(weakref.ref(self), self._wake, flush_interval),
+                                        name="session-writer", daemon=True)
+        self._thread.start()
+        # the thread is a daemon - write what is waiting when the program exits without close
+        _open_writers.add(self)
+
+    def record(self, op: str, key, value):
+        with self.lock:
+            self._changes[key] = WriteBehind.SET if key in self._changes else (op, value)
+            if self.pending() >= self.batch_size: self._wake.set()
+
+    def push(self, message):
+        with self.lock:
+            self._messages.append(message)
+            if self.pending() >= self.batch_size: self._wake.set()
+
+    def pending(self):
+        return len(self._changes) + len(self._messages)
+
+    def flush(self, compact: bool = False):
+        """Writes the waiting changes now (with compact, as a snapshot of the items)."""
+        self._write(compact)
+        self._raise_error()
+
+    def close(self):
+        _open_writers.discard(self)
+        if not self._closed:
+            self._closed = True
+            self._wake.set()
+            self._thread.join()
+        self.flush()
+
+    def _raise_error(self):
+        error, self.error = self.error, None
+        if error is not None: raise error
+
+    def _write(self, compact: bool = False):
+        with self._io_lock:
+            journal = self.journal
+            snapshot = None
+            with self.lock:
+                changes, self._changes = self._changes, {}
+                messages, self._messages = self._messages, []
+                if len(changes) > 0 or compact:
+                    items = self.get_items()
+                    if compact or journal.records + len(changes) >= journal.compact_after:
+                        snapshot = journal.encode_snapshot(items)  # has the changes
+                    else:
+                        lines = []
+                        for key, change in changes.items():
+                            op, value = ("set", items[key]) if change is WriteBehind.SET else change
+                            lines.append(journal.encode(op, key, value))
+                message_lines = [self.message_log.encode(message) for message in messages]
+
+            # the disk writes happen outside the lock
+            if snapshot is not None: journal.write_snapshot(snapshot)
+            elif len(changes) > 0: journal.write(lines)
+            if len(message_lines) > 0: self.message_log.write(message_lines)
+
+_open_writers = weakref.WeakSet()
+
+@atexit.register
+def _close_open_writers():
+    for writer in list(_open_writers): writer.close()
+
+def _run_writer(writer_ref, wake: threading.Event, flush_interval: float):
+    # the writer thread only holds the writer while writing, so a dropped writer can be collected
+    while True:
+        wake.wait(flush_interval)
+        wake.clear()
+        writer = writer_ref()
+        if writer is None or writer._closed: return
+        try: writer._write()
+        except Exception as error: writer.error = error
+        del writer
+
+class PagedMessages:
+    """
+    The messages of a session opened lazily - reads like the list of messages, but reads the logged
+    ones from the message log a page at a time as they are used. Messages pushed (or popped) since
+    the session was opened are kept in memory, as the list was.
+    """
+
+    def __init__(self, log: MessageLog, page_size: int = 100):
+        if page_size < 1: raise ValueError("page_size must be at least 1")
+        self.log = log
+        self.page_size = page_size
+        self.logged = len(log)  # logged messages still in the sequence
+        self.added = []         # messages appended since
+        self._pages = {}        # page no -> messages
+
+    def _logged(self, idx: int):
+        page_no = idx // self.page_size
+        page = self._pages.get(page_no)
+        if page is None:
+            start = page_no * self.page_size
+            page = self.log.read(start, start + self.page_size)
+            self._pages[page_no] = page
+        return page[idx % self.page_size]
+
+    def __len__(self):
+        return self.logged + len(self.added)
+
+    def __getitem__(self, idx):
+        if type(idx) is slice:
+            start, stop, step = idx.indices(len(self))
+            if step != 1: return [self[i] for i in range(start, stop, step)]
+            # read the logged part of the slice in one go, bypassing the pages
+            logged = self.log.read(start, min(stop, self.logged)) if start < self.logged else []
+            return logged + self.added[max(start - self.logged, 0):max(stop - self.logged, 0)]
+        if idx < 0: idx += len(self)
+        if idx < 0 or idx >= len(self): raise IndexError("message index out of range")
+        if idx >= self.logged: return self.added[idx - self.logged]
+        return self._logged(idx)
+
+    def __iter__(self):
+        for idx in range(len(self)): yield self[idx]
+
+    def append(self, message):
+        self.added.append(message)
+
+    def pop(self, idx: int = -1):
+        if idx != -1 and idx != len(self) - 1: raise ValueError("only the last message can be popped")
+        if len(self.added) > 0: return self.added.pop()
+        if self.logged == 0: raise IndexError("pop from empty messages")
+        message = self[self.logged - 1]
+        self.logged -= 1
+        self._pages.pop(self.logged // self.page_size, None)
+        return message
+
+    def __repr__(self):
+        return "PagedMessages({} messages)".format(len(self))
+
+def legacy_message_files(directory: str):
+    """The one-file-per-message files (log-<id>.json) older sessions wrote, in message order."""
+    if not os.path.exists(directory): return []
+    return sorted(filename for filename in os.listdir(directory) if filename.endswith(".json"))
+
+class SessionStore(ABC):
+    """
+    Where sessions are saved. A store keeps each session's manifest, its item journal and its
+    message log (objects with the interface of ItemJournal and MessageLog), and lists the sessions.
+    """
+
+    @abstractmethod
+    def exists(self, session_id: str):
+        pass
+
+    @abstractmethod
+    def read_manifest(self, session_id: str):
+        pass
+
+    @abstractmethod
+    def write_manifest(self, session_id: str, manifest: dict):
+        """Saves the manifest - which only counts as saving to the session (see recent_sessions) when it creates it."""
+        pass
+
+    @abstractmethod
+    def item_journal(self, session_id: str, encoder = None, object_hook = None):
+        pass
+
+    @abstractmethod
+    def message_log(self, session_id: str, encoder = None, object_hook = None):
+        pass
+
+    @abstractmethod
+    def delete_session(self, session_id: str):
+        pass
+
+    @abstractmethod
+    def session_ids(self):
+        """Returns the ids of the saved sessions, sorted."""
+        pass
+
+    @abstractmethod
+    def recent_sessions(self, count: int = None):
+        """Returns the ids of the (count) sessions saved to most recently, the most recent first."""
+        pass
+
+    def legacy_messages(self, session_id: str, object_hook = None):
+        """Messages saved in an older layout, which come before the message log's."""
+        return []
+
+class FileSessionStore(SessionStore):
+    """Sessions saved as directories - <directory>/<session id>/manifest.json, items/ and messages/."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def session_path(self, session_id: str):
+        return os.path.join(self.directory, session_id)
+
+    def exists(self, session_id: str):
+        return os.path.exists(self.session_path(session_id))
+
+    def read_manifest(self, session_id: str):
+        with open(os.path.join(self.session_path(session_id), "manifest.json"), "r") as f:
+            return json.load(f)
+
+    def write_manifest(self, session_id: str, manifest: dict):
+        os.makedirs(self.session_path(session_id), exist_ok=True)
+        with open(os.path.join(self.session_path(session_id), "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=4)
+
+    def item_journal(self, session_id: str, encoder = None, object_hook = None):
+        return ItemJournal(os.path.join(self.session_path(session_id), "items"), encoder, object_hook)
+
+    def message_log(self, session_id: str, encoder = None, object_hook = None):
+        return MessageLog(os.path.join(self.session_path(session_id), "messages"), encoder, object_hook)
+
+    def delete_session(self, session_id: str):
+        if self.exists(session_id): shutil.rmtree(self.session_path(session_id))
+
+    def session_ids(self):
+        if not os.path.exists(self.directory): return []
+        return sorted(name for name in os.listdir(self.directory) if os.path.isdir(os.path.join(self.directory, name)))
+
+    def recent_sessions(self, count: int = None):
+        # by when each session's items or messages last changed (its newest file but the manifest,
+        # which is written again whenever the session is opened)
+        updated = {session_id: self._updated(session_id) for session_id in self.session_ids()}
+        recent = sorted(updated, key=lambda session_id: -updated[session_id])
+        return recent if count is None else recent[:count]
+
+    def _updated(self, session_id: str):
+        session_path = self.session_path(session_id)
+        latest = None
+        for path, _, files in os.walk(session_path):
+            for filename in files:
+                if path == session_path and filename == "manifest.json": continue
+                updated = os.path.getmtime(os.path.join(path, filename))
+                if latest is None or updated > latest: latest = updated
+        if latest is None:
+            # nothing saved to it yet - when it was created
+            manifest = os.path.join(session_path, "manifest.json")
+            latest = os.path.getmtime(manifest) if os.path.exists(manifest) else 0.0
+        return latest
+
+    def legacy_messages(self, session_id: str, object_hook = None):
+        directory = os.path.join(self.session_path(session_id), "messages")
+        messages = []
+        for filename in legacy_message_files(directory):
+            with open(os.path.join(directory, filename), "r") as f:
+                messages.append(json.load(f, object_hook=object_hook))
+        return messages
+
+class SqliteSessionStore(SessionStore):
+    """
+    Many sessions in one SQLite database (in WAL mode, so readers don't wait on the writer).
+    Sessions are indexed by id and by when they were last saved to, and messages by session and
+    position - listing the recent sessions, or reading a page of a session's messages, is a query.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, manifest TEXT, created REAL, updated REAL);
+        CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+        CREATE TABLE IF NOT EXISTS item_snapshots (session_id TEXT PRIMARY KEY, snapshot TEXT);
+        CREATE TABLE IF NOT EXISTS item_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, record TEXT);
+        CREATE INDEX IF NOT EXISTS item_changes_session ON item_changes (session_id, seq);
+        CREATE TABLE IF NOT EXISTS messages (session_id TEXT, idx INTEGER, time REAL, message TEXT, PRIMARY KEY (session_id, idx));
+        CREATE INDEX IF NOT EXISTS messages_time ON messages (session_id, time);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path) != "": os.makedirs(os.path.dirname(path), exist_ok=True)
+        # shared with the write-behind thread, so guarded by the lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SqliteSessionStore.SCHEMA)
+            self.connection.commit()
+
+    def query(self, sql: str, args = ()):
+        with self.lock:
+            return self.connection.execute(sql, args).fetchall()
+
+    def execute(self, statements: list):
+        """Runs (sql, args) statements in one transaction."""
+        with self.lock, self.connection:
+            for sql, args in statements: self.connection.execute(sql, args)
+
+    def touch(self, session_id: str):
+        # the statement marking a session as saved to now
+        now = time()
+        return ("INSERT INTO sessions (session_id, created, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET updated = excluded.updated", (session_id, now, now))
+
+    def exists(self, session_id: str):
+        return len(self.query("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,))) > 0
+
+    def read_manifest(self, session_id: str):
+        rows = self.query("SELECT manifest FROM sessions WHERE session_id = ?", (session_id,))
+        return json.loads(rows[0][0]) if len(rows) > 0 and rows[0][0] is not None else None
+
+    def write_manifest(self, session_id: str, manifest: dict):
+        # (only a new session's updated time is set - the manifest isn't what was saved to)
+        now = time()
+        self.execute([("INSERT INTO sessions (session_id, manifest, created, updated) VALUES (?, ?, ?, ?) "
+                       "ON CONFLICT(session_id) DO UPDATE SET manifest = excluded.manifest",
+                       (session_id, json.dumps(manifest), now, now))])
+
+    def item_journal(self, session_id: str, encoder = None, object_hook = None):
+        return SqliteItemJournal(self, session_id, encoder, object_hook)
+
+    def message_log(self, session_id: str, encoder = None, object_hook = None):
+        return SqliteMessageLog(self, session_id, encoder, object_hook)
+
+    def delete_session(self, session_id: str):
+        self.execute([("DELETE FROM " + table + " WHERE session_id = ?", (session_id,))
+                      for table in ("sessions", "item_snapshots", "item_changes", "messages")])
+
+    def session_ids(self):
+        return [row[0] for row in self.query("SELECT session_id FROM sessions ORDER BY session_id")]
+
+    def recent_sessions(self, count: int = None):
+        rows = self.query("SELECT session_id FROM sessions ORDER BY updated DESC LIMIT ?", (-1 if count is None else count,))
+        return [row[0] for row in rows]
+
+    def close(self):
+        with self.lock: self.connection.close()
+
+class SqliteItemJournal(ItemJournal):
+    """A session's item journal in a SqliteSessionStore - the snapshot and the changes are rows."""
+
+    def __init__(self, store: SqliteSessionStore, session_id: str, encoder = None, object_hook = None, compact_after: int = 1000):
+        super().__init__(None, encoder, object_hook, compact_after)
+        self.store = store
+        self.session_id = session_id
+
+    def exists(self):
+        return self.store.exists(self.session_id)
+
+    def write(self, lines: list):
+        self.store.execute([self.store.touch(self.session_id)] +
+                           [("INSERT INTO item_changes (session_id, record) VALUES (?, ?)", (self.session_id, line)) for line in lines])
+        self.records += len(lines)
+
+    def load(self):
+        rows = self.store.query("SELECT snapshot FROM item_snapshots WHERE session_id = ?", (self.session_id,))
+        items = json.loads(rows[0][0], object_hook=self.object_hook) if len(rows) > 0 else {}
+        changes = self.store.query("SELECT record FROM item_changes WHERE session_id = ? ORDER BY seq", (self.session_id,))
+        for (line,) in changes:
+            op, key, value = json.loads(line, object_hook=self.object_hook)
+            apply_change(items, op, key, value)
+        self.records = len(changes)
+        return items
+
+    def write_snapshot(self, text: str):
+        # replaces the snapshot and drops the changes it has in one transaction
+        self.store.execute([self.store.touch(self.session_id),
+                            ("INSERT OR REPLACE INTO item_snapshots (session_id, snapshot) VALUES (?, ?)", (self.session_id, text)),
+                            ("DELETE FROM item_changes WHERE session_id = ?", (self.session_id,))])
+        self.records = 0
+
+class SqliteMessageLog(MessageLog):
+    """A session's message log in a SqliteSessionStore - a row per message, keyed by its position."""
+
+    def __init__(self, store: SqliteSessionStore, session_id: str, encoder = None, object_hook = None):
+        super().__init__(None, encoder, object_hook)
+        self.store = store
+        self.session_id = session_id
+        self._count = None
+
+    def exists(self):
+        return len(self) > 0
+
+    def write(self, lines: list):
+        # each message goes after the session's last one in the table, not after the count seen here -
+        # another context may have written to the session since
+        now = time()
+        self.store.execute([self.store.touch(self.session_id)] +
+                           [("INSERT INTO messages (session_id, idx, time, message) "
+                             "SELECT ?, COALESCE(MAX(idx), -1) + 1, ?, ? FROM messages WHERE session_id = ?",
+                             (self.session_id, now, line.decode("utf-8"), self.session_id)) for line in lines])
+        self._count = None  # counted again when next needed
+
+    def read(self, start: int = 0, stop: int = None):
+        start, stop, _ = slice(start, stop).indices(len(self))
+        if start >= stop: return []
+        rows = self.store.query("SELECT message FROM messages WHERE session_id = ? AND idx >= ? AND idx < ? ORDER BY idx",
+                                (self.session_id, start, stop))
+        return [json.loads(row[0], object_hook=self.object_hook) for row in rows]
+
+    def __len__(self):
+        if self._count is None:
+            self._count = self.store.query("SELECT COUNT(*) FROM messages WHERE session_id = ?", (self.session_id,))[0][0]
+        return self._count
+
+def copy_json(value):
+    return None if value is None else json.loads(json.dumps(value))
+
+class MemorySessionStore(SessionStore):
+    """Sessions kept in memory (for tests) - saved as they would be to disk, encoded, but never written."""
+
+    def __init__(self):
+        self.sessions = {}  # session id -> {"manifest", "snapshot", "changes", "messages", "updated"}
+
+    def session(self, session_id: str, touch: bool = True):
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = {"manifest": None, "snapshot": None, "changes": [], "messages": [], "updated": time()}
+            self.sessions[session_id] = session
+        if touch: session["updated"] = time()
+        return session
+
+    def exists(self, session_id: str):
+        return session_id in self.sessions
+
+    def read_manifest(self, session_id: str):
+        return copy_json(self.sessions[session_id]["manifest"]) if session_id in self.sessions else None
+
+    def write_manifest(self, session_id: str, manifest: dict):
+        self.session(session_id, touch=False)["manifest"] = copy_json(manifest)
+
+    def item_journal(self, session_id: str, encoder = None, object_hook = None):
+        return MemoryItemJournal(self, session_id, encoder, object_hook)
+
+    def message_log(self, session_id: str, encoder = None, object_hook = None):
+        return MemoryMessageLog(self, session_id, encoder, object_hook)
+
+    def delete_session(self, session_id: str):
+        self.sessions.pop(session_id, None)
+
+    def session_ids(self):
+        return sorted(self.sessions.keys())
+
+    def recent_sessions(self, count: int = None):
+        recent = sorted(self.sessions, key=lambda session_id: -self.sessions[session_id]["updated"])
+        return recent if count is None else recent[:count]
+
+class MemoryItemJournal(ItemJournal):
+
+    def __init__(self, store: MemorySessionStore, session_id: str, encoder = None, object_hook = None, compact_after: int = 1000):
+        super().__init__(None, encoder, object_hook, compact_after)
+        self.store = store
+        self.session_id = session_id
+
+    def exists(self):
+        return self.store.exists(self.session_id)
+
+    def write(self, lines: list):
+        self.store.session(self.session_id)["changes"].extend(lines)
+        self.records += len(lines)
+
+    def load(self):
+        session = self.store.sessions.get(self.session_id)
+        if session is None: return {}
+        items = json.loads(session["snapshot"], object_hook=self.object_hook) if session["snapshot"] is not None else {}
+        for line in session["changes"]:
+            op, key, value = json.loads(line, object_hook=self.object_hook)
+            apply_change(items, op, key, value)
+        self.records = len(session["changes"])
+        return items
+
+    def write_snapshot(self, text: str):
+        session = self.store.session(self.session_id)
+        session["snapshot"], session["changes"] = text, []
+        self.records = 0
+
+class MemoryMessageLog(MessageLog):
+
+    def __init__(self, store: MemorySessionStore, session_id: str, encoder = None, object_hook = None):
+        super().__init__(None, encoder, object_hook)
+        self.store = store
+        self.session_id = session_id
+
+    def _lines(self):
+        session = self.store.sessions.get(self.session_id)
+        return session["messages"] if session is not None else []
+
+    def exists(self):
+        return len(self._lines()) > 0
+
+    def write(self, lines: list):
+        self.store.session(self.session_id)["messages"].extend(lines)
+
+    def read(self, start: int = 0, stop: int = None):
+        return [json.loads(line, object_hook=self.object_hook) for line in self._lines()[start:stop]]
+
+    def __len__(self):
+        return len(self._lines())
+
+def copy_session(source: SessionStore, target: SessionStore, session_id: str):
+    """
+    Copies a saved session from one store to another, replacing the target's copy of it (so copying
+    again doesn't add its messages twice). Items and messages are copied as the JSON they were saved
+    as - decoded without an object hook (not into message objects) and encoded again.
+    """
+    if source is target: raise ValueError("can't copy a session onto itself")
+    target.delete_session(session_id)
+    target.write_manifest(session_id, source.read_manifest(session_id))
+    items = source.item_journal(session_id).load()
+    target.item_journal(session_id).compact(items)
+    log = source.message_log(session_id)
+    messages = source.legacy_messages(session_id) + log.read()
+    target_log = target.message_log(session_id)
+    if len(messages) > 0: target_log.write([target_log.encode(message) for message in messages])
+    return len(messages)
+
+def migrate_session(session_path: str):
+    """
+    Moves an older session directory to the current layout: its message files into the message log
+    (before any messages already logged) and its item files into the item snapshot.
+    Returns the number of message files migrated.
+    """
+    directory = os.path.join(session_path, "messages")
+    files = legacy_message_files(directory)
+    if len(files) > 0:
+        log = MessageLog(directory)
+        temp = log.log_path + ".tmp"
+        with open(temp, "wb") as out:
+            for filename in files:
+                with open(os.path.join(directory, filename), "r") as f:
+                    message = json.load(f)
+                out.write((json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8"))
+            if log.exists():
+                with open(log.log_path, "rb") as f:
+                    out.write(f.read())
+        os.replace(temp, log.log_path)
+        if os.path.exists(log.index_path): os.remove(log.index_path)
+        for filename in files: os.remove(os.path.join(directory, filename))
+
+    journal = ItemJournal(os.path.join(session_path, "items"))
+    if len(journal._item_files()) > 0: journal.compact(journal.load())
+    return len(files)
+
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="migrate-sessions", description="Moves saved sessions to the message log and item journal layout.")
+    parser.add_argument("sessions", nargs="?", help="sessions directory (default: memory/sessions of the project)")
+    parser.add_argument("--sqlite", help="also copy the sessions into this SQLite database")
+    args = parser.parse_args(argv)
+
+    sessions = args.sessions
+    if sessions is None: sessions = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "memory", "sessions"))
+    source = FileSessionStore(sessions)
+    target = SqliteSessionStore(args.sqlite) if args.sqlite is not None else None
+    migrated = 0
+    for session_id in source.session_ids():
+        count = migrate_session(source.session_path(session_id))
+        if count > 0: print("migrated", count, "messages of", session_id)
+        if target is not None and os.path.exists(os.path.join(source.session_path(session_id), "manifest.json")):
+            copy_session(source, target, session_id)
+        migrated += 1
+    print("checked", migrated, "sessions in", sessions)
+    if target is not None:
+        print("copied", len(target.session_ids()), "sessions into", args.sqlite)
+        target.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+
+import thoughts
+from thoughts import unification
+
+# bump when the layout of the snapshot (or of the index it holds) changes
+SNAPSHOT_VERSION = 1
+MAGIC = b"THOUGHTS-RULES\n"
+PICKLE_PROTOCOL = 4
+
+class RulesSnapshot:
+    """
+    A precompiled rule base: the rulesets, their rule index and the compiled #when string patterns.
+
+    The file holds a small JSON header (version and the size and modification time of each source
+    rules file) followed by the pickled rules. Opening a snapshot memory-maps the file and reads only
+    the header; the rules are unpickled by load, straight from the mapped file.
+    """
+
+    def __init__(self, path: str, header: dict, mapped: mmap.mmap, body_offset: int):
+        self.path = path
+        self.header = header
+        self._mapped = mapped
+        self._body_offset = body_offset
+
+    @classmethod
+    def open(cls, path: str):
+        """Opens a snapshot, returns None if the file isn't a snapshot of this version (of the layout and of thoughts)."""
+        prefix = len(MAGIC) + 4
+        with open(path, "rb") as f:
+            # (an empty file can't be mapped)
+            if os.fstat(f.fileno()).st_size < prefix: return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if mapped[:len(MAGIC)] != MAGIC: header = None
+            else:
+                header_size = struct.unpack(">I", mapped[len(MAGIC):prefix])[0]
+                header = json.loads(mapped[prefix:prefix + header_size].decode("utf-8"))
+        except (ValueError, struct.error, UnicodeDecodeError):
+            header = None  # cut short or not a snapshot (json's errors are ValueErrors)
+        # the pickled index and patterns are only readable by the thoughts version that wrote them
+        if type(header) is not dict or header.get("version") != SNAPSHOT_VERSION or header.get("thoughts") != thoughts.__version__:
+            mapped.close()
+            return None
+        return cls(path, header, mapped, prefix + header_size)
+
+    @property
+    def sources(self):
+        return [source["path"] for source in self.header["sources"]]
+
+    def is_stale(self):
+        """True if any of the rules files the snapshot was compiled from has changed (or is gone)."""
+        for source in self.header["sources"]:
+            try: stat = os.stat(source["path"])
+            except OSError: return True
+            if stat.st_size != source["size"] or stat.st_mtime_ns != source["mtime"]: return True
+        return False
+
+    def load(self):
+        """Unpickles the rules, index and patterns, and releases the file."""
+        with memoryview(self._mapped) as view:
+            data = pickle.loads(view[self._body_offset:])
+        self.close()
+        unification.preload_patterns(data["patterns"])
+        return data
+
+    def close(self):
+        if self._mapped is not None and not self._mapped.closed: self._mapped.close()
+
+def when_strings(term, strings: set):
+    # collects the string patterns used in a #when portion
+    if type(term) is str: strings.add(term)
+    elif type(term) is dict:
+        for value in term.values(): when_strings(value, strings)
+    elif type(term) is list:
+        for value in term: when_strings(value, strings)
+    return strings
+
+def compile_rules(files: list, output: str, names: list = None):
+    """
+    Loads the rules files into a fresh engine and writes its rule base to a snapshot.
+    Each ruleset is named after its file (without the extension) unless names are given.
+    """
+
+    # imported here, the engine imports this module
+    from thoughts.rules_engine import RulesEngine
+
+    engine = RulesEngine()
+    sources = []
+    for file_idx, file in enumerate(files):
+        file = os.path.abspath(file)
+        name = names[file_idx] if names is not None else os.path.splitext(os.path.basename(file))[0]
+        stat = os.stat(file)
+        engine.load_rules_from_file(file, name)
+        sources.append({"path": file, "name": name, "size": stat.st_size, "mtime": stat.st_mtime_ns})
+
+    context = engine.context
+    rulesets = context.rulesets
+
+    strings = set()
+    for ruleset in rulesets:
+        for rule in ruleset["rules"]:
+            if type(rule) is dict and "#when" in rule: when_strings(rule["#when"], strings)
+    patterns = {text: unification.CompiledPattern(text) for text in strings}
+
+    data = {
+        "rulesets": rulesets,
+        "index": context.index,
+        "ruleset_keys": [context._ruleset_key(ruleset) for ruleset in rulesets],
+        "next_ruleset_key": context._next_ruleset_key,
+        "patterns": patterns,
+    }
+    header = {"version": SNAPSHOT_VERSION, "thoughts": thoughts.__version__, "sources": sources}
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    body = pickle.dumps(data, protocol=PICKLE_PROTOCOL)
+
+    # write next to the target and rename, so a running engine never maps a partial file
+    temp = output + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack(">I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(body)
+    os.replace(temp, output)
+
+    return header
+
+def main(argv = None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="compile-rules", description="Compiles rules files into a snapshot for fast engine startup.")
+    parser.add_argument("files", nargs="+", help="rules (.json) files")
+    parser.add_argument("-o", "--output", required=True, help="snapshot file to write")
+    args = parser.parse_args(argv)
+
+    header = compile_rules(args.files, args.output)
+    print("compiled", len(header["sources"]), "rules files into", args.output)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import copy
+
+from thoughts import unification
+
+class TemplatePlan:
+    """
+    A rule's term (its #then, or a #when constituent) prepared once for applying values to.
+    Strings are kept as substitution plans, and subtrees with nothing to substitute (no "?" or "$")
+    are marked static - applying values shares them with the rule instead of rebuilding them.
+    The static "with" set of a #replace is marked shared: it is never copied (the command only
+    reads it), so what it compiles the set into can be kept with the plan.
+    """
+
+    __slots__ = ("term", "kind", "parts", "compiled")
+
+    STATIC, STRING, DICT, LIST, COMBINE, SHARED = 0, 1, 2, 3, 4, 5
+
+    # keys whose (string) values are substituted from bindings but never looked up as items
+    TARGET_KEYS = ("#into", "#append", "#push")
+
+    def __init__(self, term):
+        self.term = term
+        self.kind = TemplatePlan.STATIC
+        self.parts = None
+        self.compiled = None  # (shared) what a command compiled the term into
+
+        if type(term) is str:
+            if "?" in term or "$" in term or term.startswith("#\\"):
+                self.kind = TemplatePlan.STRING
+                self.parts = unification.compile_substitution(term)
+
+        elif type(term) is dict:
+            if "#combine" in term:
+                self.kind = TemplatePlan.COMBINE
+                self.parts = tuple(TemplatePlan(item) for item in term["#combine"])
+                return
+            parts = []
+            for key, value in term.items():
+                if key in TemplatePlan.TARGET_KEYS: plan = TemplatePlan(value) if type(value) is str else None
+                else: plan = TemplatePlan(value)
+                if key == "with" and "#replace" in term and type(value) is dict and plan.kind == TemplatePlan.STATIC:
+                    plan.kind = TemplatePlan.SHARED
+                parts.append((key, key in TemplatePlan.TARGET_KEYS, plan))
+            if any(plan is not None and plan.kind != TemplatePlan.STATIC for _, _, plan in parts):
+                self.kind = TemplatePlan.DICT
+                self.parts = tuple(parts)
+
+        elif type(term) is list:
+            parts = tuple(TemplatePlan(item) for item in term)
+            if any(plan.kind != TemplatePlan.STATIC for plan in parts):
+                self.kind = TemplatePlan.LIST
+                self.parts = parts
+
+    def apply(self, provider, context, copy_static: bool = False):
+        """
+        Applies variable bindings (a dict provider) or the context's items to the term.
+        Static subtrees are returned as they are - callers must not change them - unless copy_static
+        is set (for results that leave the engine).
+        """
+        kind = self.kind
+        if kind == TemplatePlan.SHARED: return self.term
+        if kind == TemplatePlan.STATIC:
+            if copy_static and (type(self.term) is dict or type(self.term) is list): return copy.deepcopy(self.term)
+            return self.term
+
+        if kind == TemplatePlan.STRING:
+            if type(provider) is dict: return unification.substitute(self.parts, provider, ())
+            return context.retrieve(self.term)
+
+        if kind == TemplatePlan.LIST:
+            return [plan.apply(provider, context, copy_static) for plan in self.parts]
+
+        if kind == TemplatePlan.COMBINE:
+            combined = {}
+            for plan in self.parts: combined = {**plan.apply(provider, context, copy_static), **combined}
+            return combined
+
+        result = {}
+        for key, is_target, plan in self.parts:
+            if not is_target: result[key] = plan.apply(provider, context, copy_static)
+            else:
+                value = self.term[key]
+                if plan is not None and plan.kind != TemplatePlan.STATIC and type(provider) is dict:
+                    substituted = unification.substitute(plan.parts, provider, ())
+                    if substituted is not None: value = substituted
+                elif copy_static and (type(value) is dict or type(value) is list): value = copy.deepcopy(value)
+                result[key] = value
+        return result
+
+    def shared_plans(self):
+        """Returns the plans of the shared subtrees of the term."""
+        if self.kind == TemplatePlan.SHARED: return [self]
+        if self.kind == TemplatePlan.DICT: plans = [plan for _, _, plan in self.parts if plan is not None]
+        elif self.kind == TemplatePlan.LIST or self.kind == TemplatePlan.COMBINE: plans = self.parts
+        else: return []
+        return [shared for plan in plans for shared in plan.shared_plans()]
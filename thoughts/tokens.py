@@ -0,0 +1,104 @@
+from array import array
+import copy
+
+class Vocabulary:
+    """Interns token strings as integer ids, shared by the token streams of a context."""
+
+    def __init__(self):
+        self.ids = {}     # token -> id
+        self.tokens = []  # id -> token
+
+    def intern(self, token: str):
+        token_id = self.ids.get(token)
+        if token_id is None:
+            token_id = len(self.tokens)
+            self.ids[token] = token_id
+            self.tokens.append(token)
+        return token_id
+
+    def __len__(self):
+        return len(self.tokens)
+
+class TokenStream:
+    """
+    The facts of a #tokenize command, kept as parallel arrays (token ids, start and end positions)
+    instead of a dict per token.
+
+    The stream reads like the list of token facts it replaces - each fact is built when it is read.
+    The agenda builds them one at a time as it reaches them (see nodes), and only keeps the facts
+    it drew conclusions from, as the nodes of the assertion tree. The engine turns the stream back
+    into a list (to_list) before it returns the tree.
+    """
+
+    __slots__ = ("vocabulary", "ids", "starts", "ends", "template", "apply_values", "_kept", "_bare")
+
+    def __init__(self, vocabulary: Vocabulary, template = None, apply_values = None):
+        self.vocabulary = vocabulary
+        self.ids = array("l")
+        self.starts = array("l")
+        self.ends = array("l")
+        self.template = template          # the command's "assert" term, "#" is replaced by the token
+        self.apply_values = apply_values  # applies {"#": token} to the template
+        self._kept = {}                   # idx -> fact kept in the assertion tree
+        self._bare = {}                   # idx -> None or [] for the facts processed without conclusions
+
+    def append(self, token: str, start: int, end: int):
+        self.ids.append(self.vocabulary.intern(token))
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def token(self, idx: int):
+        return self.vocabulary.tokens[self.ids[idx]]
+
+    def fact(self, idx: int):
+        """Builds the fact for the token at idx (the kept one, if the agenda kept it)."""
+        kept = self._kept.get(idx)
+        if kept is not None: return kept
+
+        token = self.token(idx)
+        fact = self.apply_values(self.template, {"#": token}) if self.template is not None else token
+        if type(fact) is not dict and type(fact) is not list: fact = {"#assert": fact}
+
+        # add position information
+        fact["#seq-start"] = self.starts[idx]
+        fact["#seq-end"] = self.ends[idx]
+        if idx in self._bare: fact["#conclusions"] = None if self._bare[idx] is None else []
+        return fact
+
+    def nodes(self, keep: bool = True):
+        """Yields the facts in order, keeping (with keep) the ones conclusions were drawn from."""
+        for idx in range(len(self.ids)):
+            fact = self.fact(idx)
+            yield fact
+            if not keep or type(fact) is not dict or "#conclusions" not in fact: continue
+            conclusions = fact["#conclusions"]
+            if conclusions is None: self._bare[idx] = None
+            elif type(conclusions) is list and len(conclusions) == 0: self._bare[idx] = []
+            else: self._kept[idx] = fact
+
+    def to_list(self):
+        """The facts as a list (as #tokenize returned them before the stream)."""
+        return [self.fact(idx) for idx in range(len(self.ids))]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, idx):
+        if type(idx) is slice: return [self.fact(i) for i in range(*idx.indices(len(self.ids)))]
+        if idx < 0: idx += len(self.ids)
+        if idx < 0 or idx >= len(self.ids): raise IndexError("token index out of range")
+        return self.fact(idx)
+
+    def __iter__(self):
+        for idx in range(len(self.ids)): yield self.fact(idx)
+
+    def __deepcopy__(self, memo):
+        # the vocabulary and template are shared, not copied
+        copied = TokenStream(self.vocabulary, self.template, self.apply_values)
+        copied.ids, copied.starts, copied.ends = array("l", self.ids), array("l", self.starts), array("l", self.ends)
+        copied._kept = copy.deepcopy(self._kept, memo)
+        copied._bare = dict(self._bare)
+        return copied
+
+    def __repr__(self):
+        return repr(list(self))
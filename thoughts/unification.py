@@ -1,3 +1,7 @@
+import re
+import copy
+from collections import OrderedDict
+
 def unify(term1, term2):
 
     if (term1 is None and term2 is None): return {}
@@ -242,18 +246,355 @@ def remove_class_designation(term):
 
 def retrieve(term, unification):
     # substitute unification into the then part
-    if str(term).startswith("#\\"):
-        pass
-    elif (term.startswith("?")) and (" " not in term):
-        if term in unification:
-            return unification[term]
-        else:
-            return term
+    return substitute(compile_substitution(term), unification)
+
+# a variable slot in a template string - "?" and the run of characters up to the next space or "?"
+_SLOT = re.compile(r"\?[^\s?]+")
+# the part of a slot that is the variable name, without any class designation or trailing punctuation
+_NAME = re.compile(r"\?[\w#\-]+")
+
+class SubstitutionPlan:
+    """
+    A template string prepared once for substituting variable bindings into - the literal
+    segments and the variable slots between them, so applying bindings is a single join.
+    Each slot is the whole variable ("?xy" is never treated as "?x" followed by "y"); a slot
+    such as "?x:noun" or "?x," falls back to the bare variable name when only that is bound.
+    """
+
+    __slots__ = ("text", "is_escaped", "is_variable", "segments", "slots", "tokens", "paths")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.is_escaped = text.startswith("#\\")
+        self.is_variable = text.startswith("?") and " " not in text
+
+        segments, slots, pos = [], [], 0
+        for found in _SLOT.finditer(text):
+            segments.append(text[pos:found.start()])
+            slot = found.group()
+            name = _NAME.match(slot)
+            bare = name.group() if name is not None and name.end() < len(slot) else None
+            slots.append((slot, bare, slot[name.end():] if bare is not None else ""))
+            pos = found.end()
+        segments.append(text[pos:])
+        self.segments = tuple(segments)
+        self.slots = tuple(slots)
+
+        # for item lookups - the tokens, with the dotted path of each "?" or "$" token
+        self.tokens = None
+        self.paths = None
+        if "$" in text or "?" in text:
+            self.tokens = tuple(tokenize(text))
+            self.paths = tuple(tuple(token.split(".")) if token.startswith("?") or token.startswith("$") else None
+                for token in self.tokens)
+
+_substitutions = {}
+
+def compile_substitution(text: str):
+    """Returns the substitution plan for a template string, compiling it on first use."""
+    plan = _substitutions.get(text)
+    if plan is None:
+        if len(_substitutions) >= _MAX_COMPILED: _substitutions.clear()
+        plan = SubstitutionPlan(text)
+        _substitutions[text] = plan
+    return plan
+
+def substitute(plan: SubstitutionPlan, unification: dict, others: list = None):
+    """
+    Applies variable bindings to a compiled template string. A template that is a single variable
+    returns the bound value itself. Bindings not named like variables (e.g. "#") are replaced
+    as plain text - pass their keys as others when applying many templates with the same bindings.
+    """
+    if plan.is_escaped: return None
+    if plan.is_variable: return unification[plan.text] if plan.text in unification else plan.text
+
+    text = plan.text
+    if len(plan.slots) > 0:
+        parts = [plan.segments[0]]
+        for idx, (slot, bare, rest) in enumerate(plan.slots):
+            if slot in unification: parts.append(str(unification[slot]))
+            elif bare is not None and bare in unification:
+                parts.append(str(unification[bare]))
+                parts.append(rest)
+            else: parts.append(slot)
+            parts.append(plan.segments[idx + 1])
+        text = "".join(parts)
+
+    if others is None: others = [key for key in unification if not key.startswith("?")]
+    for key in others: text = text.replace(key, str(unification[key]))
+    return text
+
+class CompiledPattern:
+    """
+    A string term prepared once for unification - lowercased and tokenized, with the
+    positions of its variables and wildcards and its first literal token (used as a guard).
+    """
+
+    __slots__ = ("text", "raw_tokens", "tokens", "kinds", "variables", "wildcards", "guard", "is_variable", "is_open")
+
+    LITERAL, VARIABLE, WILDCARD = 0, 1, 2
+
+    def __init__(self, text: str):
+        self.text = str.lower(text)
+        self.raw_tokens = tuple(tokenize(self.text))
+        self.tokens = tuple(remove_class_designation(token) for token in self.raw_tokens)
+
+        kinds = []
+        for token in self.tokens:
+            if token.startswith("?"): kinds.append(CompiledPattern.VARIABLE)
+            elif token.startswith("*"): kinds.append(CompiledPattern.WILDCARD)
+            else: kinds.append(CompiledPattern.LITERAL)
+        self.kinds = tuple(kinds)
+        self.variables = tuple(pos for pos, kind in enumerate(kinds) if kind == CompiledPattern.VARIABLE)
+        self.wildcards = tuple(pos for pos, kind in enumerate(kinds) if kind == CompiledPattern.WILDCARD)
+
+        self.guard = self.tokens[0] if kinds[0] == CompiledPattern.LITERAL else None
+        self.is_variable = self.text.startswith("?") and " " not in self.text
+        self.is_open = "?" in self.text or "*" in self.text
+
+_compiled = {}
+_MAX_COMPILED = 50000
+
+def compile_pattern(text: str):
+    """Returns the compiled form of a string term, compiling it on first use."""
+    compiled = _compiled.get(text)
+    if compiled is None:
+        if len(_compiled) >= _MAX_COMPILED: _compiled.clear()
+        compiled = CompiledPattern(text)
+        _compiled[text] = compiled
+    return compiled
+
+def match(pattern, term):
+    """
+    Unifies a term against a pattern - the same result as unify(term, pattern),
+    but string terms are only lowercased and tokenized once (see compile_pattern).
+    """
+
+    if (term is None and pattern is None): return {}
+    if (term is None or pattern is None): return None
+
+    pattern_type = type(pattern)
+    term_type = type(term)
+
+    if pattern_type is CompiledPattern or term_type is CompiledPattern:
+        return _match_strings(pattern, term)
+
+    if pattern_type is str or term_type is str:
+        return _match_strings(compile_pattern(pattern) if pattern_type is str else pattern,
+                              compile_pattern(term) if term_type is str else term)
+
+    if pattern_type is dict and term_type is dict:
+
+        # same as unify - the term may contain more properties than the pattern
+        result = {}
+        for prop in pattern.keys():
+
+            # ignore #seq (positional) information, as it is injected by the engine at runtime
+            if prop == "#seq-start" or prop == "#seq-end" or prop == "#seq" or prop == "#seq-idx": continue
+
+            # escaped #seq properties
+            prop1 = prop
+            if prop == "##seq-start": prop1 = "#seq-start"
+            elif prop == "##seq-end": prop1 = "#seq-end"
+            elif prop == "##seq-idx": prop1 = "#seq-idx"
+
+            if prop1 not in term: return None
+            sub_result = match(pattern[prop], term[prop1])
+            if sub_result is None: return None
+            if len(sub_result) > 0: result = {**result, **sub_result}
+
+        return result
+
+    if term == pattern: return {}
+    return None
+
+def _match_strings(pattern, term):
+
+    compiled_pattern = pattern if type(pattern) is CompiledPattern else None
+    compiled_term = term if type(term) is CompiledPattern else None
+
+    # quick check - if equal then return
+    if compiled_pattern is not None and compiled_term is not None:
+        if compiled_pattern.text == compiled_term.text: return {}
+
+    pattern_value = compiled_pattern.text if compiled_pattern is not None else pattern
+    term_value = compiled_term.text if compiled_term is not None else term
+
+    # if the term is a standalone variable then just unify it with the pattern
+    if compiled_term is not None:
+        if compiled_term.is_variable: return {compiled_term.text: pattern_value}
+    else:
+        term_text = str(term)
+        if term_text.startswith("?") and " " not in term_text: return {term_text: pattern_value}
+
+    # if the pattern is a standalone variable then just unify it with the term
+    if compiled_pattern is not None:
+        if compiled_pattern.is_variable: return {compiled_pattern.text: term_value}
     else:
-        for key in unification.keys():
-            # new_val = str(unification[key])
-            new_val = str(unification[key])    
-            term = term.replace(key, new_val)
-            # else:
-            #     term = new_val
-        return term
+        pattern_text = str(pattern)
+        if pattern_text.startswith("?") and " " not in pattern_text: return {pattern_text: term_value}
+        return unify_strings(term_value, pattern_text)
+
+    if compiled_term is None: return None # only strings unify with strings
+
+    return _match_tokens(compiled_pattern, compiled_term)
+
+def _match_tokens(pattern: CompiledPattern, term: CompiledPattern):
+
+    # empty strings - defer to unify_strings for identical behavior
+    if len(pattern.text) == 0 or len(term.text) == 0: return unify_strings(term.text, pattern.text)
+
+    if not pattern.is_open and not term.is_open and term.text[0] != pattern.text[0]: return None
+
+    # first literal tokens must be the same
+    if pattern.guard is not None and term.guard is not None and pattern.guard != term.guard: return None
+
+    # same walk as unify_strings, over the precomputed tokens
+    a1, a2 = term.raw_tokens, pattern.raw_tokens
+    t1, t2 = term.tokens, pattern.tokens
+    k1, k2 = term.kinds, pattern.kinds
+    len1, len2 = len(a1), len(a2)
+
+    VARIABLE, WILDCARD = CompiledPattern.VARIABLE, CompiledPattern.WILDCARD
+
+    result = {}
+    i1 = 0
+    i2 = 0
+    boundvalue = ""
+    loop = True
+
+    while (loop):
+
+        w1 = t1[i1]
+        w2 = t2[i2]
+
+        if (w1 == w2):
+            i1 = i1+1
+            i2 = i2+1
+
+        else:
+
+            kind1 = k1[i1]
+            kind2 = k2[i2]
+
+            n1 = a1[i1 + 1] if i1 + 1 < len1 else ""
+            n2 = a2[i2 + 1] if i2 + 1 < len2 else ""
+
+            if kind2 == WILDCARD:
+                if (w1 == n2): i2 = i2+1
+                else: i1 = i1+1
+
+            elif kind1 == WILDCARD:
+                if (w2 == n1): i1 = i1+1
+                else: i2 = i2+1
+
+            elif kind2 == VARIABLE and kind1 != VARIABLE:
+                boundvalue = boundvalue + " " + w1
+                if (n1 == n2 or n2.startswith("?")):
+                    result[w2] = boundvalue.strip()
+                    boundvalue = ""
+                    i2 = i2+1
+                i1 = i1+1
+
+            elif kind1 == VARIABLE and kind2 != VARIABLE:
+                boundvalue = boundvalue + " " + w2
+                if (n1 == n2 or n1.startswith("?")):
+                    result[w1] = boundvalue.strip()
+                    boundvalue = ""
+                    i1 = i1+1
+                i2 = i2+1
+
+            else:
+                loop = False
+
+        # if at the end of the term and we're sitting on a wildcard in the pattern, advance the pattern
+        if (i1 == len1):
+            if (i2 < len2) and k2[i2] == WILDCARD:
+                i2 = i2+1
+
+        if (i1 == len1): loop = False
+        if (i2 == len2): loop = False
+
+    if (i1 != len1 or i2 != len2):
+        if ((i1 + 1 == len1) and (a1[i1] == "*")):
+            pass
+        else:
+            result = None
+
+    return result
+
+def preload_patterns(patterns: dict):
+    """Adds patterns compiled ahead of time (text -> CompiledPattern) to the cache."""
+    for text, compiled in patterns.items():
+        if len(_compiled) >= _MAX_COMPILED: return
+        _compiled.setdefault(text, compiled)
+
+_MISSING = ("#missing",)
+
+def _freeze(value):
+    # a hashable structural form of a term
+    value_type = type(value)
+    if value_type is str: return value
+    if value_type is dict: return ("{", tuple((key, _freeze(item)) for key, item in value.items()))
+    if value_type is list: return ("[", tuple(_freeze(item) for item in value))
+    if value is None or value_type is int or value_type is float or value_type is bool: return (value_type.__name__, value)
+    raise TypeError("term can't be cached")
+
+def _match_key(pattern, term):
+    # the parts of (pattern, term) a match depends on - for dicts, only the term's properties the pattern tests
+    if type(pattern) is dict and type(term) is dict:
+        parts = []
+        for prop in pattern.keys():
+            if prop == "#seq-start" or prop == "#seq-end" or prop == "#seq" or prop == "#seq-idx": continue
+            prop1 = prop
+            if prop == "##seq-start": prop1 = "#seq-start"
+            elif prop == "##seq-end": prop1 = "#seq-end"
+            elif prop == "##seq-idx": prop1 = "#seq-idx"
+            parts.append((prop, _match_key(pattern[prop], term[prop1]) if prop1 in term else _MISSING))
+        return ("{}", tuple(parts))
+    return (_freeze(pattern), _freeze(term))
+
+class UnificationCache:
+    """
+    An LRU cache of match results, keyed by the structure of the pattern and term (for dicts, only
+    the properties the pattern tests, so differing positions don't miss). Each call gets a fresh
+    result dict, with bound dicts and lists copied, so callers can't change what is cached.
+    """
+
+    def __init__(self, size: int = 10000):
+        if size < 1: raise ValueError("size must be at least 1")
+        self.size = size
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def match(self, pattern, term):
+        try: key = _match_key(pattern, term)
+        except TypeError: return match(pattern, term) # e.g. precompiled terms
+
+        results = self.results
+        if key in results:
+            self.hits += 1
+            results.move_to_end(key)
+            result = results[key]
+        else:
+            self.misses += 1
+            result = match(pattern, term)
+            results[key] = result
+            if len(results) > self.size:
+                results.popitem(last=False)
+                self.evictions += 1
+
+        if result is None: return None
+        return {name: copy.deepcopy(value) if type(value) is dict or type(value) is list else value
+                for name, value in result.items()}
+
+    def clear(self):
+        self.results.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self.results), "max_size": self.size, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups > 0 else 0.0}
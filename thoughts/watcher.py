@@ -0,0 +1,59 @@
+import os
+import threading
+from thoughts.log import WARNING
+
+class RulesWatcher:
+    """
+    Polls the files the engine's rulesets were loaded from, and reloads a file's ruleset
+    (by diffing its rules) when the file changes. A file that fails to load, e.g. while
+    it is still being edited, is tried again when it next changes.
+    """
+
+    def __init__(self, engine, interval: float = 1.0):
+        self.engine = engine
+        self.interval = interval
+        self._mtimes = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._snapshot()
+
+    def _paths(self):
+        return [ruleset["path"] for ruleset in self.engine.context.rulesets
+                if "path" in ruleset and ruleset["path"] is not None]
+
+    def _mtime(self, path):
+        try: return os.stat(path).st_mtime_ns
+        except OSError: return None
+
+    def _snapshot(self):
+        for path in self._paths(): self._mtimes[path] = self._mtime(path)
+
+    def check(self):
+        """Reloads the rules files changed since the last check. Returns the paths reloaded."""
+        reloaded = []
+        for path in self._paths():
+            mtime = self._mtime(path)
+            if mtime is None or mtime == self._mtimes.get(path): continue
+            self._mtimes[path] = mtime
+            try:
+                self.engine.reload_rules_from_file(path)
+                reloaded.append(path)
+            except Exception as e:
+                self.engine.context.log_message("RELOAD FAILED:\t%s %s", path, e, level=WARNING)
+        return reloaded
+
+    def start(self):
+        if self._thread is not None: return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rules-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None: return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()